@@ -0,0 +1,119 @@
+"""
+Constant-product automated market maker for fractional collectibles
+Each pooled collectible has a token reserve and a unit reserve whose product
+only grows (by the fee) across swaps. Quotes are computed from the reserves
+held in memory; swaps execute in the amm_swap() stored procedure, which
+repeats the same arithmetic under a row lock and returns the new reserves.
+
+Amounts are Decimals quantized like the database columns: tokens to cents,
+units to 6 places, always rounded in the pool's favour.
+"""
+from decimal import Decimal, ROUND_DOWN
+from typing import Any, Dict, Iterable, Optional
+import os
+
+AMM_FEE_BPS = int(os.getenv("AMM_FEE_BPS", "30"))
+
+BUY = "buy"
+SELL = "sell"
+
+TOKEN_QUANTUM = Decimal("0.01")
+UNIT_QUANTUM = Decimal("0.000001")
+
+def swap_output(amount_in: Decimal, reserve_in: Decimal, reserve_out: Decimal,
+                fee_bps: int, quantum: Decimal) -> Decimal:
+    """Amount out of a constant-product pool for amount_in, after the fee"""
+    amount_in_after_fee = amount_in * (10000 - fee_bps) / 10000
+    amount_out = reserve_out * amount_in_after_fee / (reserve_in + amount_in_after_fee)
+    return amount_out.quantize(quantum, rounding=ROUND_DOWN)
+
+class Pool:
+    """Reserves of one collectible's token/unit pool"""
+    __slots__ = ("collectible_id", "token_reserve", "unit_reserve", "fee_bps")
+    
+    def __init__(self, collectible_id: str, token_reserve: Decimal, unit_reserve: Decimal,
+                 fee_bps: int = AMM_FEE_BPS):
+        self.collectible_id = collectible_id
+        self.token_reserve = token_reserve
+        self.unit_reserve = unit_reserve
+        self.fee_bps = fee_bps
+    
+    def spot_price(self) -> Decimal:
+        """Tokens per unit at the margin"""
+        return self.token_reserve / self.unit_reserve
+    
+    def quote(self, side: str, amount_in: Decimal) -> Dict[str, Any]:
+        """Buy: tokens in, units out. Sell: units in, tokens out."""
+        if side == BUY:
+            amount_in = amount_in.quantize(TOKEN_QUANTUM, rounding=ROUND_DOWN)
+            reserve_in, reserve_out, quantum = self.token_reserve, self.unit_reserve, UNIT_QUANTUM
+        elif side == SELL:
+            amount_in = amount_in.quantize(UNIT_QUANTUM, rounding=ROUND_DOWN)
+            reserve_in, reserve_out, quantum = self.unit_reserve, self.token_reserve, TOKEN_QUANTUM
+        else:
+            raise ValueError("side must be 'buy' or 'sell'")
+        if amount_in <= 0:
+            raise ValueError("Amount must be positive")
+        
+        amount_out = swap_output(amount_in, reserve_in, reserve_out, self.fee_bps, quantum)
+        if amount_out <= 0:
+            raise ValueError("Amount too small for this pool")
+        
+        if side == BUY:
+            tokens, units = amount_in, amount_out
+            token_after, unit_after = self.token_reserve + tokens, self.unit_reserve - units
+        else:
+            tokens, units = amount_out, amount_in
+            token_after, unit_after = self.token_reserve - tokens, self.unit_reserve + units
+        spot_price = self.spot_price()
+        average_price = tokens / units
+        return {
+            "collectible_id": self.collectible_id,
+            "side": side,
+            "amount_in": float(amount_in),
+            "amount_out": float(amount_out),
+            "average_price": float(average_price),
+            "spot_price": float(spot_price),
+            "spot_price_after": float(token_after / unit_after),
+            "price_impact": float(abs(average_price - spot_price) / spot_price),
+            "fee_bps": self.fee_bps
+        }
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "collectible_id": self.collectible_id,
+            "token_reserve": float(self.token_reserve),
+            "unit_reserve": float(self.unit_reserve),
+            "fee_bps": self.fee_bps,
+            "spot_price": float(self.spot_price())
+        }
+
+class AutomatedMarketMaker:
+    """In-memory pool reserves, refreshed from the database after every write"""
+    
+    def __init__(self):
+        self.pools: Dict[str, Pool] = {}
+    
+    def load(self, rows: Iterable[Dict[str, Any]]):
+        """Replace pools with amm_pools rows"""
+        self.pools = {}
+        for row in rows:
+            self.update(row)
+    
+    def update(self, row: Dict[str, Any]):
+        """Store reserves returned by the database for one pool"""
+        pool = self.pools.get(row["collectible_id"])
+        token_reserve = Decimal(str(row["token_reserve"]))
+        unit_reserve = Decimal(str(row["unit_reserve"]))
+        if pool is None:
+            self.pools[row["collectible_id"]] = Pool(row["collectible_id"], token_reserve, unit_reserve,
+                                                     row.get("fee_bps", AMM_FEE_BPS))
+        else:
+            pool.token_reserve = token_reserve
+            pool.unit_reserve = unit_reserve
+    
+    def pool(self, collectible_id: str) -> Optional[Pool]:
+        return self.pools.get(collectible_id)
+
+# Global instance
+amm = AutomatedMarketMaker()
@@ -0,0 +1,164 @@
+"""
+Vectorized price analytics
+Moving averages, log returns, rolling volatility and drawdown over a
+collectible's cached PriceSeries. Every indicator is computed for the whole
+series with array operations (cumulative sums, accumulate, blocked EMA), so
+a million-point series takes milliseconds; responses then carry only the
+most recent points.
+
+Indicators are aligned with the price array. Points without enough history
+(the first window-1 for SMA and volatility, the first for returns) are NaN
+internally and null in responses. Volatility is the standard deviation of
+per-tick log returns, not annualized, since ticks are irregular.
+
+Charts get a downsampled series instead of every tick: largest-triangle-
+three-buckets (LTTB) keeps, per bucket, the point that forms the largest
+triangle with its neighbours, so spikes and troughs survive a 100x cut.
+"""
+from typing import Any, Dict, List, Optional
+import math
+import os
+
+import numpy as np
+
+from app.price_series import PriceSeries
+
+ANALYTICS_MAX_POINTS = int(os.getenv("ANALYTICS_MAX_POINTS", "5000"))
+
+# Largest 1/decay^k used inside one EMA block
+_EMA_MAX_SCALE_LOG = 100 * math.log(10)
+
+def sma(values: np.ndarray, window: int) -> np.ndarray:
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        sums = np.cumsum(np.concatenate(([0.0], values)))
+        out[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return out
+
+def ema(values: np.ndarray, window: int) -> np.ndarray:
+    """Exponential moving average with alpha = 2 / (window + 1), seeded with the first value
+    
+    Solves e[k] = decay * e[k-1] + alpha * x[k] in closed form per block:
+    e[k] = (decay * e[-1] + alpha * cumsum(x[j] / decay^j)) * decay^k. Blocks
+    are sized so 1/decay^k stays far from overflow.
+    """
+    out = np.empty(len(values))
+    if not len(values):
+        return out
+    alpha = 2 / (window + 1)
+    decay = 1 - alpha
+    if decay == 0:
+        out[:] = values
+        return out
+    block = max(1, int(_EMA_MAX_SCALE_LOG / -math.log(decay)))
+    scale = decay ** -np.arange(min(block, len(values)), dtype=np.float64)
+    previous = values[0]
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        powers = scale[:len(chunk)]
+        out[start:start + len(chunk)] = (decay * previous + alpha * np.cumsum(chunk * powers)) / powers
+        previous = out[start + len(chunk) - 1]
+    return out
+
+def log_returns(prices: np.ndarray) -> np.ndarray:
+    out = np.full(len(prices), np.nan)
+    if len(prices) > 1:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            logs = np.log(np.where(prices > 0, prices, np.nan))
+        out[1:] = np.diff(logs)
+    return out
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """Sample standard deviation over each trailing window (NaN inputs count as 0)"""
+    out = np.full(len(values), np.nan)
+    if window < 2 or len(values) < window:
+        return out
+    # Centering first keeps the sum-of-squares difference well conditioned
+    values = np.nan_to_num(values)
+    values = values - values.mean()
+    sums = np.cumsum(np.concatenate(([0.0], values)))
+    squares = np.cumsum(np.concatenate(([0.0], values * values)))
+    total = sums[window:] - sums[:-window]
+    variance = (squares[window:] - squares[:-window] - total * total / window) / (window - 1)
+    out[window - 1:] = np.sqrt(np.maximum(variance, 0))
+    return out
+
+def drawdown(prices: np.ndarray) -> np.ndarray:
+    """Fractional decline from the running peak (0 at a new high, and while the peak is 0)"""
+    if not len(prices):
+        return np.empty(0)
+    peak = np.maximum.accumulate(prices)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(peak > 0, prices / peak - 1, 0.0)
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of at most threshold points (first and last always kept) tracing the shape of y(x)"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n) if threshold >= n else np.array([0, n - 1][:threshold], dtype=np.int64)
+    # Buckets between the fixed first and last points; edges[i]:edges[i + 1] is bucket i
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    counts = np.diff(np.append(edges, n))
+    mean_x = np.add.reduceat(x, edges) / counts
+    mean_y = np.add.reduceat(y, edges) / counts
+    
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Twice the triangle area between the last pick, each candidate and the next bucket's mean
+        area = np.abs((x[a] - mean_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (mean_y[i + 1] - y[a]))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+def _to_list(values: np.ndarray) -> List[Any]:
+    return [None if value != value else value for value in values.tolist()]
+
+def _last(values: np.ndarray) -> Any:
+    return _to_list(values[-1:])[0] if len(values) else None
+
+def downsample(series: PriceSeries, collectible_id: str, max_points: int,
+               start: Optional[float] = None, end: Optional[float] = None) -> List[Dict[str, Any]]:
+    """At most max_points rows of [start, end] chosen by LTTB, newest first"""
+    if not 3 <= max_points <= ANALYTICS_MAX_POINTS:
+        raise ValueError(f"max_points must be between 3 and {ANALYTICS_MAX_POINTS}")
+    window = series.range(start, end)
+    selected = window.start + lttb(series.timestamps[window], series.prices[window], max_points)
+    return series.rows(collectible_id, selected[::-1])
+
+def price_analytics(series: PriceSeries, window: int = 20, points: int = 500) -> Dict[str, Any]:
+    """Indicators over the whole series; the newest points of each are returned"""
+    if window < 1:
+        raise ValueError("window must be at least 1")
+    if not 1 <= points <= ANALYTICS_MAX_POINTS:
+        raise ValueError(f"points must be between 1 and {ANALYTICS_MAX_POINTS}")
+    
+    timestamps, prices = series.timestamps, series.prices
+    returns = log_returns(prices)
+    indicators = {
+        "sma": sma(prices, window),
+        "ema": ema(prices, window),
+        "log_return": returns,
+        "volatility": rolling_std(returns, window),
+        "drawdown": drawdown(prices)
+    }
+    tail = slice(max(0, len(prices) - points), len(prices))
+    
+    return {
+        "count": len(prices),
+        "window": window,
+        "summary": {
+            "price": _last(prices),
+            **{name: _last(values) for name, values in indicators.items()},
+            "max_drawdown": float(indicators["drawdown"].min()) if len(prices) else None,
+            "total_log_return": float(np.nansum(returns)) if len(prices) else None
+        },
+        "series": {
+            "timestamp": timestamps[tail].tolist(),
+            "price": prices[tail].tolist(),
+            **{name: _to_list(values[tail]) for name, values in indicators.items()}
+        }
+    }
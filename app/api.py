@@ -10,16 +10,244 @@ from typing import List, Optional
 from app.db_service import DatabaseService
 from app.auth import extract_user_id_from_token
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, status, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
-from app.db_service import db_service
+from datetime import datetime, timezone
+from app.db_service import db_service, EXPORT_COLUMNS
+from app.idempotency import idempotency_store, IdempotencyKeyReused
+from app.sequencer import user_sequencer
+from app.matching_engine import matching_engine, TradeRecorder, to_ticks, LIMIT
+from app.market_journal import MarketJournal, MARKET_SNAPSHOT_INTERVAL_SECONDS
+from app.call_auction import CallAuction, AUCTION_COLLECTIBLE_IDS
+from app.market_feed import (
+    price_feed, depth_feed, Subscription, DepthSubscription,
+    MARKET_FEED_HEARTBEAT_SECONDS, MARKET_FEED_RETRY_MS
+)
+from app.trade_tape import trade_tape
+from app.amm import amm, AMM_FEE_BPS, BUY, TOKEN_QUANTUM, UNIT_QUANTUM
+from app.reservations import BalanceReservations, InsufficientFunds, HELD, UNIT_SCALE, to_cents, to_units
+from app.candles import CandleStore
+from app.price_series import PriceSeriesCache
+from app.price_archive import price_archive
+from app.analytics import price_analytics, downsample
+from decimal import Decimal, ROUND_DOWN
+import asyncio
+import csv
+import functools
+import io
+import json
 import jwt
+import random
+import uuid
 
 app = FastAPI(title="Token Market Backend", version="1.0.0")
 security = HTTPBearer()
 
+# Trades from the in-memory matching engine are settled in the background
+# and published to the price feed only once settled (see on_trade_settled)
+trade_recorder = TradeRecorder(lambda trade: db_service.record_trade(trade.to_dict()))
+matching_engine.add_trade_listener(trade_recorder)
+market_journal = MarketJournal()
+
+def _allocate_order_id() -> int:
+    """Auction orders share the matching engine's order id space"""
+    order_id = matching_engine.next_order_id
+    matching_engine.next_order_id += 1
+    return order_id
+
+def _allocate_trade_id() -> int:
+    """Auction fills share the matching engine's trade id space"""
+    trade_id = matching_engine.next_trade_id
+    matching_engine.next_trade_id += 1
+    return trade_id
+
+# Illiquid collectibles clear in periodic call auctions instead
+call_auction = CallAuction(_allocate_order_id, _allocate_trade_id, collectible_ids=AUCTION_COLLECTIBLE_IDS)
+auction_recorder = TradeRecorder(db_service.settle_auction, name="auction-settlement")
+call_auction.add_result_listener(auction_recorder)
+
+# Live prices and order book depth for WebSocket/SSE subscribers
+matching_engine.add_depth_listener(depth_feed.publish_depth)
+price_feed.add_listener(trade_tape.record)
+
+# OHLCV candles, backfilled per collectible on first request
+candle_store = CandleStore(db_service.get_price_candles)
+price_feed.add_listener(candle_store.record)
+
+# Whole price series as NumPy arrays for analytics
+price_series = PriceSeriesCache(db_service.iter_price_pages, price_archive)
+price_feed.add_listener(price_series.record)
+
+# Available vs reserved balance (and units) for open orders and pending redemptions
+reservations = BalanceReservations(db_service.get_balance_amount, db_service.apply_reservation_ops,
+                                   db_service.get_holding_units)
+matching_engine.add_trade_listener(reservations.on_trades)
+call_auction.add_result_listener(reservations.on_auctions)
+
+def on_trade_settled(trade, result):
+    if result.get("duplicate"):
+        # Replayed after a restart but already written: the loaded balances include it
+        reservations.failed(trade.trade_id)
+        return
+    reservations.settled(trade.trade_id)
+    price_feed.publish_trade(trade, result["recorded_at"])
+
+def on_trade_failed(trade, result):
+    """Reverse the fill in memory and pull what is left of both orders from the book"""
+    reservations.failed(trade.trade_id)
+    for order_id in (trade.buy_order_id, trade.sell_order_id):
+        if matching_engine.cancel(order_id) is not None:
+            reservations.release_order(order_id)
+
+def on_auction_settled(result, settlement):
+    """Credit settled fills, put skipped ones back, then publish the settled volume"""
+    skipped = {fill["trade_id"]: fill["reason"] for fill in settlement["skipped"]}
+    duplicates = set(settlement.get("duplicates", []))
+    for fill in result["fills"]:
+        if fill["trade_id"] in duplicates:
+            # Replayed after a restart but already written: the loaded balances include it
+            reservations.failed(fill["trade_id"])
+            continue
+        reason = skipped.get(fill["trade_id"])
+        if reason is None:
+            reservations.settled(fill["trade_id"])
+            continue
+        reservations.failed(fill["trade_id"])
+        # The side that could not pay or deliver loses its order; the other gets its quantity back
+        buy = (fill["buy_order_id"], fill["buyer_id"], "buy")
+        sell = (fill["sell_order_id"], fill["seller_id"], "sell")
+        defaulted, kept = (buy, sell) if reason == "insufficient_balance" else (sell, buy)
+        if call_auction.cancel(defaulted[0]) is not None:
+            reservations.release_order(defaulted[0])
+        order_id, user_id, side = kept
+        order = call_auction.restore(order_id, user_id, result["collectible_id"], side,
+                                     to_ticks(result["price"]), fill["quantity"])
+        reservations.commit_order(order, fill["quantity"])
+    if settlement["volume"]:
+        price_feed.publish_auction(result, settlement["volume"], settlement["recorded_at"])
+
+def on_auction_failed(result, settlement):
+    """Nothing was written: reverse every fill and pull what is left of its orders"""
+    for fill in result["fills"]:
+        reservations.failed(fill["trade_id"])
+        for order_id in (fill["buy_order_id"], fill["sell_order_id"]):
+            if call_auction.cancel(order_id) is not None:
+                reservations.release_order(order_id)
+
+trade_recorder.on_settled = on_trade_settled
+trade_recorder.on_failed = on_trade_failed
+auction_recorder.on_settled = on_auction_settled
+auction_recorder.on_failed = on_auction_failed
+
+async def load_reservations(user_id: str, collectible_id: Optional[str] = None):
+    """Make sure the user's balance (and position) is cached before a synchronous check"""
+    try:
+        await reservations.load(user_id, collectible_id)
+    except InsufficientFunds as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+async def run_reserved(user_id: str, debits: dict, credits: list, changes, func, **kwargs) -> dict:
+    """Run a debiting stored procedure with its debits reserved
+    
+    changes(result) maps the accounts of debits and credits to what a
+    successful result moved; a rejected or failed call reloads them instead.
+    """
+    try:
+        entries = reservations.reserve(debits, credits)
+    except InsufficientFunds as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = None
+    try:
+        result = await user_sequencer.run(user_id, func, **kwargs)
+    finally:
+        reservations.complete(entries, changes(result) if result is not None and result["success"] else None)
+    return result
+
+async def journal_synced():
+    """Wait until every order book mutation so far is fsynced (before acknowledging it)"""
+    await asyncio.wrap_future(market_journal.synced(market_journal.last_seq))
+
+def warm_trade_tape():
+    for collectible in db_service.get_all_collectibles():
+        trade_tape.warm(collectible["id"], db_service.get_recent_prices(collectible["id"], trade_tape.size))
+
+async def resettle_replayed_fills():
+    """Settle fills replayed from the WAL that the database does not have yet
+    
+    Settlement is idempotent on trade id, so a fill that did reach the
+    database meanwhile (or when the lookup fails) comes back as a duplicate.
+    """
+    trade_ids = [trade.trade_id for trade in market_journal.replayed_trades]
+    trade_ids += [fill["trade_id"] for result in market_journal.replayed_auctions for fill in result["fills"]]
+    if not trade_ids:
+        return
+    settled = await asyncio.get_running_loop().run_in_executor(None, db_service.get_settled_trade_ids, trade_ids)
+    settled = settled or set()
+    trades = [trade for trade in market_journal.replayed_trades if trade.trade_id not in settled]
+    # An auction settles all its fills in one transaction
+    results = [result for result in market_journal.replayed_auctions
+               if any(fill["trade_id"] not in settled for fill in result["fills"])]
+    market_journal.replayed_trades, market_journal.replayed_auctions = [], []
+    
+    fills = [(trade.buyer_id, trade.seller_id, trade.collectible_id) for trade in trades]
+    fills += [(fill["buyer_id"], fill["seller_id"], result["collectible_id"])
+              for result in results for fill in result["fills"]]
+    for buyer_id, seller_id, collectible_id in fills:
+        await reservations.load(buyer_id)
+        await reservations.load(seller_id, collectible_id)
+    reservations.on_recovered(trades, results)
+    trade_recorder.resubmit(trades)
+    auction_recorder.resubmit(results)
+    print(f"Resettling {len(trades)} trades and {len(results)} auctions replayed from the WAL")
+
+@app.on_event("startup")
+async def recover_order_books():
+    """Rebuild order books from the last snapshot + WAL tail, then snapshot periodically"""
+    price_feed.attach(asyncio.get_running_loop())
+    depth_feed.attach(asyncio.get_running_loop())
+    trade_recorder.attach(asyncio.get_running_loop())
+    auction_recorder.attach(asyncio.get_running_loop())
+    await asyncio.get_running_loop().run_in_executor(None, warm_trade_tape)
+    amm.load(await asyncio.get_running_loop().run_in_executor(None, db_service.get_amm_pools))
+    # Nothing else touches the books until startup finishes, so replay can run off the loop
+    stats = await asyncio.get_running_loop().run_in_executor(
+        None, market_journal.recover, matching_engine, call_auction
+    )
+    trade_recorder.journal = auction_recorder.journal = market_journal
+    market_journal.recorders = [trade_recorder, auction_recorder]
+    print(f"Order books recovered: {stats}")
+    
+    reservations.restore(await asyncio.get_running_loop().run_in_executor(None, db_service.get_active_reservations))
+    for order in [*matching_engine.resting_orders(), *call_auction.pending_orders()]:
+        await reservations.load(order.user_id, order.collectible_id if order.side == "sell" else None)
+        reservations.commit_order(order)
+    await resettle_replayed_fills()
+    
+    async def snapshot_periodically():
+        while True:
+            await asyncio.sleep(MARKET_SNAPSHOT_INTERVAL_SECONDS)
+            try:
+                # Copy the books here, between mutations; fsync and write off the loop
+                state = market_journal.begin_snapshot(matching_engine)
+                await asyncio.get_running_loop().run_in_executor(None, market_journal.finish_snapshot, state)
+            except Exception as e:
+                print(f"Error snapshotting order books: {e}")
+    
+    asyncio.create_task(snapshot_periodically())
+    
+    async def clear_auctions_periodically():
+        while True:
+            await asyncio.sleep(call_auction.interval)
+            try:
+                call_auction.run()
+            except Exception as e:
+                print(f"Error clearing call auctions: {e}")
+    
+    asyncio.create_task(clear_auctions_periodically())
+
 # Pydantic Models
 class UserCreate(BaseModel):
     email: EmailStr
@@ -46,6 +274,35 @@ class TransactionCreate(BaseModel):
     amount: float
     description: str
 
+class PurchaseCreate(BaseModel):
+    collectible_id: str
+    description: Optional[str] = None
+
+class TransferCreate(BaseModel):
+    recipient_id: str
+    amount: float
+    description: Optional[str] = None
+
+class OrderCreate(BaseModel):
+    side: str
+    quantity: int
+    order_type: str = LIMIT
+    price: Optional[float] = None
+
+class RedemptionCreate(BaseModel):
+    collectible_id: str
+
+class PoolCreate(BaseModel):
+    collectible_id: str
+    token_reserve: float
+    unit_reserve: float
+    fee_bps: int = AMM_FEE_BPS
+
+class SwapCreate(BaseModel):
+    side: str
+    amount_in: float
+    min_amount_out: float = 0
+
 # Authentication dependency
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Extract user from JWT token"""
@@ -68,6 +325,16 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+async def run_idempotent(current_user: dict, idempotency_key: Optional[str], payload, operation):
+    """Run a mutating operation at most once per user and Idempotency-Key"""
+    try:
+        return await idempotency_store.run(current_user["user_id"], idempotency_key, payload, operation)
+    except IdempotencyKeyReused:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used with a different request"
+        )
+
 # Public Endpoints (No Authentication Required)
 @app.get("/")
 async def root():
@@ -88,6 +355,49 @@ async def get_collectibles():
     collectibles = db_service.get_all_collectibles()
     return collectibles
 
+@app.get("/collectibles/stream")
+async def stream_prices(
+    request: Request,
+    collectible_ids: str,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """Server-Sent Events price stream for a set of collectibles (public access)
+    
+    A reconnecting client sends Last-Event-ID and only receives the
+    collectibles whose price changed since; slow clients get the latest price.
+    """
+    subscription = Subscription()
+    try:
+        price_feed.subscribe(subscription, collectible_ids.split(","),
+                             after_seq=price_feed.resume_after(last_event_id))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def generate():
+        try:
+            # Jittered reconnect delay spreads out reconnect storms
+            yield f"retry: {MARKET_FEED_RETRY_MS + random.randint(0, MARKET_FEED_RETRY_MS)}\n\n"
+            while True:
+                try:
+                    events = await asyncio.wait_for(subscription.next_batch(), MARKET_FEED_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": heartbeat\n\n"
+                    continue
+                yield "".join(
+                    f"id: {price_feed.event_id(event)}\nevent: price\ndata: {json.dumps(event)}\n\n"
+                    for event in events
+                )
+        finally:
+            price_feed.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/collectibles/{collectible_id}")
 async def get_collectible(collectible_id: str):
     """Get specific collectible (public access)"""
@@ -97,10 +407,99 @@ async def get_collectible(collectible_id: str):
     return collectible
 
 @app.get("/collectibles/{collectible_id}/price-history")
-async def get_price_history(collectible_id: str):
-    """Get price history for collectible (public access)"""
-    history = db_service.get_price_history(collectible_id)
-    return history
+async def get_price_history(
+    collectible_id: str,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    limit: Optional[int] = None,
+    max_points: Optional[int] = None
+):
+    """Get price history for collectible (public access)
+    
+    from/to bound recorded_at (naive times are UTC) and limit keeps the
+    newest rows, read from price_history and the archive with the bounds
+    pushed down. With max_points the window is downsampled (LTTB) from the
+    cached series, keeping visible peaks and troughs. Either way rows are
+    newest first with collectible_id, price, quantity (null for manual
+    price updates) and recorded_at in UTC; they carry no id.
+    """
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    start, end = [value.replace(tzinfo=timezone.utc) if value is not None and value.tzinfo is None else value
+                  for value in (start, end)]
+    start_ts = start.timestamp() if start is not None else None
+    end_ts = end.timestamp() if end is not None else None
+    
+    if max_points is None:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(
+                db_service.get_price_history,
+                collectible_id,
+                start=start.isoformat() if start is not None else None,
+                end=end.isoformat() if end is not None else None,
+                limit=limit
+            )
+        )
+    try:
+        series = await price_series.get(collectible_id)
+    except Exception as e:
+        print(f"Error loading price series: {e}")
+        raise HTTPException(status_code=503, detail="Price history unavailable")
+    try:
+        return downsample(series, collectible_id, max_points, start_ts, end_ts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.websocket("/ws/market")
+async def market_feed(websocket: WebSocket, collectible_ids: Optional[str] = None):
+    """Push live prices and order book depth for subscribed collectibles (public access)
+    
+    Subscribe with ?collectible_ids=a,b or by sending
+    {"action": "subscribe" | "unsubscribe", "channel": "prices" | "depth", "collectible_ids": [...]}.
+    A client that reads slowly only receives the latest price per collectible;
+    depth starts with a snapshot followed by level deltas (merged when slow).
+    """
+    await websocket.accept()
+    channels = {
+        "prices": (price_feed, Subscription()),
+        "depth": (depth_feed, DepthSubscription())
+    }
+    
+    async def send_updates(channel: str, subscription: Subscription):
+        while True:
+            events = await subscription.next_batch()
+            await websocket.send_text(json.dumps({"type": channel, "events": events}))
+    
+    try:
+        if collectible_ids:
+            price_feed.subscribe(channels["prices"][1], collectible_ids.split(","))
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    
+    senders = [asyncio.create_task(send_updates(channel, subscription))
+               for channel, (_, subscription) in channels.items()]
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                feed, subscription = channels[message.get("channel", "prices")]
+                ids = message["collectible_ids"]
+                if message["action"] == "subscribe":
+                    feed.subscribe(subscription, ids)
+                elif message["action"] == "unsubscribe":
+                    feed.unsubscribe(subscription, ids)
+                else:
+                    raise ValueError(f"Unknown action: {message['action']}")
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                await websocket.send_text(json.dumps({"type": "error", "detail": str(e)}))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for sender in senders:
+            sender.cancel()
+        for feed, subscription in channels.values():
+            feed.unsubscribe(subscription)
 
 # Authentication Endpoints
 @app.post("/auth/register")
@@ -159,14 +558,43 @@ async def get_user_balance(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=404, detail="Balance not found")
     return balance
 
+@app.get("/profile/balance/available")
+async def get_available_balance(current_user: dict = Depends(get_current_user)):
+    """Current user's balance split into available, held and committed to open orders"""
+    await load_reservations(current_user["user_id"])
+    return reservations.summary(current_user["user_id"])
+
+@app.get("/profile/balance/at")
+async def get_balance_at(timestamp: datetime, current_user: dict = Depends(get_current_user)):
+    """Get current user's balance as of a point in time (from the ledger)"""
+    balance = db_service.get_balance_at(current_user["user_id"], timestamp)
+    if balance is None:
+        raise HTTPException(status_code=400, detail="Failed to compute balance")
+    return {"user_id": current_user["user_id"], "timestamp": timestamp, "balance": balance}
+
 @app.put("/profile/balance/{new_balance}")
-async def update_balance(new_balance: float, current_user: dict = Depends(get_current_user)):
-    """Update user's balance"""
-    success = db_service.update_user_balance(current_user["user_id"], new_balance)
-    if success:
-        return {"message": "Balance updated successfully"}
-    else:
-        raise HTTPException(status_code=400, detail="Failed to update balance")
+async def update_balance(
+    new_balance: float,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Update user's balance (not below what open orders and holds have set aside)"""
+    async def perform():
+        user_id = current_user["user_id"]
+        await load_reservations(user_id)
+        # Lowering the balance is a debit of the difference
+        decrease = max(0, reservations.account(user_id).balance - to_cents(new_balance))
+        result = await run_reserved(
+            user_id, {user_id: decrease}, [],
+            lambda result: {user_id: to_cents(result["adjustment"])},
+            db_service.set_user_balance, user_id=user_id, new_balance=new_balance
+        )
+        if result["success"]:
+            return {"message": "Balance updated successfully"}
+        else:
+            raise HTTPException(status_code=400, detail="Failed to update balance")
+    
+    return await run_idempotent(current_user, idempotency_key, {"new_balance": new_balance}, perform)
 
 @app.get("/profile/transactions")
 async def get_user_transactions(current_user: dict = Depends(get_current_user)):
@@ -174,20 +602,137 @@ async def get_user_transactions(current_user: dict = Depends(get_current_user)):
     transactions = db_service.get_user_transactions(current_user["user_id"])
     return transactions
 
+@app.get("/profile/transactions/summary")
+async def get_transaction_summary(current_user: dict = Depends(get_current_user)):
+    """Get current user's transaction totals per type and per month"""
+    return db_service.get_transaction_summary(current_user["user_id"])
+
+@app.get("/profile/transactions/export")
+async def export_user_transactions(format: str = "ndjson", current_user: dict = Depends(get_current_user)):
+    """Stream current user's full transaction history as NDJSON or CSV"""
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    
+    rows = db_service.iter_user_transactions(current_user["user_id"])
+    
+    def ndjson_lines():
+        for row in rows:
+            yield json.dumps(row, default=str) + "\n"
+    
+    def csv_lines():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        yield buffer.getvalue()
+        for row in rows:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            yield buffer.getvalue()
+    
+    if format == "csv":
+        return StreamingResponse(
+            csv_lines(),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=transactions.csv"}
+        )
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
 @app.post("/transactions")
 async def create_transaction(
     transaction_data: TransactionCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """Create new transaction"""
     transaction_dict = transaction_data.dict()
     transaction_dict["user_id"] = current_user["user_id"]
+    # A record only: no balance moves, so reconciliation must not count it
+    transaction_dict["ledger_posted"] = False
     
-    transaction = db_service.create_transaction(transaction_dict)
-    if transaction:
-        return {"message": "Transaction created", "transaction": transaction}
-    else:
-        raise HTTPException(status_code=400, detail="Failed to create transaction")
+    async def perform():
+        async with user_sequencer.hold(current_user["user_id"]):
+            transaction = await db_service.create_transaction_batched(transaction_dict)
+        if transaction:
+            return {"message": "Transaction created", "transaction": transaction}
+        else:
+            raise HTTPException(status_code=400, detail="Failed to create transaction")
+    
+    return await run_idempotent(current_user, idempotency_key, transaction_dict, perform)
+
+@app.post("/purchases")
+async def create_purchase(
+    purchase_data: PurchaseCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Buy a collectible at its current price (single atomic debit + transaction)"""
+    async def perform():
+        user_id = current_user["user_id"]
+        collectible = await asyncio.get_running_loop().run_in_executor(
+            None, db_service.get_collectible_by_id, purchase_data.collectible_id
+        )
+        if not collectible or collectible.get("current_price") is None:
+            raise HTTPException(status_code=404, detail="Collectible not found")
+        await load_reservations(user_id, purchase_data.collectible_id)
+        
+        price = float(collectible["current_price"])
+        position = (user_id, purchase_data.collectible_id)
+        result = await run_reserved(
+            user_id, {user_id: to_cents(price)}, [position],
+            lambda result: {user_id: to_cents(float(result["transaction"]["amount"])), position: UNIT_SCALE},
+            db_service.purchase_collectible,
+            user_id=user_id,
+            collectible_id=purchase_data.collectible_id,
+            description=purchase_data.description,
+            max_price=price
+        )
+        
+        if result["success"]:
+            return {
+                "message": "Purchase completed",
+                "transaction": result["transaction"],
+                "balance": result["balance"]
+            }
+        else:
+            raise HTTPException(status_code=400, detail=result["error"])
+    
+    return await run_idempotent(current_user, idempotency_key, purchase_data.dict(), perform)
+
+@app.post("/transfers")
+async def create_transfer(
+    transfer_data: TransferCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Transfer tokens to another user (single atomic debit + credit)"""
+    async def perform():
+        user_id, recipient_id = current_user["user_id"], transfer_data.recipient_id
+        await load_reservations(user_id)
+        
+        def changes(result):
+            amount = to_cents(float(result["transaction"]["amount"]))
+            return {user_id: amount, recipient_id: -amount}
+        
+        result = await run_reserved(
+            user_id, {user_id: max(0, to_cents(transfer_data.amount))}, [recipient_id], changes,
+            db_service.transfer_tokens,
+            from_user_id=user_id,
+            to_user_id=recipient_id,
+            amount=transfer_data.amount,
+            description=transfer_data.description
+        )
+        
+        if result["success"]:
+            return {
+                "message": "Transfer completed",
+                "transaction": result["transaction"],
+                "balance": result["balance"]
+            }
+        else:
+            raise HTTPException(status_code=400, detail=result["error"])
+    
+    return await run_idempotent(current_user, idempotency_key, transfer_data.dict(), perform)
 
 @app.get("/profile/referrals")
 async def get_user_referrals(current_user: dict = Depends(get_current_user)):
@@ -201,33 +746,376 @@ async def get_user_redemptions(current_user: dict = Depends(get_current_user)):
     redemptions = db_service.get_user_redemptions(current_user["user_id"])
     return redemptions
 
+@app.post("/redemptions")
+async def create_redemption(
+    redemption_data: RedemptionCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Redeem a collectible at its current price; the cost is held until fulfilment"""
+    async def perform():
+        collectible = await asyncio.get_running_loop().run_in_executor(
+            None, db_service.get_collectible_by_id, redemption_data.collectible_id
+        )
+        if not collectible or collectible.get("current_price") is None:
+            raise HTTPException(status_code=404, detail="Collectible not found")
+        await load_reservations(current_user["user_id"])
+        
+        try:
+            reservation, written = reservations.hold(
+                current_user["user_id"],
+                to_cents(float(collectible["current_price"])),
+                "redemption",
+                reference=str(uuid.uuid4()),
+                details={"collectible_id": redemption_data.collectible_id}
+            )
+        except InsufficientFunds as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        try:
+            result = await asyncio.wrap_future(written)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to create redemption: {e}")
+        if result.get("status") != HELD:
+            raise HTTPException(status_code=400, detail="Insufficient balance")
+        return {
+            "message": "Redemption created",
+            "redemption_id": reservation.reference,
+            "reservation": reservation.to_dict(),
+            "balance": result["balance"]
+        }
+    
+    return await run_idempotent(current_user, idempotency_key, redemption_data.dict(), perform)
+
+async def close_redemption(redemption_id: str, current_user: dict, close):
+    """Release or settle the hold of one of the current user's pending redemptions"""
+    reservation = reservations.by_reference(redemption_id)
+    if reservation is None or reservation.user_id != current_user["user_id"]:
+        raise HTTPException(status_code=404, detail="Pending redemption not found")
+    try:
+        result = await asyncio.wrap_future(close(reservation))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result.get("status") != reservation.status:
+        raise HTTPException(status_code=409, detail="Redemption is no longer pending")
+    return reservation
+
+@app.post("/profile/redemptions/{redemption_id}/cancel")
+async def cancel_redemption(
+    redemption_id: str,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Cancel a pending redemption and release its held cost"""
+    async def perform():
+        reservation = await close_redemption(redemption_id, current_user, reservations.release)
+        return {"message": "Redemption cancelled", "reservation": reservation.to_dict()}
+    
+    payload = {"redemption_id": redemption_id, "action": "cancel"}
+    return await run_idempotent(current_user, idempotency_key, payload, perform)
+
+@app.post("/profile/redemptions/{redemption_id}/complete")
+async def complete_redemption(
+    redemption_id: str,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Confirm a redemption was fulfilled; its held cost is paid to the house"""
+    async def perform():
+        reservation = await close_redemption(
+            redemption_id, current_user, lambda reservation: reservations.settle(reservation, "system:revenue")
+        )
+        return {"message": "Redemption completed", "reservation": reservation.to_dict()}
+    
+    payload = {"redemption_id": redemption_id, "action": "complete"}
+    return await run_idempotent(current_user, idempotency_key, payload, perform)
+
 @app.post("/collectibles")
 async def create_collectible(
     collectible_data: CollectibleCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """Create new collectible (authenticated users only)"""
     collectible_dict = collectible_data.dict()
-    collectible = db_service.create_collectible(collectible_dict)
     
-    if collectible:
-        return {"message": "Collectible created", "collectible": collectible}
-    else:
-        raise HTTPException(status_code=400, detail="Failed to create collectible")
+    async def perform():
+        collectible = db_service.create_collectible(collectible_dict)
+        
+        if collectible:
+            return {"message": "Collectible created", "collectible": collectible}
+        else:
+            raise HTTPException(status_code=400, detail="Failed to create collectible")
+    
+    return await run_idempotent(current_user, idempotency_key, collectible_dict, perform)
 
 @app.post("/collectibles/{collectible_id}/price")
 async def update_price(
     collectible_id: str,
     price: float,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """Update collectible price (authenticated users only)"""
-    success = db_service.add_price_record(collectible_id, price)
+    async def perform():
+        recorded_at = db_service.add_price_record(collectible_id, price)
+        
+        if recorded_at:
+            price_feed.publish(collectible_id, price, "price_update",
+                               timestamp=datetime.fromisoformat(recorded_at).timestamp())
+            return {"message": "Price updated successfully"}
+        else:
+            raise HTTPException(status_code=400, detail="Failed to update price")
     
-    if success:
-        return {"message": "Price updated successfully"}
-    else:
-        raise HTTPException(status_code=400, detail="Failed to update price")
+    payload = {"collectible_id": collectible_id, "price": price}
+    return await run_idempotent(current_user, idempotency_key, payload, perform)
+
+@app.post("/collectibles/{collectible_id}/orders")
+async def place_order(
+    collectible_id: str,
+    order_data: OrderCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Place a limit or market order on a collectible's order book"""
+    async def perform():
+        price = to_ticks(order_data.price) if order_data.price is not None else None
+        auction = call_auction.is_enabled(collectible_id)
+        is_market = order_data.order_type != LIMIT
+        if order_data.side == "buy" and is_market and auction:
+            raise HTTPException(status_code=400, detail="Market buy orders are not accepted in auction mode")
+        await load_reservations(current_user["user_id"], collectible_id if order_data.side == "sell" else None)
+        # No await from the check until the order's commitment is recorded
+        try:
+            # Ticks are cents: a buy limit order commits price * quantity and a
+            # market buy what the book would charge now; sells need the units
+            if order_data.side == "buy":
+                cost = (matching_engine.fill_cost(collectible_id, "buy", order_data.quantity) if is_market
+                        else price * order_data.quantity if price is not None else 0)
+                reservations.check(current_user["user_id"], cost)
+            else:
+                reservations.check_units(current_user["user_id"], collectible_id, order_data.quantity)
+        except InsufficientFunds as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if auction:
+            try:
+                order = call_auction.submit(
+                    user_id=current_user["user_id"],
+                    collectible_id=collectible_id,
+                    side=order_data.side,
+                    quantity=order_data.quantity,
+                    price=price,
+                    order_type=order_data.order_type
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            reservations.commit_order(order)
+            await journal_synced()
+            return {
+                "message": "Order queued for call auction",
+                "order": order.to_dict(),
+                "trades": [],
+                "auction": call_auction.indicative(collectible_id)
+            }
+        
+        try:
+            order, trades = matching_engine.submit(
+                user_id=current_user["user_id"],
+                collectible_id=collectible_id,
+                side=order_data.side,
+                quantity=order_data.quantity,
+                price=price,
+                order_type=order_data.order_type
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if matching_engine.get_order(order.order_id) is not None:
+            reservations.commit_order(order)
+        await journal_synced()
+        
+        return {
+            "message": "Order accepted",
+            "order": order.to_dict(),
+            "trades": [trade.to_dict() for trade in trades]
+        }
+    
+    payload = {"collectible_id": collectible_id, **order_data.dict()}
+    return await run_idempotent(current_user, idempotency_key, payload, perform)
+
+@app.get("/collectibles/{collectible_id}/candles")
+async def get_price_candles(
+    collectible_id: str,
+    interval: str = "1h",
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    limit: Optional[int] = None
+):
+    """Open/high/low/close/volume candles (start/end as unix seconds, public access)"""
+    try:
+        return await candle_store.candles(collectible_id, interval, start=start, end=end, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/collectibles/{collectible_id}/analytics")
+async def get_price_analytics(collectible_id: str, window: int = 20, points: int = 500):
+    """SMA/EMA, log returns, rolling volatility and drawdown over the full price history (public access)"""
+    try:
+        series = await price_series.get(collectible_id)
+    except Exception as e:
+        print(f"Error loading price series: {e}")
+        raise HTTPException(status_code=503, detail="Price history unavailable")
+    try:
+        return {"collectible_id": collectible_id, **price_analytics(series, window=window, points=points)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/collectibles/{collectible_id}/trades")
+async def get_recent_trades(collectible_id: str, limit: int = 50):
+    """Most recent trades and price ticks, newest first, served from memory (public access)"""
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    return trade_tape.latest(collectible_id, limit)
+
+@app.get("/collectibles/{collectible_id}/depth")
+async def get_order_book_depth(collectible_id: str, levels: int = 10):
+    """Aggregated quantity of the best price levels on each side (public access)"""
+    if levels < 1:
+        raise HTTPException(status_code=400, detail="levels must be positive")
+    return matching_engine.depth(collectible_id, levels)
+
+@app.get("/collectibles/{collectible_id}/auction")
+async def get_auction_status(collectible_id: str):
+    """Indicative clearing price and volume of a collectible's next call auction"""
+    if not call_auction.is_enabled(collectible_id):
+        raise HTTPException(status_code=404, detail="Collectible is not in auction mode")
+    return call_auction.indicative(collectible_id)
+
+@app.delete("/orders/{order_id}")
+async def cancel_order(
+    order_id: int,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Cancel one of the current user's resting orders"""
+    async def perform():
+        order = (matching_engine.cancel(order_id, user_id=current_user["user_id"])
+                 or call_auction.cancel(order_id, user_id=current_user["user_id"]))
+        if not order:
+            raise HTTPException(status_code=404, detail="Order not found")
+        reservations.release_order(order.order_id)
+        await journal_synced()
+        return {"message": "Order cancelled", "order": order.to_dict()}
+    
+    return await run_idempotent(current_user, idempotency_key, {"order_id": order_id}, perform)
+
+@app.get("/amm/pools")
+async def get_amm_pools():
+    """All AMM pools with reserves and spot price (public access)"""
+    return [pool.to_dict() for pool in amm.pools.values()]
+
+@app.post("/amm/pools")
+async def create_amm_pool(
+    pool_data: PoolCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Open a constant-product pool, funding the token reserve from the caller's balance"""
+    async def perform():
+        user_id = current_user["user_id"]
+        await load_reservations(user_id)
+        result = await run_reserved(
+            user_id, {user_id: max(0, to_cents(pool_data.token_reserve))}, [],
+            lambda result: {user_id: -to_cents(float(result["pool"]["token_reserve"]))},
+            db_service.create_amm_pool,
+            user_id=user_id,
+            collectible_id=pool_data.collectible_id,
+            token_reserve=pool_data.token_reserve,
+            unit_reserve=pool_data.unit_reserve,
+            fee_bps=pool_data.fee_bps
+        )
+        
+        if result["success"]:
+            amm.update(result["pool"])
+            return {"message": "Pool created", "pool": amm.pool(pool_data.collectible_id).to_dict()}
+        else:
+            raise HTTPException(status_code=400, detail=result["error"])
+    
+    return await run_idempotent(current_user, idempotency_key, pool_data.dict(), perform)
+
+@app.get("/amm/pools/{collectible_id}")
+async def get_amm_pool(collectible_id: str):
+    """Reserves and spot price of a collectible's pool (public access)"""
+    pool = amm.pool(collectible_id)
+    if pool is None:
+        raise HTTPException(status_code=404, detail="Pool not found")
+    return pool.to_dict()
+
+@app.get("/amm/pools/{collectible_id}/quote")
+async def quote_amm_swap(collectible_id: str, side: str, amount_in: float):
+    """Price a swap from in-memory reserves without executing it (public access)"""
+    pool = amm.pool(collectible_id)
+    if pool is None:
+        raise HTTPException(status_code=404, detail="Pool not found")
+    try:
+        return pool.quote(side, Decimal(str(amount_in)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/amm/pools/{collectible_id}/swap")
+async def execute_amm_swap(
+    collectible_id: str,
+    swap_data: SwapCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Swap tokens for units (buy) or held units for tokens (sell) against a pool"""
+    async def perform():
+        user_id = current_user["user_id"]
+        position = (user_id, collectible_id)
+        await load_reservations(user_id, collectible_id)
+        # Amounts in are truncated like amm_swap() does
+        amount_in = max(Decimal(0), Decimal(str(swap_data.amount_in)))
+        if swap_data.side == BUY:
+            debits = {user_id: int(amount_in.quantize(TOKEN_QUANTUM, rounding=ROUND_DOWN) * 100)}
+            credits = [position]
+        else:
+            debits = {position: int(amount_in.quantize(UNIT_QUANTUM, rounding=ROUND_DOWN) * UNIT_SCALE)}
+            credits = [user_id]
+        
+        def changes(result):
+            tokens = to_cents(float(result["transaction"]["amount"]))
+            units = to_units(float(result["amount_out"])) if swap_data.side == BUY else -debits[position]
+            return {user_id: tokens, position: units}
+        
+        result = await run_reserved(
+            user_id, debits, credits, changes,
+            db_service.amm_swap,
+            user_id=user_id,
+            collectible_id=collectible_id,
+            side=swap_data.side,
+            amount_in=swap_data.amount_in,
+            min_amount_out=swap_data.min_amount_out
+        )
+        
+        if result["success"]:
+            amm.update(result["pool"])
+            pool = amm.pool(collectible_id)
+            price_feed.publish(collectible_id, float(pool.spot_price()), "amm")
+            return {
+                "message": "Swap completed",
+                "amount_out": result["amount_out"],
+                "transaction": result["transaction"],
+                "balance": result["balance"],
+                "pool": pool.to_dict()
+            }
+        else:
+            raise HTTPException(status_code=400, detail=result["error"])
+    
+    payload = {"collectible_id": collectible_id, **swap_data.dict()}
+    return await run_idempotent(current_user, idempotency_key, payload, perform)
 
 if __name__ == "__main__":
     import uvicorn
@@ -2,10 +2,11 @@
 Authentication utilities for JWT token handling
 """
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,12 +17,58 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Cost factor is tuned per host with calibrate_password_hashing.py. Pinning
+# min/max to the same value makes passlib flag any stored hash with a
+# different cost as needing an update, so logins migrate hashes over time.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_TARGET_VERIFY_MS = float(os.getenv("BCRYPT_TARGET_VERIFY_MS", "250"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and return a replacement hash if the stored one is outdated"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+def calibrate_bcrypt_rounds(target_ms: float = BCRYPT_TARGET_VERIFY_MS,
+                            min_rounds: int = 4, max_rounds: int = 16,
+                            samples: int = 3) -> Dict[str, Any]:
+    """Benchmark bcrypt on this host and pick the highest cost within target_ms"""
+    from passlib.hash import bcrypt
+    
+    timings = {}
+    chosen = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        handler = bcrypt.using(rounds=rounds)
+        sample_hash = handler.hash("calibration-password")
+        
+        best = None
+        for _ in range(samples):
+            start = time.perf_counter()
+            handler.verify("calibration-password", sample_hash)
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        timings[rounds] = round(best, 2)
+        
+        if best > target_ms:
+            break
+        chosen = rounds
+    
+    return {
+        "rounds": chosen,
+        "target_ms": target_ms,
+        "timings_ms": timings
+    }
+
 def get_password_hash(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
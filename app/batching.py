@@ -0,0 +1,87 @@
+"""
+Group-commit batching for high-volume inserts
+Concurrent callers submit single rows; a background thread collects them for
+a few milliseconds and writes each group with one multi-row insert.
+"""
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+import queue
+import threading
+import time
+
+Row = Dict[str, Any]
+
+class GroupCommitWriter:
+    """Collects rows from many callers and commits them as multi-row inserts"""
+    
+    def __init__(self, insert_many: Callable[[List[Row]], List[Row]],
+                 max_batch_size: int = 100, max_delay_ms: float = 5.0,
+                 name: str = "group-commit"):
+        self.insert_many = insert_many
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000.0
+        self.name = name
+        self._queue: "queue.Queue[Tuple[Row, Future]]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def submit(self, row: Row) -> Future:
+        """Queue a row; the future resolves to the inserted row or its own error"""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((row, future))
+        return future
+    
+    def write(self, row: Row) -> Row:
+        """Blocking insert of a single row through the batcher"""
+        return self.submit(row).result()
+    
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            # PostgREST bulk inserts need a uniform column set per request
+            groups: Dict[Tuple[str, ...], List[Tuple[Row, Future]]] = {}
+            for row, future in batch:
+                groups.setdefault(tuple(sorted(row)), []).append((row, future))
+            for group in groups.values():
+                self._commit(group)
+    
+    def _commit(self, group: List[Tuple[Row, Future]]):
+        try:
+            results = self.insert_many([row for row, _ in group])
+        except Exception as e:
+            if len(group) == 1:
+                group[0][1].set_exception(e)
+                return
+            # A multi-row insert is all-or-nothing; retry rows individually
+            # so one bad row only fails its own caller
+            for item in group:
+                self._commit([item])
+            return
+        
+        if len(results) != len(group):
+            error = RuntimeError(f"Batch insert returned {len(results)} rows for {len(group)}")
+            for _, future in group:
+                future.set_exception(error)
+            return
+        
+        for (_, future), result in zip(group, results):
+            future.set_result(result)
@@ -0,0 +1,264 @@
+"""
+Periodic call auctions for illiquid collectibles
+Orders for auction-mode collectibles are collected instead of matched
+continuously. Every interval each collectible clears at one uniform price
+that maximizes executed volume, computed in a single vectorized pass, and
+the result is settled and priced with one write. Orders, cancels and
+clearings go through the market WAL (app.market_journal) like the books.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import os
+import time
+
+import numpy as np
+
+from app.matching_engine import (
+    Order, BUY, SELL, LIMIT, MARKET, OPEN, PARTIALLY_FILLED, FILLED, CANCELLED, from_ticks
+)
+
+AUCTION_INTERVAL_SECONDS = float(os.getenv("AUCTION_INTERVAL_SECONDS", "60"))
+AUCTION_COLLECTIBLE_IDS = [c for c in os.getenv("AUCTION_COLLECTIBLE_IDS", "").split(",") if c]
+
+def clearing_price(bid_prices: np.ndarray, bid_quantities: np.ndarray,
+                   ask_prices: np.ndarray, ask_quantities: np.ndarray,
+                   market_bid: int = 0, market_ask: int = 0,
+                   reference: Optional[int] = None) -> Tuple[Optional[int], int]:
+    """Uniform price (ticks) maximizing matched volume, and that volume
+    
+    Ties are broken by smallest demand/supply imbalance, then by distance
+    to the reference (last) price.
+    """
+    candidates = np.unique(np.concatenate([bid_prices, ask_prices]))
+    if len(candidates) == 0:
+        volume = min(market_bid, market_ask)
+        return (reference, volume) if volume and reference is not None else (None, 0)
+    
+    bid_order = np.argsort(bid_prices)
+    bid_sorted = bid_prices[bid_order]
+    # Suffix sums: quantity bid at or above each sorted price
+    bid_suffix = np.concatenate([np.cumsum(bid_quantities[bid_order][::-1])[::-1], [0]])
+    demand = market_bid + bid_suffix[np.searchsorted(bid_sorted, candidates, side="left")]
+    
+    ask_order = np.argsort(ask_prices)
+    ask_sorted = ask_prices[ask_order]
+    # Prefix sums: quantity offered at or below each sorted price
+    ask_prefix = np.concatenate([[0], np.cumsum(ask_quantities[ask_order])])
+    supply = market_ask + ask_prefix[np.searchsorted(ask_sorted, candidates, side="right")]
+    
+    volume = np.minimum(demand, supply)
+    best_volume = int(volume.max())
+    if best_volume == 0:
+        return None, 0
+    
+    tied = np.nonzero(volume == best_volume)[0]
+    imbalance = np.abs(demand[tied] - supply[tied])
+    tied = tied[imbalance == imbalance.min()]
+    if reference is not None:
+        choice = tied[np.argmin(np.abs(candidates[tied] - reference))]
+    else:
+        choice = tied[len(tied) // 2]
+    return int(candidates[choice]), best_volume
+
+class CallAuction:
+    """Order collection and periodic uniform-price clearing per collectible"""
+    
+    def __init__(self, next_order_id: Callable[[], int], next_trade_id: Callable[[], int],
+                 interval: float = AUCTION_INTERVAL_SECONDS, collectible_ids: Optional[List[str]] = None):
+        self.next_order_id = next_order_id
+        self.next_trade_id = next_trade_id
+        self.interval = interval
+        self.enabled = set(collectible_ids or [])
+        self.orders: Dict[str, List[Order]] = {}
+        self.last_price: Dict[str, int] = {}
+        self.next_clear_at = time.time() + interval
+        self._order_index: Dict[int, Order] = {}
+        self._result_listeners: List[Callable[[List[Dict[str, Any]]], Any]] = []
+        # Optional write-ahead journal (see app.market_journal)
+        self.journal = None
+    
+    def add_result_listener(self, listener: Callable[[List[Dict[str, Any]]], Any]):
+        """Call listener with the list of auction results from each clearing run"""
+        self._result_listeners.append(listener)
+    
+    def is_enabled(self, collectible_id: str) -> bool:
+        return collectible_id in self.enabled
+    
+    def enable(self, collectible_id: str):
+        self.enabled.add(collectible_id)
+    
+    def submit(self, user_id: str, collectible_id: str, side: str, quantity: int,
+               price: Optional[int] = None, order_type: str = LIMIT) -> Order:
+        """Queue an order for the collectible's next auction"""
+        if side not in (BUY, SELL):
+            raise ValueError("side must be 'buy' or 'sell'")
+        if order_type not in (LIMIT, MARKET):
+            raise ValueError("order_type must be 'limit' or 'market'")
+        if quantity <= 0:
+            raise ValueError("quantity must be positive")
+        if order_type == LIMIT and (price is None or price <= 0):
+            raise ValueError("limit orders need a positive price")
+        if order_type == MARKET:
+            price = None
+        
+        order = Order(self.next_order_id(), user_id, collectible_id, side,
+                      order_type, price, quantity, time.time())
+        if self.journal is not None:
+            self.journal.record_auction_submit(order)
+        self.orders.setdefault(collectible_id, []).append(order)
+        self._order_index[order.order_id] = order
+        return order
+    
+    def cancel(self, order_id: int, user_id: Optional[str] = None) -> Optional[Order]:
+        order = self._order_index.get(order_id)
+        if order is None or (user_id is not None and order.user_id != user_id):
+            return None
+        if self.journal is not None:
+            self.journal.record_auction_cancel(order_id)
+        del self._order_index[order_id]
+        self.orders[order.collectible_id].remove(order)
+        order.status = CANCELLED
+        return order
+    
+    def indicative(self, collectible_id: str) -> Dict[str, Any]:
+        """Price and volume the auction would clear at right now"""
+        price, volume = self._clearing(collectible_id)
+        return {
+            "collectible_id": collectible_id,
+            "indicative_price": from_ticks(price) if price is not None else None,
+            "indicative_volume": volume,
+            "orders": len(self.orders.get(collectible_id, [])),
+            "next_clear_at": self.next_clear_at
+        }
+    
+    def _clearing(self, collectible_id: str) -> Tuple[Optional[int], int]:
+        orders = self.orders.get(collectible_id, [])
+        bids = [o for o in orders if o.side == BUY and o.price is not None]
+        asks = [o for o in orders if o.side == SELL and o.price is not None]
+        return clearing_price(
+            np.array([o.price for o in bids], dtype=np.int64),
+            np.array([o.remaining for o in bids], dtype=np.int64),
+            np.array([o.price for o in asks], dtype=np.int64),
+            np.array([o.remaining for o in asks], dtype=np.int64),
+            market_bid=sum(o.remaining for o in orders if o.side == BUY and o.price is None),
+            market_ask=sum(o.remaining for o in orders if o.side == SELL and o.price is None),
+            reference=self.last_price.get(collectible_id)
+        )
+    
+    def clear(self, collectible_id: str) -> Optional[Dict[str, Any]]:
+        """Run one auction: fill crossing orders at the uniform price"""
+        price, volume = self._clearing(collectible_id)
+        if self.journal is not None and collectible_id in self.orders:
+            self.journal.record_auction_clear(collectible_id, price if price is not None else -1, volume)
+        result = self._fill(collectible_id, price, volume)
+        if self.journal is not None and result is not None:
+            # Fills carry their trade ids so recovery can settle them again
+            self.journal.record_auction_result(result)
+        return result
+    
+    def _fill(self, collectible_id: str, price: Optional[int], volume: int) -> Optional[Dict[str, Any]]:
+        orders = self.orders.get(collectible_id, [])
+        fills: List[Dict[str, Any]] = []
+        
+        if price is not None and volume:
+            # Price-time priority; market orders first on each side
+            buys = sorted((o for o in orders if o.side == BUY and (o.price is None or o.price >= price)),
+                          key=lambda o: (o.price is not None, -(o.price or 0), o.timestamp))
+            sells = sorted((o for o in orders if o.side == SELL and (o.price is None or o.price <= price)),
+                           key=lambda o: (o.price is not None, o.price or 0, o.timestamp))
+            
+            remaining = volume
+            b = s = 0
+            while remaining and b < len(buys) and s < len(sells):
+                buy, sell = buys[b], sells[s]
+                quantity = min(buy.remaining, sell.remaining, remaining)
+                buy.remaining -= quantity
+                sell.remaining -= quantity
+                remaining -= quantity
+                fills.append({
+                    "trade_id": self.next_trade_id(),
+                    "buy_order_id": buy.order_id,
+                    "sell_order_id": sell.order_id,
+                    "buyer_id": buy.user_id,
+                    "seller_id": sell.user_id,
+                    "quantity": quantity
+                })
+                if not buy.remaining:
+                    b += 1
+                if not sell.remaining:
+                    s += 1
+            self.last_price[collectible_id] = price
+        
+        # Filled and market orders leave the book; limit remainders carry over
+        carried = []
+        for order in orders:
+            if order.remaining and order.order_type == LIMIT:
+                order.status = PARTIALLY_FILLED if order.remaining < order.quantity else OPEN
+                carried.append(order)
+            else:
+                order.status = FILLED if not order.remaining else CANCELLED
+                self._order_index.pop(order.order_id, None)
+        self.orders[collectible_id] = carried
+        
+        if not fills:
+            return None
+        return {
+            "collectible_id": collectible_id,
+            "price": from_ticks(price),
+            "volume": volume,
+            "fills": fills,
+            "cleared_at": time.time()
+        }
+    
+    def restore(self, order_id: int, user_id: str, collectible_id: str, side: str,
+                price: int, quantity: int) -> Order:
+        """Put back the quantity of a fill that did not settle
+        
+        An order still waiting gets the quantity added; one that has left
+        the book is queued again as a limit order at price (the clearing
+        price, which is within its original limit).
+        """
+        order = Order(order_id, user_id, collectible_id, side, LIMIT, price, quantity, time.time())
+        if self.journal is not None:
+            self.journal.record_auction_restore(order)
+        return self.replay_restore(order)
+    
+    def pending_orders(self) -> List[Order]:
+        """Orders waiting for a clearing, oldest first per collectible"""
+        return [order for orders in self.orders.values() for order in orders]
+    
+    # Recovery hooks used by app.market_journal
+    def replay_submit(self, order: Order):
+        self.orders.setdefault(order.collectible_id, []).append(order)
+        self._order_index[order.order_id] = order
+    
+    def replay_cancel(self, order_id: int):
+        order = self._order_index.pop(order_id, None)
+        if order is not None:
+            self.orders[order.collectible_id].remove(order)
+            order.status = CANCELLED
+    
+    def replay_restore(self, order: Order) -> Order:
+        pending = self._order_index.get(order.order_id)
+        if pending is not None:
+            pending.remaining += order.quantity
+            pending.status = PARTIALLY_FILLED if pending.remaining < pending.quantity else OPEN
+            return pending
+        self.replay_submit(order)
+        return order
+    
+    def replay_clear(self, collectible_id: str, price: int, volume: int):
+        """Re-apply a journaled clearing (at its recorded price) without notifying listeners"""
+        self._fill(collectible_id, price if price >= 0 else None, volume)
+    
+    def run(self) -> List[Dict[str, Any]]:
+        """Clear every auction-mode collectible and notify listeners"""
+        self.next_clear_at = time.time() + self.interval
+        results = []
+        for collectible_id in list(self.orders):
+            result = self.clear(collectible_id)
+            if result is not None:
+                results.append(result)
+        if results:
+            for listener in self._result_listeners:
+                listener(results)
+        return results
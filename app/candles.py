@@ -0,0 +1,172 @@
+"""
+OHLCV candles per collectible at 1m, 1h and 1d
+A collectible's candles are backfilled from price_history (aggregated in the
+database by price_candles(), off the event loop) the first time they are
+requested, then kept current by the price events that are also written to
+price_history: settled trades, auction clearings and price updates. Ticks
+published while the backfill runs are buffered and applied if newer than
+its cutoff. Requests slice the in-memory series by binary search, so their
+cost is proportional to the candles returned, not to the underlying ticks.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import os
+import time
+
+from app.market_feed import HISTORY_SOURCES
+
+CANDLE_INTERVALS = {"1m": 60, "1h": 3600, "1d": 86400}
+CANDLE_HISTORY_LIMIT = int(os.getenv("CANDLE_HISTORY_LIMIT", "1440"))
+
+class CandleSeries:
+    """Candles of one width as parallel lists sorted by bucket start"""
+    __slots__ = ("width", "starts", "opens", "highs", "lows", "closes", "volumes")
+    
+    def __init__(self, width: int):
+        self.width = width
+        self.starts: List[int] = []
+        self.opens: List[float] = []
+        self.highs: List[float] = []
+        self.lows: List[float] = []
+        self.closes: List[float] = []
+        self.volumes: List[int] = []
+    
+    def update(self, timestamp: float, price: float, quantity: int = 0):
+        start = int(timestamp) - int(timestamp) % self.width
+        if self.starts and self.starts[-1] == start:
+            i = len(self.starts) - 1
+        elif not self.starts or self.starts[-1] < start:
+            self._insert(len(self.starts), start, price)
+            i = len(self.starts) - 1
+        else:
+            # Late tick for an older bucket
+            i = bisect_left(self.starts, start)
+            if i == len(self.starts) or self.starts[i] != start:
+                self._insert(i, start, price)
+            self.highs[i] = max(self.highs[i], price)
+            self.lows[i] = min(self.lows[i], price)
+            self.volumes[i] += quantity
+            return
+        
+        if price > self.highs[i]:
+            self.highs[i] = price
+        if price < self.lows[i]:
+            self.lows[i] = price
+        self.closes[i] = price
+        self.volumes[i] += quantity
+    
+    def _insert(self, i: int, start: int, price: float):
+        self.starts.insert(i, start)
+        self.opens.insert(i, price)
+        self.highs.insert(i, price)
+        self.lows.insert(i, price)
+        self.closes.insert(i, price)
+        self.volumes.insert(i, 0)
+    
+    def trim(self, limit: int):
+        """Keep the newest limit candles (amortized: trims once 10% over)"""
+        excess = len(self.starts) - limit
+        if excess > limit // 10:
+            for column in (self.starts, self.opens, self.highs, self.lows, self.closes, self.volumes):
+                del column[:excess]
+    
+    def slice(self, start: Optional[float] = None, end: Optional[float] = None,
+              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Candles with start <= bucket start <= end, newest limit of them, oldest first"""
+        lo = bisect_left(self.starts, start) if start is not None else 0
+        hi = bisect_right(self.starts, end) if end is not None else len(self.starts)
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return [
+            {
+                "start": self.starts[i],
+                "open": self.opens[i],
+                "high": self.highs[i],
+                "low": self.lows[i],
+                "close": self.closes[i],
+                "volume": self.volumes[i]
+            }
+            for i in range(lo, hi)
+        ]
+
+class CandleStore:
+    """Lazily backfilled candle series for every collectible and interval"""
+    
+    def __init__(self, load_candles: Callable[[str, int, str, str], Optional[List[Dict[str, Any]]]],
+                 history_limit: int = CANDLE_HISTORY_LIMIT):
+        """load_candles(collectible_id, width, since, until) aggregates price_history (blocking)"""
+        self.load_candles = load_candles
+        self.history_limit = history_limit
+        self.series: Dict[str, Dict[str, CandleSeries]] = {}
+        self._loads: Dict[str, asyncio.Future] = {}
+        # Ticks published while a collectible is being backfilled
+        self._buffered: Dict[str, List[Tuple[float, float, int]]] = {}
+    
+    def record(self, event: Dict[str, Any]):
+        """Price feed listener; collectibles nobody has charted yet are skipped"""
+        if event["source"] not in HISTORY_SOURCES:
+            return
+        tick = (event["timestamp"], event["price"], event.get("quantity") or 0)
+        series = self.series.get(event["collectible_id"])
+        if series is None:
+            buffered = self._buffered.get(event["collectible_id"])
+            if buffered is not None:
+                buffered.append(tick)
+            return
+        for candles in series.values():
+            candles.update(*tick)
+            candles.trim(self.history_limit)
+    
+    async def candles(self, collectible_id: str, interval: str, start: Optional[float] = None,
+                      end: Optional[float] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        if interval not in CANDLE_INTERVALS:
+            raise ValueError(f"interval must be one of {', '.join(CANDLE_INTERVALS)}")
+        series = self.series.get(collectible_id)
+        if series is None:
+            load = self._loads.get(collectible_id)
+            if load is None:
+                self._buffered[collectible_id] = []
+                load = self._loads[collectible_id] = asyncio.ensure_future(self._load(collectible_id))
+            series = await asyncio.shield(load)
+        return series[interval].slice(start, end, limit)
+    
+    async def _load(self, collectible_id: str) -> Dict[str, CandleSeries]:
+        try:
+            until = time.time()
+            series = await asyncio.get_running_loop().run_in_executor(None, self._backfill, collectible_id, until)
+            if series is None:
+                raise RuntimeError("Price history unavailable")
+            # Ticks up to the cutoff were committed before they were published, so the backfill has them
+            for timestamp, price, quantity in self._buffered[collectible_id]:
+                if timestamp > until:
+                    for candles in series.values():
+                        candles.update(timestamp, price, quantity)
+            for candles in series.values():
+                candles.trim(self.history_limit)
+            self.series[collectible_id] = series
+            return series
+        finally:
+            del self._buffered[collectible_id]
+            del self._loads[collectible_id]
+    
+    def _backfill(self, collectible_id: str, until: float) -> Optional[Dict[str, CandleSeries]]:
+        """Aggregate history up to until per interval (blocking); None if the database is unavailable"""
+        series = {}
+        cutoff = datetime.fromtimestamp(until).astimezone().isoformat()
+        for interval, width in CANDLE_INTERVALS.items():
+            candles = series[interval] = CandleSeries(width)
+            since = datetime.fromtimestamp(until - width * self.history_limit).astimezone().isoformat()
+            rows = self.load_candles(collectible_id, width, since, cutoff)
+            if rows is None:
+                return None
+            for row in rows:
+                bucket = int(datetime.fromisoformat(row["bucket"]).timestamp())
+                candles.starts.append(bucket)
+                candles.opens.append(float(row["open"]))
+                candles.highs.append(float(row["high"]))
+                candles.lows.append(float(row["low"]))
+                candles.closes.append(float(row["close"]))
+                candles.volumes.append(int(row["volume"]))
+        return series
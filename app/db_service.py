@@ -4,16 +4,69 @@ Handles authentication, user management, and secure data operations
 """
 
 from app.database import supabase
-from app.auth import get_password_hash, verify_password, create_access_token
-from typing import Optional, List, Dict, Any
+from app.auth import get_password_hash, verify_password, verify_and_update_password, create_access_token
+from app.cache import LRUCache
+from app.batching import GroupCommitWriter
+from app.price_archive import price_archive, from_micros, to_micros
+from typing import Optional, List, Dict, Any, Iterator
+import asyncio
 import uuid
+import os
 from datetime import datetime
 
+# Columns needed to authenticate; served by the idx_users_login covering index
+LOGIN_COLUMNS = "id, email, username, password_hash"
+LOGIN_CACHE_SIZE = int(os.getenv("LOGIN_CACHE_SIZE", "1024"))
+LOGIN_CACHE_TTL_SECONDS = float(os.getenv("LOGIN_CACHE_TTL_SECONDS", "300"))
+
+# Columns and page size for streamed transaction exports
+EXPORT_COLUMNS = ["id", "created_at", "transaction_type", "amount", "collectible_id", "description"]
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+
+# Group commit for transaction inserts (batch size 1 disables batching)
+TRANSACTION_BATCH_SIZE = int(os.getenv("TRANSACTION_BATCH_SIZE", "100"))
+TRANSACTION_BATCH_DELAY_MS = float(os.getenv("TRANSACTION_BATCH_DELAY_MS", "5"))
+
+# Error codes raised by the purchase/transfer stored procedures
+OPERATION_ERRORS = {
+    "insufficient_balance": "Insufficient balance",
+    "insufficient_units": "Insufficient units",
+    "collectible_not_found": "Collectible not found",
+    "recipient_not_found": "Recipient not found",
+    "invalid_recipient": "Cannot transfer to yourself",
+    "invalid_amount": "Amount must be positive",
+    "balance_not_found": "Balance not found",
+    "pool_not_found": "Pool not found",
+    "pool_exists": "Pool already exists for this collectible",
+    "invalid_side": "side must be 'buy' or 'sell'",
+    "slippage_exceeded": "Output below min_amount_out",
+    "price_changed": "Price changed, please retry",
+}
+
+def _operation_error(e: Exception) -> str:
+    """Translate a stored procedure exception into a client-facing message"""
+    message = str(e)
+    for code, text in OPERATION_ERRORS.items():
+        if code in message:
+            return text
+    return message
+
+def normalize_email(email: str) -> str:
+    """Canonical form used as the login lookup key"""
+    return email.strip().lower()
+
 class DatabaseService:
     """Production-ready database service with RLS support"""
     
     def __init__(self):
         self.supabase = supabase
+        self._login_cache = LRUCache(maxsize=LOGIN_CACHE_SIZE, ttl=LOGIN_CACHE_TTL_SECONDS)
+        self._transaction_writer = GroupCommitWriter(
+            self._insert_transactions,
+            max_batch_size=TRANSACTION_BATCH_SIZE,
+            max_delay_ms=TRANSACTION_BATCH_DELAY_MS,
+            name="transaction-writer"
+        )
     
     # Authentication Methods
     def set_test_user_context(self, user_id: str):
@@ -69,8 +122,10 @@ class DatabaseService:
     async def create_user_with_jwt(self, email: str, password: str, username: str) -> Dict[str, Any]:
         """Create a new user with JWT authentication (local database)"""
         try:
+            email = normalize_email(email)
+            
             # Check if user already exists
-            existing_user = self.supabase.table("users").select("*").eq("email", email).execute()
+            existing_user = self.supabase.table("users").select("id").eq("email", email).execute()
             if existing_user.data:
                 return {"success": False, "error": "User already exists"}
             
@@ -114,18 +169,22 @@ class DatabaseService:
     async def authenticate_user_with_jwt(self, email: str, password: str) -> Dict[str, Any]:
         """Authenticate user with email/password and return JWT token"""
         try:
-            # Get user from database
-            user_response = self.supabase.table("users").select("*").eq("email", email).execute()
+            email = normalize_email(email)
+            user = self._get_login_record(email)
             
-            if not user_response.data:
+            if not user:
                 return {"success": False, "error": "User not found"}
             
-            user = user_response.data[0]
-            
             # Verify password
-            if not verify_password(password, user["password_hash"]):
+            valid, new_hash = verify_and_update_password(password, user["password_hash"])
+            if not valid:
                 return {"success": False, "error": "Invalid password"}
             
+            # Transparently rehash if the stored cost differs from this host's setting
+            # (failures are logged and retried on the next login)
+            if new_hash:
+                self.update_password_hash(user["id"], email, new_hash)
+            
             # Generate JWT token
             access_token = create_access_token(data={"sub": user["id"], "email": email})
             
@@ -143,6 +202,37 @@ class DatabaseService:
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def _get_login_record(self, email: str) -> Optional[Dict[str, Any]]:
+        """Fetch the narrow login row for a normalized email, via the login cache"""
+        user = self._login_cache.get(email)
+        if user is not None:
+            return user
+        
+        response = self.supabase.table("users").select(LOGIN_COLUMNS).eq("email", email).limit(1).execute()
+        if not response.data:
+            return None
+        
+        user = response.data[0]
+        self._login_cache.set(email, user)
+        return user
+    
+    def invalidate_login_cache(self, email: str):
+        """Forget a cached login record (call whenever a password changes)"""
+        self._login_cache.invalidate(normalize_email(email))
+    
+    def update_password_hash(self, user_id: str, email: str, new_hash: str) -> bool:
+        """Replace a user's stored password hash and drop their cached login record"""
+        try:
+            response = self.supabase.table("users").update({
+                "password_hash": new_hash
+            }).eq("id", user_id).execute()
+            return len(response.data) > 0
+        except Exception as e:
+            print(f"Error updating password hash: {e}")
+            return False
+        finally:
+            self.invalidate_login_cache(email)
+
     async def create_user(self, email: str, password: str, username: str) -> Dict[str, Any]:
         """Create a new user with authentication"""
         try:
@@ -253,26 +343,232 @@ class DatabaseService:
             return None
     
     def update_user_balance(self, user_id: str, new_balance: float) -> bool:
-        """Update user's balance (user can only update their own)"""
+        """Set user's balance by posting an adjustment journal to the ledger"""
+        result = self.set_user_balance(user_id, new_balance)
+        if not result["success"]:
+            print(f"Error updating balance: {result['error']}")
+        return result["success"]
+    
+    def set_user_balance(self, user_id: str, new_balance: float) -> Dict[str, Any]:
+        """Like update_user_balance, also returning the adjustment posted"""
         try:
-            response = self.supabase.table("token_balances").update({
-                "balance": new_balance,
-                "last_updated": datetime.now().isoformat()
-            }).eq("user_id", user_id).execute()
-            return len(response.data) > 0
+            response = self.supabase.rpc("ledger_set_balance", {
+                "p_user_id": user_id,
+                "p_new_balance": new_balance
+            }).execute()
+            return {"success": True, "adjustment": float(response.data)}
+        except Exception as e:
+            return {"success": False, "error": _operation_error(e)}
+    
+    # Ledger Methods
+    def get_balance_at(self, account_id: str, at: datetime) -> Optional[float]:
+        """Balance of a ledger account at a point in time (snapshot + entry tail)"""
+        try:
+            response = self.supabase.rpc("ledger_balance_at", {
+                "p_account_id": account_id,
+                "p_at": at.isoformat()
+            }).execute()
+            return float(response.data) if response.data is not None else 0.0
+        except Exception as e:
+            print(f"Error fetching balance at {at}: {e}")
+            return None
+    
+    def get_account_balance(self, account_id: str) -> Optional[float]:
+        """Current ledger balance of any account, including hot-account slots"""
+        try:
+            response = self.supabase.rpc("ledger_account_balance", {
+                "p_account_id": account_id
+            }).execute()
+            return float(response.data) if response.data is not None else 0.0
+        except Exception as e:
+            print(f"Error fetching account balance: {e}")
+            return None
+    
+    def configure_hot_account(self, account_id: str, slots: int) -> bool:
+        """Spread a house account across slots (slots <= 1 turns sharding off)"""
+        try:
+            self.supabase.rpc("ledger_configure_hot_account", {
+                "p_account_id": account_id,
+                "p_slots": slots
+            }).execute()
+            return True
         except Exception as e:
-            print(f"Error updating balance: {e}")
+            print(f"Error configuring hot account: {e}")
             return False
     
+    def consolidate_hot_accounts(self) -> int:
+        """Fold hot-account slot balances back into their ledger balance rows"""
+        try:
+            response = self.supabase.rpc("ledger_consolidate_hot_accounts", {}).execute()
+            return response.data or 0
+        except Exception as e:
+            print(f"Error consolidating hot accounts: {e}")
+            return 0
+    
+    def take_ledger_snapshots(self) -> int:
+        """Snapshot every ledger account that moved since its last snapshot"""
+        try:
+            response = self.supabase.rpc("ledger_take_snapshots", {}).execute()
+            return response.data or 0
+        except Exception as e:
+            print(f"Error taking ledger snapshots: {e}")
+            return 0
+    
+    def reconcile_ledger(self) -> List[Dict[str, Any]]:
+        """Accounts whose materialized balance disagrees with the replayed ledger"""
+        try:
+            response = self.supabase.rpc("ledger_reconcile", {}).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error reconciling ledger: {e}")
+            return []
+    
+    def _insert_transactions(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Multi-row insert used by the transaction group-commit writer"""
+        response = self.supabase.table("transactions").insert(rows).execute()
+        return response.data
+    
     def create_transaction(self, transaction_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Create new transaction (user can only create their own)"""
         try:
-            response = self.supabase.table("transactions").insert(transaction_data).execute()
-            return response.data[0] if response.data else None
+            if TRANSACTION_BATCH_SIZE <= 1:
+                return self._insert_transactions([transaction_data])[0]
+            return self._transaction_writer.write(transaction_data)
+        except Exception as e:
+            print(f"Error creating transaction: {e}")
+            return None
+    
+    async def create_transaction_batched(self, transaction_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Create new transaction without blocking the event loop while its batch commits"""
+        try:
+            if TRANSACTION_BATCH_SIZE <= 1:
+                rows = await asyncio.get_running_loop().run_in_executor(
+                    None, self._insert_transactions, [transaction_data]
+                )
+                return rows[0]
+            return await asyncio.wrap_future(self._transaction_writer.submit(transaction_data))
         except Exception as e:
             print(f"Error creating transaction: {e}")
             return None
     
+    def purchase_collectible(self, user_id: str, collectible_id: str, description: Optional[str] = None,
+                             max_price: Optional[float] = None) -> Dict[str, Any]:
+        """Debit the collectible's current price (refused above max_price) and record the purchase atomically"""
+        try:
+            response = self.supabase.rpc("purchase_collectible", {
+                "p_user_id": user_id,
+                "p_collectible_id": collectible_id,
+                "p_description": description,
+                "p_max_price": max_price
+            }).execute()
+            return {"success": True, **response.data}
+        except Exception as e:
+            return {"success": False, "error": _operation_error(e)}
+    
+    def transfer_tokens(self, from_user_id: str, to_user_id: str, amount: float,
+                        description: Optional[str] = None) -> Dict[str, Any]:
+        """Move tokens between two users and record both legs atomically"""
+        try:
+            response = self.supabase.rpc("transfer_tokens", {
+                "p_from_user_id": from_user_id,
+                "p_to_user_id": to_user_id,
+                "p_amount": amount,
+                "p_description": description
+            }).execute()
+            return {"success": True, **response.data}
+        except Exception as e:
+            return {"success": False, "error": _operation_error(e)}
+    
+    def create_amm_pool(self, user_id: str, collectible_id: str, token_reserve: float,
+                        unit_reserve: float, fee_bps: int) -> Dict[str, Any]:
+        """Open a constant-product pool funded from the user's balance"""
+        try:
+            response = self.supabase.rpc("amm_create_pool", {
+                "p_user_id": user_id,
+                "p_collectible_id": collectible_id,
+                "p_token_reserve": token_reserve,
+                "p_unit_reserve": unit_reserve,
+                "p_fee_bps": fee_bps
+            }).execute()
+            return {"success": True, "pool": response.data}
+        except Exception as e:
+            return {"success": False, "error": _operation_error(e)}
+    
+    def amm_swap(self, user_id: str, collectible_id: str, side: str, amount_in: float,
+                 min_amount_out: float = 0) -> Dict[str, Any]:
+        """Swap against a pool; reserves, balance and transaction change atomically"""
+        try:
+            response = self.supabase.rpc("amm_swap", {
+                "p_user_id": user_id,
+                "p_collectible_id": collectible_id,
+                "p_side": side,
+                "p_amount_in": amount_in,
+                "p_min_amount_out": min_amount_out
+            }).execute()
+            return {"success": True, **response.data}
+        except Exception as e:
+            return {"success": False, "error": _operation_error(e)}
+    
+    def get_amm_pools(self) -> List[Dict[str, Any]]:
+        """All AMM pools with their current reserves"""
+        try:
+            response = self.supabase.table("amm_pools").select(
+                "collectible_id, token_reserve, unit_reserve, fee_bps"
+            ).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error fetching AMM pools: {e}")
+            return []
+    
+    def record_trade(self, trade: Dict[str, Any]) -> Dict[str, Any]:
+        """Settle a matched trade (balances, units, both transactions, price history) atomically
+        
+        Idempotent on trade_id: a trade already settled returns "duplicate".
+        """
+        try:
+            response = self.supabase.rpc("record_trade", {
+                "p_collectible_id": trade["collectible_id"],
+                "p_buyer_id": trade["buyer_id"],
+                "p_seller_id": trade["seller_id"],
+                "p_price": trade["price"],
+                "p_quantity": trade["quantity"],
+                "p_trade_id": trade["trade_id"]
+            }).execute()
+            return {"success": True, **response.data}
+        except Exception as e:
+            return {"success": False, "error": _operation_error(e)}
+    
+    def settle_auction(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Settle the fills of a call auction and record its clearing price and settled volume once
+        
+        Fills whose trade_id is already settled come back in "duplicates".
+        """
+        try:
+            response = self.supabase.rpc("settle_auction", {
+                "p_collectible_id": result["collectible_id"],
+                "p_price": result["price"],
+                "p_fills": result["fills"]
+            }).execute()
+            if response.data["skipped"]:
+                print(f"Auction {result['collectible_id']}: skipped {len(response.data['skipped'])} unfunded fills")
+            return {"success": True, **response.data}
+        except Exception as e:
+            return {"success": False, "error": _operation_error(e)}
+    
+    def get_settled_trade_ids(self, trade_ids: List[int]) -> Optional[set]:
+        """Which of these matching engine trade ids are already settled; None if the query failed"""
+        try:
+            settled = set()
+            for start in range(0, len(trade_ids), EXPORT_PAGE_SIZE):
+                response = self.supabase.table("market_trades").select("trade_id").in_(
+                    "trade_id", trade_ids[start:start + EXPORT_PAGE_SIZE]
+                ).execute()
+                settled.update(row["trade_id"] for row in response.data)
+            return settled
+        except Exception as e:
+            print(f"Error fetching settled trades: {e}")
+            return None
+    
     def get_user_transactions(self, user_id: str) -> List[Dict[str, Any]]:
         """Get user's transactions (user can only see their own)"""
         try:
@@ -284,20 +580,228 @@ class DatabaseService:
             print(f"Error fetching transactions: {e}")
             return []
     
+    def iter_transaction_pages(self, columns: List[str], user_id: Optional[str] = None,
+                               after: Optional[Dict[str, Any]] = None, until: Optional[str] = None,
+                               page_size: int = EXPORT_PAGE_SIZE,
+                               ledger_posted: Optional[bool] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Yield transactions oldest first as keyset pages on (created_at, id)
+        
+        after is the last row already seen (needs created_at and id) and until
+        bounds created_at from above; ledger_posted keeps only rows that did
+        (or did not) move a balance through the ledger. Iteration ends on an
+        empty page, so a PostgREST max-rows cap below page_size cannot
+        truncate the result.
+        """
+        columns = list(dict.fromkeys(columns + ["created_at", "id"]))
+        last = after
+        while True:
+            query = self.supabase.table("transactions").select(", ".join(columns))
+            if user_id is not None:
+                query = query.eq("user_id", user_id)
+            if until is not None:
+                query = query.lte("created_at", until)
+            if ledger_posted is not None:
+                query = query.eq("ledger_posted", ledger_posted)
+            if last is not None:
+                # (created_at, id) > last row, so ties on created_at are not skipped
+                created_at = last["created_at"]
+                query = query.or_(
+                    f'created_at.gt."{created_at}",'
+                    f'and(created_at.eq."{created_at}",id.gt.{last["id"]})'
+                )
+            response = query.order("created_at").order("id").limit(page_size).execute()
+            
+            if not response.data:
+                return
+            yield response.data
+            last = response.data[-1]
+    
+    def iter_balance_pages(self, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """Yield every token_balances row as keyset pages on user_id"""
+        last_user_id = None
+        while True:
+            query = self.supabase.table("token_balances").select("user_id, balance, last_updated")
+            if last_user_id is not None:
+                query = query.gt("user_id", last_user_id)
+            response = query.order("user_id").limit(page_size).execute()
+            
+            if not response.data:
+                return
+            yield response.data
+            last_user_id = response.data[-1]["user_id"]
+    
+    def iter_opening_balance_pages(self, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """Yield ledger opening balances (no transactions row behind them) as keyset pages on user_id"""
+        last_user_id = None
+        while True:
+            response = self.supabase.rpc("ledger_opening_balances", {
+                "p_after": last_user_id,
+                "p_limit": page_size
+            }).execute()
+            
+            if not response.data:
+                return
+            yield response.data
+            last_user_id = response.data[-1]["user_id"]
+    
+    def iter_user_transactions(self, user_id: str, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+        """Yield all of a user's transactions oldest first, one keyset page at a time"""
+        for page in self.iter_transaction_pages(EXPORT_COLUMNS, user_id=user_id, page_size=page_size):
+            yield from page
+    
+    def get_transaction_summary(self, user_id: str) -> Dict[str, Any]:
+        """Totals per type and per month from the incrementally maintained aggregates"""
+        try:
+            response = self.supabase.table("transaction_summaries").select(
+                "transaction_type, month, total_amount, transaction_count"
+            ).eq("user_id", user_id).execute()
+        except Exception as e:
+            print(f"Error fetching transaction summary: {e}")
+            return {}
+        
+        by_type: Dict[str, Dict[str, Any]] = {}
+        by_month: Dict[str, Dict[str, Any]] = {}
+        total_amount = 0.0
+        total_count = 0
+        for row in response.data:
+            amount = float(row["total_amount"])
+            count = row["transaction_count"]
+            for bucket in (by_type.setdefault(row["transaction_type"], {"total": 0.0, "count": 0}),
+                           by_month.setdefault(row["month"][:7], {"total": 0.0, "count": 0})):
+                bucket["total"] += amount
+                bucket["count"] += count
+            total_amount += amount
+            total_count += count
+        
+        return {
+            "total": total_amount,
+            "count": total_count,
+            "by_type": by_type,
+            "by_month": dict(sorted(by_month.items()))
+        }
+    
     # Price History Methods (Public Read)
-    def get_price_history(self, collectible_id: str) -> List[Dict[str, Any]]:
-        """Get price history for a collectible (public access)"""
+    @staticmethod
+    def _price_keyset(op: str, row: Dict[str, Any]) -> str:
+        """or-filter for rows after (gt) or before (lt) row on (recorded_at, id), so ties are not skipped"""
+        recorded_at = row["recorded_at"]
+        return f'recorded_at.{op}."{recorded_at}",and(recorded_at.eq."{recorded_at}",id.{op}.{row["id"]})'
+    
+    @staticmethod
+    def _history_row(row: Dict[str, Any]) -> Dict[str, Any]:
+        """A price_history row in the shape archived rows have"""
+        return {
+            "collectible_id": row["collectible_id"],
+            "price": float(row["price"]),
+            "quantity": row.get("quantity"),
+            "recorded_at": from_micros(to_micros(row["recorded_at"]))
+        }
+    
+    @staticmethod
+    def _after_price(query, last: Dict[str, Any]):
+        """price_history rows after last on (recorded_at, id)"""
+        return query.or_(DatabaseService._price_keyset("gt", last))
+    
+    def get_price_history(self, collectible_id: str, start: Optional[str] = None, end: Optional[str] = None,
+                          limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get price history for a collectible (public access)
+        
+        start/end bound recorded_at (inclusive) and limit keeps the newest
+        rows. Rows past the local archive's watermark come from the database,
+        older ones from the archive, newest first. Every row has the
+        archive's shape (collectible_id, price, quantity, UTC recorded_at;
+        no id). Database rows are read in keyset pages, so no page exceeds
+        the server's max-rows cap.
+        """
         try:
-            response = self.supabase.table("price_history").select("*").eq(
+            # One file for both the watermark and the rows, even if an export replaces it meanwhile
+            archive = price_archive.open(collectible_id)
+            watermark = archive.watermark if archive is not None else None
+            rows: List[Dict[str, Any]] = []
+            while limit is None or len(rows) < limit:
+                query = self.supabase.table("price_history").select("*").eq(
+                    "collectible_id", collectible_id
+                )
+                if start is not None:
+                    query = query.gte("recorded_at", start)
+                if end is not None:
+                    query = query.lte("recorded_at", end)
+                bounds = [self._price_keyset("gt", watermark)] if watermark is not None else []
+                if rows:
+                    bounds.append(self._price_keyset("lt", rows[-1]))
+                if bounds:
+                    query = query.or_("and(" + ",".join(f"or({bound})" for bound in bounds) + ")")
+                page_size = EXPORT_PAGE_SIZE if limit is None else min(EXPORT_PAGE_SIZE, limit - len(rows))
+                page = query.order("recorded_at", desc=True).order("id", desc=True).limit(page_size).execute().data
+                if not page:
+                    break
+                rows.extend(page)
+            
+            rows = [self._history_row(row) for row in rows]
+            if archive is None or (limit is not None and len(rows) >= limit):
+                return rows
+            return rows + archive.rows(
+                collectible_id,
+                start=to_micros(start) if start is not None else None,
+                end=to_micros(end) if end is not None else None,
+                limit=limit - len(rows) if limit is not None else None
+            )
+        except Exception as e:
+            print(f"Error fetching price history: {e}")
+            return []
+    
+    def get_recent_prices(self, collectible_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Latest price_history rows for a collectible, newest first"""
+        try:
+            response = self.supabase.table("price_history").select("price, recorded_at").eq(
                 "collectible_id", collectible_id
-            ).order("recorded_at", desc=True).execute()
+            ).order("recorded_at", desc=True).limit(limit).execute()
             return response.data
         except Exception as e:
-            print(f"Error fetching price history: {e}")
+            print(f"Error fetching recent prices: {e}")
             return []
     
-    def add_price_record(self, collectible_id: str, price: float) -> bool:
-        """Add price record (requires authentication)"""
+    def iter_price_pages(self, collectible_id: str, after: Optional[Dict[str, Any]] = None,
+                         until: Optional[str] = None,
+                         page_size: int = EXPORT_PAGE_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """Yield a collectible's price_history oldest first as keyset pages on (recorded_at, id)
+        
+        after is the last row already seen (needs recorded_at and id) and
+        until bounds recorded_at from above.
+        """
+        last = after
+        while True:
+            query = self.supabase.table("price_history").select("id, price, quantity, recorded_at").eq(
+                "collectible_id", collectible_id
+            )
+            if until is not None:
+                query = query.lte("recorded_at", until)
+            if last is not None:
+                query = self._after_price(query, last)
+            response = query.order("recorded_at").order("id").limit(page_size).execute()
+            
+            if not response.data:
+                return
+            yield response.data
+            last = response.data[-1]
+    
+    def get_price_candles(self, collectible_id: str, interval_seconds: int, since: str,
+                          until: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """OHLCV buckets aggregated from price_history; None if the query failed"""
+        try:
+            response = self.supabase.rpc("price_candles", {
+                "p_collectible_id": collectible_id,
+                "p_interval_seconds": interval_seconds,
+                "p_since": since,
+                "p_until": until
+            }).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error fetching price candles: {e}")
+            return None
+    
+    def add_price_record(self, collectible_id: str, price: float) -> Optional[str]:
+        """Add price record (requires authentication); returns its recorded_at"""
         try:
             price_data = {
                 "collectible_id": collectible_id,
@@ -310,10 +814,47 @@ class DatabaseService:
                 "current_price": price
             }).eq("id", collectible_id).execute()
             
-            return len(response.data) > 0
+            return response.data[0]["recorded_at"] if response.data else None
         except Exception as e:
             print(f"Error adding price record: {e}")
-            return False
+            return None
+    
+    # Reservation Methods
+    def apply_reservation_ops(self, ops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Batch writer for app.reservations; one result per operation, in order"""
+        response = self.supabase.rpc("reservations_apply", {"p_ops": ops}).execute()
+        return response.data
+    
+    def get_active_reservations(self) -> List[Dict[str, Any]]:
+        """Holds not yet released or settled"""
+        try:
+            response = self.supabase.table("balance_reservations").select(
+                "id, user_id, purpose, reference, amount"
+            ).eq("status", "held").execute()
+            return response.data
+        except Exception as e:
+            print(f"Error fetching reservations: {e}")
+            return []
+    
+    def get_balance_amount(self, user_id: str) -> Optional[float]:
+        """Just the balance figure, for the reservation cache"""
+        try:
+            response = self.supabase.table("token_balances").select("balance").eq("user_id", user_id).execute()
+            return float(response.data[0]["balance"]) if response.data else None
+        except Exception as e:
+            print(f"Error fetching balance: {e}")
+            return None
+    
+    def get_holding_units(self, user_id: str, collectible_id: str) -> Optional[float]:
+        """Units of a collectible the user holds (0 without a holdings row)"""
+        try:
+            response = self.supabase.table("collectible_holdings").select("units").eq(
+                "user_id", user_id
+            ).eq("collectible_id", collectible_id).execute()
+            return float(response.data[0]["units"]) if response.data else 0.0
+        except Exception as e:
+            print(f"Error fetching holdings: {e}")
+            return None
     
     # Referral Methods (RLS Protected)
     def create_referral(self, referrer_id: str, referred_id: str, bonus_amount: float) -> Optional[Dict[str, Any]]:
@@ -0,0 +1,76 @@
+"""
+Idempotency-Key support for mutating endpoints
+Caches each (user, key) result so client retries replay the first response
+instead of writing again. The store is per-process.
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+
+from app.cache import LRUCache
+
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+
+class IdempotencyKeyReused(Exception):
+    """Raised when a key is replayed with a different request payload"""
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of a request payload"""
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+class IdempotencyStore:
+    """Bounded key -> response store with TTL expiry and in-flight deduplication"""
+    
+    def __init__(self, maxsize: int = IDEMPOTENCY_CACHE_SIZE, ttl: float = IDEMPOTENCY_TTL_SECONDS):
+        self._results = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._in_flight: Dict[Hashable, Tuple[str, asyncio.Future]] = {}
+    
+    async def run(self, user_id: str, key: Optional[str], payload: Any,
+                  operation: Callable[[], Awaitable[Any]]) -> Any:
+        """Run operation once per (user_id, key); concurrent and later retries share its result"""
+        if not key:
+            return await operation()
+        
+        cache_key = (user_id, key)
+        request_hash = fingerprint(payload)
+        
+        cached = self._results.get(cache_key)
+        if cached is not None:
+            cached_hash, result = cached
+            if cached_hash != request_hash:
+                raise IdempotencyKeyReused(key)
+            return result
+        
+        pending = self._in_flight.get(cache_key)
+        if pending is not None:
+            pending_hash, future = pending
+            if pending_hash != request_hash:
+                raise IdempotencyKeyReused(key)
+            return await asyncio.shield(future)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[cache_key] = (request_hash, future)
+        try:
+            result = await operation()
+        except BaseException as e:
+            # Failures are not cached; waiters see the same error and a
+            # later retry runs the operation again
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                future.exception()
+            else:
+                future.cancel()
+            raise
+        else:
+            self._results.set(cache_key, (request_hash, result))
+            future.set_result(result)
+            return result
+        finally:
+            self._in_flight.pop(cache_key, None)
+
+# Global instance
+idempotency_store = IdempotencyStore()
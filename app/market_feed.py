@@ -0,0 +1,219 @@
+"""
+In-process market data feed
+Price events from the write path (price updates, settled trades and call
+auction clearings) are fanned out to subscribers per collectible topic. A
+subscription only keeps the latest undelivered event per collectible, so a
+slow consumer is conflated to the current price instead of queueing every
+tick, and an idle subscriber costs one small object and no task wake-ups.
+
+Event ids are "<epoch>-<seq>" where epoch identifies this process, so a
+client resuming with Last-Event-ID only receives collectibles that changed
+since, and everything after a restart.
+
+Level-2 depth uses the same fan-out: a depth subscriber first gets a
+snapshot of the book, then deltas carrying the new quantity of every changed
+level. A slow depth subscriber's pending deltas are merged level by level,
+which is still a valid delta (or snapshot) for the client to apply.
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+import asyncio
+import os
+import threading
+import time
+
+from app.matching_engine import matching_engine, from_ticks
+
+MARKET_FEED_MAX_TOPICS = int(os.getenv("MARKET_FEED_MAX_TOPICS", "100"))
+MARKET_FEED_HEARTBEAT_SECONDS = float(os.getenv("MARKET_FEED_HEARTBEAT_SECONDS", "15"))
+MARKET_FEED_RETRY_MS = int(os.getenv("MARKET_FEED_RETRY_MS", "3000"))
+MARKET_DEPTH_FEED_LEVELS = int(os.getenv("MARKET_DEPTH_FEED_LEVELS", "50"))
+
+# Sources whose events are also rows of price_history (AMM spot prices are not)
+HISTORY_SOURCES = frozenset(("trade", "auction", "price_update"))
+
+class Subscription:
+    """One consumer's topics and its latest undelivered event per collectible"""
+    __slots__ = ("topics", "pending", "conflated", "_ready")
+    
+    def __init__(self):
+        self.topics: Set[str] = set()
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        # Events replaced before delivery
+        self.conflated = 0
+        self._ready = asyncio.Event()
+    
+    def push(self, event: Dict[str, Any]):
+        if event["collectible_id"] in self.pending:
+            self.conflated += 1
+        self.pending[event["collectible_id"]] = event
+        self._ready.set()
+    
+    async def next_batch(self) -> List[Dict[str, Any]]:
+        """Wait for updates, then take the latest event of each collectible"""
+        await self._ready.wait()
+        self._ready.clear()
+        events = sorted(self.pending.values(), key=lambda event: event["seq"])
+        self.pending = {}
+        return events
+
+def _merge_levels(old: List[List[float]], new: List[List[float]], descending: bool,
+                  drop_empty: bool) -> List[List[float]]:
+    levels = dict(old)
+    levels.update(new)
+    return [[price, quantity] for price, quantity in sorted(levels.items(), reverse=descending)
+            if quantity or not drop_empty]
+
+class DepthSubscription(Subscription):
+    """Subscription whose pending depth updates are merged rather than replaced"""
+    __slots__ = ()
+    
+    def push(self, event: Dict[str, Any]):
+        pending = self.pending.get(event["collectible_id"])
+        if pending is not None:
+            self.conflated += 1
+            is_snapshot = pending["type"] == "snapshot"
+            event = {
+                **event,
+                "type": pending["type"],
+                "bids": _merge_levels(pending["bids"], event["bids"], True, is_snapshot),
+                "asks": _merge_levels(pending["asks"], event["asks"], False, is_snapshot)
+            }
+            if is_snapshot:
+                del event["prev_seq"]
+            else:
+                event["prev_seq"] = pending["prev_seq"]
+        self.pending[event["collectible_id"]] = event
+        self._ready.set()
+
+class TopicFeed:
+    """Fan-out of events to subscriptions, one topic per collectible"""
+    
+    def __init__(self, max_topics: int = MARKET_FEED_MAX_TOPICS):
+        self.max_topics = max_topics
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+    
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """Deliver events on loop; publishes from other threads are handed over to it"""
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+    
+    def subscribe(self, subscription: Subscription, collectible_ids: Iterable[str], after_seq: int = 0):
+        """Add topics; the current state of each (if newer than after_seq) is queued at once"""
+        for collectible_id in collectible_ids:
+            if collectible_id in subscription.topics:
+                continue
+            if len(subscription.topics) >= self.max_topics:
+                raise ValueError(f"At most {self.max_topics} collectibles per subscription")
+            subscription.topics.add(collectible_id)
+            self._subscribers.setdefault(collectible_id, set()).add(subscription)
+            self._push_current(subscription, collectible_id, after_seq)
+    
+    def _push_current(self, subscription: Subscription, collectible_id: str, after_seq: int):
+        """Queue a topic's current state for a new subscriber"""
+    
+    def unsubscribe(self, subscription: Subscription, collectible_ids: Optional[Iterable[str]] = None):
+        """Drop the given topics, or all of them"""
+        for collectible_id in list(collectible_ids if collectible_ids is not None else subscription.topics):
+            subscription.topics.discard(collectible_id)
+            subscription.pending.pop(collectible_id, None)
+            subscribers = self._subscribers.get(collectible_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[collectible_id]
+    
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+    
+    def _handoff(self, event: Dict[str, Any]):
+        if self._loop is not None and threading.get_ident() != self._loop_thread:
+            self._loop.call_soon_threadsafe(self._dispatch, event)
+        else:
+            self._dispatch(event)
+    
+    def _dispatch(self, event: Dict[str, Any]):
+        for subscription in self._subscribers.get(event["collectible_id"], ()):
+            subscription.push(event)
+
+class PriceFeed(TopicFeed):
+    """Last price per collectible, from price updates, trades and auctions"""
+    
+    def __init__(self, max_topics: int = MARKET_FEED_MAX_TOPICS):
+        super().__init__(max_topics)
+        self.latest: Dict[str, Dict[str, Any]] = {}
+        self.seq = 0
+        self.epoch = format(int(time.time() * 1000), "x")
+        self._listeners: List[Callable[[Dict[str, Any]], Any]] = []
+    
+    def add_listener(self, listener: Callable[[Dict[str, Any]], Any]):
+        """Call listener with every price event, on the loop thread, before fan-out"""
+        self._listeners.append(listener)
+    
+    def event_id(self, event: Dict[str, Any]) -> str:
+        return f"{self.epoch}-{event['seq']}"
+    
+    def resume_after(self, last_event_id: Optional[str]) -> int:
+        """Sequence number a client has seen, or 0 if the id is from another process"""
+        epoch, _, seq = (last_event_id or "").partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return 0
+        return int(seq)
+    
+    def _push_current(self, subscription: Subscription, collectible_id: str, after_seq: int):
+        latest = self.latest.get(collectible_id)
+        if latest is not None and latest["seq"] > after_seq:
+            subscription.push(latest)
+    
+    # Publishing
+    def publish(self, collectible_id: str, price: float, source: str,
+                quantity: Optional[int] = None, timestamp: Optional[float] = None):
+        event = {
+            "collectible_id": collectible_id,
+            "price": price,
+            "quantity": quantity,
+            "source": source,
+            "timestamp": timestamp if timestamp is not None else time.time()
+        }
+        self._handoff(event)
+    
+    def publish_trade(self, trade: Any, recorded_at: str):
+        """Publish a settled trade, stamped with its price_history time"""
+        self.publish(trade.collectible_id, from_ticks(trade.price), "trade",
+                     quantity=trade.quantity, timestamp=datetime.fromisoformat(recorded_at).timestamp())
+    
+    def publish_auction(self, result: Dict[str, Any], volume: int, recorded_at: str):
+        """Publish a settled call auction with the volume that actually settled"""
+        self.publish(result["collectible_id"], result["price"], "auction",
+                     quantity=volume, timestamp=datetime.fromisoformat(recorded_at).timestamp())
+    
+    def _dispatch(self, event: Dict[str, Any]):
+        # Sequence numbers are assigned on the loop thread so they follow delivery order
+        self.seq += 1
+        event["seq"] = self.seq
+        self.latest[event["collectible_id"]] = event
+        for listener in self._listeners:
+            listener(event)
+        super()._dispatch(event)
+
+class DepthFeed(TopicFeed):
+    """Level-2 snapshots and deltas of the matching engine's books"""
+    
+    def __init__(self, snapshot: Callable[[str, int], Dict[str, Any]],
+                 levels: int = MARKET_DEPTH_FEED_LEVELS, max_topics: int = MARKET_FEED_MAX_TOPICS):
+        super().__init__(max_topics)
+        self.snapshot = snapshot
+        self.levels = levels
+    
+    def _push_current(self, subscription: Subscription, collectible_id: str, after_seq: int):
+        subscription.push({**self.snapshot(collectible_id, self.levels), "type": "snapshot"})
+    
+    def publish_depth(self, delta: Dict[str, Any]):
+        """Depth listener for the matching engine"""
+        self._handoff({**delta, "type": "delta"})
+
+# Global instances
+price_feed = PriceFeed()
+depth_feed = DepthFeed(matching_engine.depth)
@@ -0,0 +1,514 @@
+"""
+In-memory limit order book and matching engine for collectibles
+One book per collectible with price-time priority: sorted price levels, each
+a FIFO queue of resting orders. Prices are integer ticks (1/100 token) so
+matching never compares floats.
+
+The engine is single-threaded by design: call it from the event loop thread
+of a single worker process. Trades are handed to listeners (e.g. the
+TradeRecorder below) to be persisted off the matching path, and every
+mutation can be journaled for crash recovery (app.market_journal).
+"""
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+import queue
+import threading
+import time
+
+BUY = "buy"
+SELL = "sell"
+LIMIT = "limit"
+MARKET = "market"
+
+OPEN = "open"
+PARTIALLY_FILLED = "partially_filled"
+FILLED = "filled"
+CANCELLED = "cancelled"
+
+TICKS_PER_TOKEN = 100
+
+def to_ticks(price: float) -> int:
+    return int(round(price * TICKS_PER_TOKEN))
+
+def from_ticks(ticks: int) -> float:
+    return ticks / TICKS_PER_TOKEN
+
+class Order:
+    """A resting or incoming order; remaining is the unfilled quantity"""
+    __slots__ = ("order_id", "user_id", "collectible_id", "side", "order_type",
+                 "price", "quantity", "remaining", "timestamp", "status")
+    
+    def __init__(self, order_id: int, user_id: str, collectible_id: str, side: str,
+                 order_type: str, price: Optional[int], quantity: int, timestamp: float):
+        self.order_id = order_id
+        self.user_id = user_id
+        self.collectible_id = collectible_id
+        self.side = side
+        self.order_type = order_type
+        self.price = price
+        self.quantity = quantity
+        self.remaining = quantity
+        self.timestamp = timestamp
+        self.status = OPEN
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "order_id": self.order_id,
+            "user_id": self.user_id,
+            "collectible_id": self.collectible_id,
+            "side": self.side,
+            "order_type": self.order_type,
+            "price": from_ticks(self.price) if self.price is not None else None,
+            "quantity": self.quantity,
+            "remaining": self.remaining,
+            "status": self.status,
+            "timestamp": self.timestamp
+        }
+
+class Trade:
+    """A fill between an incoming (taker) order and a resting (maker) order"""
+    __slots__ = ("trade_id", "collectible_id", "price", "quantity", "buy_order_id",
+                 "sell_order_id", "buyer_id", "seller_id", "taker_side", "timestamp")
+    
+    def __init__(self, trade_id: int, collectible_id: str, price: int, quantity: int,
+                 buy_order_id: int, sell_order_id: int, buyer_id: str, seller_id: str,
+                 taker_side: str, timestamp: float):
+        self.trade_id = trade_id
+        self.collectible_id = collectible_id
+        self.price = price
+        self.quantity = quantity
+        self.buy_order_id = buy_order_id
+        self.sell_order_id = sell_order_id
+        self.buyer_id = buyer_id
+        self.seller_id = seller_id
+        self.taker_side = taker_side
+        self.timestamp = timestamp
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trade_id": self.trade_id,
+            "collectible_id": self.collectible_id,
+            "price": from_ticks(self.price),
+            "quantity": self.quantity,
+            "buy_order_id": self.buy_order_id,
+            "sell_order_id": self.sell_order_id,
+            "buyer_id": self.buyer_id,
+            "seller_id": self.seller_id,
+            "taker_side": self.taker_side,
+            "timestamp": self.timestamp
+        }
+
+class OrderBook:
+    """Price-time priority book for a single collectible"""
+    
+    def __init__(self, collectible_id: str):
+        self.collectible_id = collectible_id
+        # price -> FIFO of resting orders; cancelled orders are skipped lazily
+        self.bids: Dict[int, Deque[Order]] = {}
+        self.asks: Dict[int, Deque[Order]] = {}
+        # Sorted ascending: best bid is bid_prices[-1], best ask is ask_prices[0]
+        self.bid_prices: List[int] = []
+        self.ask_prices: List[int] = []
+        # price -> open quantity at that level
+        self.bid_depth: Dict[int, int] = {}
+        self.ask_depth: Dict[int, int] = {}
+        self.orders: Dict[int, Order] = {}
+        # Levels touched since the last depth delta, and the delta sequence
+        self.changed_bids: Set[int] = set()
+        self.changed_asks: Set[int] = set()
+        self.depth_seq = 0
+    
+    def best_bid(self) -> Optional[int]:
+        return self.bid_prices[-1] if self.bid_prices else None
+    
+    def best_ask(self) -> Optional[int]:
+        return self.ask_prices[0] if self.ask_prices else None
+    
+    def fill_cost(self, side: str, quantity: int) -> int:
+        """Ticks an order of quantity on side would pay or receive against the book right now"""
+        if side == BUY:
+            prices, depth = self.ask_prices, self.ask_depth
+        else:
+            prices, depth = reversed(self.bid_prices), self.bid_depth
+        cost = 0
+        for price in prices:
+            taken = quantity if quantity < depth[price] else depth[price]
+            cost += price * taken
+            quantity -= taken
+            if not quantity:
+                break
+        return cost
+    
+    def match(self, order: Order, next_trade_id: Callable[[], int]) -> List[Trade]:
+        """Fill order against the opposite side as far as its price allows"""
+        trades: List[Trade] = []
+        is_buy = order.side == BUY
+        if is_buy:
+            levels, prices, depth, changed = self.asks, self.ask_prices, self.ask_depth, self.changed_asks
+        else:
+            levels, prices, depth, changed = self.bids, self.bid_prices, self.bid_depth, self.changed_bids
+        limit = order.price if order.order_type == LIMIT else None
+        
+        while order.remaining and prices:
+            best = prices[0] if is_buy else prices[-1]
+            if limit is not None and (best > limit if is_buy else best < limit):
+                break
+            
+            level = levels[best]
+            changed.add(best)
+            while order.remaining and level:
+                maker = level[0]
+                if not maker.remaining:
+                    level.popleft()
+                    continue
+                
+                quantity = order.remaining if order.remaining < maker.remaining else maker.remaining
+                order.remaining -= quantity
+                maker.remaining -= quantity
+                depth[best] -= quantity
+                
+                if is_buy:
+                    trade = Trade(next_trade_id(), self.collectible_id, best, quantity,
+                                  order.order_id, maker.order_id, order.user_id, maker.user_id,
+                                  BUY, order.timestamp)
+                else:
+                    trade = Trade(next_trade_id(), self.collectible_id, best, quantity,
+                                  maker.order_id, order.order_id, maker.user_id, order.user_id,
+                                  SELL, order.timestamp)
+                trades.append(trade)
+                
+                if maker.remaining:
+                    maker.status = PARTIALLY_FILLED
+                else:
+                    maker.status = FILLED
+                    level.popleft()
+                    del self.orders[maker.order_id]
+            
+            if not level or not depth[best]:
+                self._remove_level(levels, prices, depth, best)
+        
+        if order.remaining == 0:
+            order.status = FILLED
+        elif order.remaining < order.quantity:
+            order.status = PARTIALLY_FILLED
+        return trades
+    
+    def rest(self, order: Order):
+        """Queue the unfilled part of a limit order at its price level"""
+        if order.side == BUY:
+            levels, prices, depth, changed = self.bids, self.bid_prices, self.bid_depth, self.changed_bids
+        else:
+            levels, prices, depth, changed = self.asks, self.ask_prices, self.ask_depth, self.changed_asks
+        
+        changed.add(order.price)
+        level = levels.get(order.price)
+        if level is None:
+            level = levels[order.price] = deque()
+            depth[order.price] = 0
+            insort(prices, order.price)
+        level.append(order)
+        depth[order.price] += order.remaining
+        self.orders[order.order_id] = order
+    
+    def cancel(self, order_id: int) -> Optional[Order]:
+        """Remove a resting order; its queue entry is dropped lazily"""
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        
+        if order.side == BUY:
+            levels, prices, depth, changed = self.bids, self.bid_prices, self.bid_depth, self.changed_bids
+        else:
+            levels, prices, depth, changed = self.asks, self.ask_prices, self.ask_depth, self.changed_asks
+        
+        changed.add(order.price)
+        depth[order.price] -= order.remaining
+        order.remaining = 0
+        order.status = CANCELLED
+        if not depth[order.price]:
+            self._remove_level(levels, prices, depth, order.price)
+        return order
+    
+    def depth(self, levels: int) -> Dict[str, Any]:
+        """Aggregated quantity of the best `levels` price levels per side, in O(levels)"""
+        return {
+            "collectible_id": self.collectible_id,
+            "seq": self.depth_seq,
+            "bids": [[from_ticks(price), self.bid_depth[price]] for price in self.bid_prices[:-levels - 1:-1]],
+            "asks": [[from_ticks(price), self.ask_depth[price]] for price in self.ask_prices[:levels]]
+        }
+    
+    def take_depth_delta(self) -> Optional[Dict[str, Any]]:
+        """New quantity of every level changed since the last delta (0 = level removed)"""
+        if not self.changed_bids and not self.changed_asks:
+            return None
+        self.depth_seq += 1
+        delta = {
+            "collectible_id": self.collectible_id,
+            "seq": self.depth_seq,
+            "prev_seq": self.depth_seq - 1,
+            "bids": [[from_ticks(price), self.bid_depth.get(price, 0)]
+                     for price in sorted(self.changed_bids, reverse=True)],
+            "asks": [[from_ticks(price), self.ask_depth.get(price, 0)]
+                     for price in sorted(self.changed_asks)]
+        }
+        self.changed_bids.clear()
+        self.changed_asks.clear()
+        return delta
+    
+    def discard_depth_changes(self):
+        """Advance the depth sequence without building a delta nobody consumes"""
+        if self.changed_bids or self.changed_asks:
+            self.depth_seq += 1
+            self.changed_bids.clear()
+            self.changed_asks.clear()
+    
+    @staticmethod
+    def _remove_level(levels: Dict[int, Deque[Order]], prices: List[int],
+                      depth: Dict[int, int], price: int):
+        del levels[price]
+        del depth[price]
+        del prices[bisect_left(prices, price)]
+
+class MatchingEngine:
+    """Order books for all collectibles plus order routing and trade fan-out"""
+    
+    def __init__(self):
+        self.books: Dict[str, OrderBook] = {}
+        self._order_books: Dict[int, OrderBook] = {}
+        self.next_order_id = 1
+        self.next_trade_id = 1
+        self._trade_listeners: List[Callable[[List[Trade]], Any]] = []
+        self._depth_listeners: List[Callable[[Dict[str, Any]], Any]] = []
+        # Optional write-ahead journal (see app.market_journal)
+        self.journal = None
+    
+    def add_trade_listener(self, listener: Callable[[List[Trade]], Any]):
+        """Call listener with each non-empty batch of trades produced by one order"""
+        self._trade_listeners.append(listener)
+    
+    def add_depth_listener(self, listener: Callable[[Dict[str, Any]], Any]):
+        """Call listener with the level-2 delta of every book mutation"""
+        self._depth_listeners.append(listener)
+    
+    def book(self, collectible_id: str) -> OrderBook:
+        book = self.books.get(collectible_id)
+        if book is None:
+            book = self.books[collectible_id] = OrderBook(collectible_id)
+        return book
+    
+    def submit(self, user_id: str, collectible_id: str, side: str, quantity: int,
+               price: Optional[int] = None, order_type: str = LIMIT) -> Tuple[Order, List[Trade]]:
+        """Match an order and rest any limit remainder; market remainders are cancelled"""
+        if side not in (BUY, SELL):
+            raise ValueError("side must be 'buy' or 'sell'")
+        if order_type not in (LIMIT, MARKET):
+            raise ValueError("order_type must be 'limit' or 'market'")
+        if quantity <= 0:
+            raise ValueError("quantity must be positive")
+        if order_type == LIMIT and (price is None or price <= 0):
+            raise ValueError("limit orders need a positive price")
+        if order_type == MARKET:
+            price = None
+        
+        order = Order(self.next_order_id, user_id, collectible_id, side,
+                      order_type, price, quantity, time.time())
+        self.next_order_id += 1
+        if self.journal is not None:
+            self.journal.record_submit(order)
+        return order, self._execute(order, emit=True)
+    
+    def cancel(self, order_id: int, user_id: Optional[str] = None) -> Optional[Order]:
+        """Cancel a resting order (only its owner's, when user_id is given)"""
+        book = self._order_books.get(order_id)
+        if book is None:
+            return None
+        order = book.orders.get(order_id)
+        if order is None or (user_id is not None and order.user_id != user_id):
+            return None
+        if self.journal is not None:
+            self.journal.record_cancel(order_id)
+        del self._order_books[order_id]
+        order = book.cancel(order_id)
+        self._emit_depth(book, emit=True)
+        return order
+    
+    def get_order(self, order_id: int) -> Optional[Order]:
+        book = self._order_books.get(order_id)
+        return book.orders.get(order_id) if book else None
+    
+    def fill_cost(self, collectible_id: str, side: str, quantity: int) -> int:
+        """What a market order would trade for now, in ticks (e.g. to reserve a market buy)"""
+        book = self.books.get(collectible_id)
+        return book.fill_cost(side, quantity) if book is not None else 0
+    
+    def depth(self, collectible_id: str, levels: int) -> Dict[str, Any]:
+        book = self.books.get(collectible_id)
+        if book is None:
+            return {"collectible_id": collectible_id, "seq": 0, "bids": [], "asks": []}
+        return book.depth(levels)
+    
+    def _emit_depth(self, book: OrderBook, emit: bool):
+        if not emit or not self._depth_listeners:
+            book.discard_depth_changes()
+            return
+        delta = book.take_depth_delta()
+        if delta is not None:
+            for listener in self._depth_listeners:
+                listener(delta)
+    
+    def _new_trade_id(self) -> int:
+        trade_id = self.next_trade_id
+        self.next_trade_id += 1
+        return trade_id
+    
+    def _execute(self, order: Order, emit: bool) -> List[Trade]:
+        book = self.book(order.collectible_id)
+        trades = book.match(order, self._new_trade_id)
+        
+        if order.remaining:
+            if order.order_type == LIMIT:
+                book.rest(order)
+                self._order_books[order.order_id] = book
+            else:
+                order.status = CANCELLED if not trades else PARTIALLY_FILLED
+        
+        if trades:
+            # Forget makers that were fully filled
+            for trade in trades:
+                maker_id = trade.sell_order_id if trade.taker_side == BUY else trade.buy_order_id
+                if maker_id not in book.orders:
+                    self._order_books.pop(maker_id, None)
+            
+            if emit:
+                if self.journal is not None:
+                    # Fills carry their trade ids so recovery can settle them again
+                    for trade in trades:
+                        self.journal.record_fill(trade)
+                for listener in self._trade_listeners:
+                    listener(trades)
+        self._emit_depth(book, emit)
+        return trades
+    
+    # Recovery hooks used by app.market_journal
+    def replay_submit(self, order: Order):
+        """Re-apply a journaled order without notifying trade listeners"""
+        self.next_order_id = max(self.next_order_id, order.order_id + 1)
+        self._execute(order, emit=False)
+    
+    def replay_cancel(self, order_id: int):
+        book = self._order_books.pop(order_id, None)
+        if book is not None:
+            book.cancel(order_id)
+            self._emit_depth(book, emit=False)
+    
+    def restore_resting(self, order: Order):
+        """Put a snapshotted resting order back at the tail of its level"""
+        book = self.book(order.collectible_id)
+        book.rest(order)
+        self._order_books[order.order_id] = book
+        self._emit_depth(book, emit=False)
+    
+    def resting_orders(self):
+        """All resting orders, per book in price-time priority order"""
+        for book in self.books.values():
+            for prices, levels in ((reversed(book.bid_prices), book.bids),
+                                   (book.ask_prices, book.asks)):
+                for price in prices:
+                    for order in levels[price]:
+                        if order.remaining:
+                            yield order
+
+class TradeRecorder:
+    """Persists trades on a background thread so matching never waits on the database
+    
+    record returns a result dict with "success"; on_settled(trade, result) or
+    on_failed(trade, result) is then called on the attached event loop (on
+    the recorder thread until one is attached), in settlement order. With a
+    journal set, nothing is recorded before the WAL record that produced it
+    is fsynced, so the database never holds a trade the books could lose.
+    record must be idempotent on trade id: after a crash, resubmit hands it
+    the trades replayed from the WAL that the database does not have yet.
+    """
+    
+    def __init__(self, record: Callable[[Any], Dict[str, Any]], name: str = "trade-recorder",
+                 on_settled: Optional[Callable[[Any, Dict[str, Any]], Any]] = None,
+                 on_failed: Optional[Callable[[Any, Dict[str, Any]], Any]] = None):
+        self.record = record
+        self.name = name
+        self.on_settled = on_settled
+        self.on_failed = on_failed
+        self._queue: "queue.Queue[Tuple[int, Any]]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._loop = None
+        # WAL sequence numbers of queued trades, oldest first (0: resubmitted)
+        self._pending: Deque[int] = deque()
+        # Optional app.market_journal.MarketJournal to wait on
+        self.journal = None
+    
+    def attach(self, loop):
+        """Run settlement callbacks on loop (the matching engine's thread)"""
+        self._loop = loop
+    
+    def __call__(self, trades: List[Any]):
+        self._ensure_started()
+        # Called right after the mutation was journaled, so its record is the newest
+        seq = self.journal.last_seq if self.journal is not None else 0
+        for trade in trades:
+            self._put(seq, trade)
+    
+    def resubmit(self, trades: List[Any]):
+        """Queue trades replayed from the WAL (already durable) for settlement"""
+        self._ensure_started()
+        for trade in trades:
+            self._put(0, trade)
+    
+    def _put(self, seq: int, trade: Any):
+        with self._lock:
+            self._pending.append(seq)
+        self._queue.put((seq, trade))
+    
+    def oldest_pending(self) -> Optional[int]:
+        """WAL sequence number of the oldest trade not settled yet (None if all are)"""
+        with self._lock:
+            return self._pending[0] if self._pending else None
+    
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            seq, trade = self._queue.get()
+            try:
+                if seq:
+                    self.journal.wait(seq)
+                result = self.record(trade)
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            with self._lock:
+                self._pending.popleft()
+            if not result.get("success"):
+                print(f"Error in {self.name}: {result.get('error')}")
+            callback = self.on_settled if result.get("success") else self.on_failed
+            if callback is None:
+                continue
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._notify, callback, trade, result)
+            else:
+                self._notify(callback, trade, result)
+    
+    def _notify(self, callback: Callable[[Any, Dict[str, Any]], Any], trade: Any, result: Dict[str, Any]):
+        try:
+            callback(trade, result)
+        except Exception as e:
+            print(f"Error in {self.name} callback: {e}")
+
+# Global instance
+matching_engine = MatchingEngine()
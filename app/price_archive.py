@@ -0,0 +1,197 @@
+"""
+Columnar archive of cold price history
+Old price_history rows are exported per collectible into a local file that
+is memory-mapped for reads, so full-history reads fetch only the rows newer
+than the archive from the database. Rows stay in price_history; the archive
+records a (recorded_at, id) watermark and readers query past it.
+
+File layout (<PRICE_ARCHIVE_DIR>/<collectible_id>.pxa):
+    blocks   up to PRICE_ARCHIVE_BLOCK_ROWS rows each, zlib-compressed. A
+             block holds three int64 columns (recorded_at in microseconds,
+             price in cents, quantity or -1), each delta- then zigzag-encoded
+             and byte-shuffled so the compressor sees long runs of zeros.
+    index    per block: first/last timestamp, offset, length, row count
+    meta     JSON with the watermark
+    footer   index offset, block count, meta length, magic
+
+Exports rewrite the file (reusing the compressed blocks) and atomically
+replace it; readers notice the new file on their next read.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+import json
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+PRICE_ARCHIVE_DIR = os.getenv("PRICE_ARCHIVE_DIR", "price_archive")
+PRICE_ARCHIVE_BLOCK_ROWS = int(os.getenv("PRICE_ARCHIVE_BLOCK_ROWS", "65536"))
+# Rows older than this are archived by archive_price_history.py
+PRICE_ARCHIVE_AGE_DAYS = float(os.getenv("PRICE_ARCHIVE_AGE_DAYS", "30"))
+
+MAGIC = b"PXA1"
+_FOOTER = struct.Struct("<qqi4s")
+_INDEX_DTYPE = np.dtype([("first", "<i8"), ("last", "<i8"), ("offset", "<i8"),
+                         ("length", "<i8"), ("rows", "<i8")])
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+def to_micros(recorded_at: str) -> int:
+    return (datetime.fromisoformat(recorded_at) - _EPOCH) // _MICROSECOND
+
+def from_micros(micros: int) -> str:
+    return (_EPOCH + timedelta(microseconds=micros)).isoformat()
+
+def encode_block(columns: np.ndarray) -> bytes:
+    """Compress an int64 array of shape (3, rows)"""
+    deltas = np.diff(columns, axis=1, prepend=0)
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).view(np.uint64)
+    planes = zigzag.astype("<u8").view(np.uint8).reshape(-1, 8).T
+    return zlib.compress(np.ascontiguousarray(planes).tobytes())
+
+def decode_block(data: bytes, rows: int) -> np.ndarray:
+    planes = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(8, -1)
+    zigzag = np.ascontiguousarray(planes.T).view("<u8").reshape(3, rows)
+    deltas = (zigzag >> np.uint64(1)).view(np.int64) ^ -(zigzag & np.uint64(1)).view(np.int64)
+    return np.cumsum(deltas, axis=1)
+
+class ArchiveFile:
+    """One memory-mapped archive file"""
+    __slots__ = ("mm", "index", "watermark", "identity")
+    
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index_offset, blocks, meta_length, magic = _FOOTER.unpack_from(self.mm, len(self.mm) - _FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a price archive")
+        meta_offset = index_offset + blocks * _INDEX_DTYPE.itemsize
+        self.index = np.frombuffer(self.mm[index_offset:meta_offset], dtype=_INDEX_DTYPE)
+        self.watermark = json.loads(self.mm[meta_offset:meta_offset + meta_length])["watermark"]
+    
+    def block(self, i: int) -> bytes:
+        return self.mm[self.index["offset"][i]:self.index["offset"][i] + self.index["length"][i]]
+    
+    def read(self, start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+        """Columns of rows with start <= timestamp <= end (microseconds), decoding only overlapping blocks"""
+        selected = np.ones(len(self.index), dtype=bool)
+        if start is not None:
+            selected &= self.index["last"] >= start
+        if end is not None:
+            selected &= self.index["first"] <= end
+        blocks = [decode_block(self.block(i), int(self.index["rows"][i])) for i in np.flatnonzero(selected)]
+        if not blocks:
+            return np.empty((3, 0), dtype=np.int64)
+        columns = np.concatenate(blocks, axis=1)
+        lo = np.searchsorted(columns[0], start, side="left") if start is not None else 0
+        hi = np.searchsorted(columns[0], end, side="right") if end is not None else columns.shape[1]
+        return columns[:, lo:hi]
+    
+    def rows(self, collectible_id: str, start: Optional[int] = None, end: Optional[int] = None,
+             limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Archived rows shaped like price_history (without id), the newest limit of them, newest first"""
+        columns = self.read(start, end)
+        if limit is not None:
+            columns = columns[:, max(0, columns.shape[1] - limit):]
+        timestamps, cents, quantities = columns[:, ::-1].tolist()
+        return [
+            {
+                "collectible_id": collectible_id,
+                "price": price / 100,
+                "quantity": quantity if quantity >= 0 else None,
+                "recorded_at": from_micros(timestamp)
+            }
+            for timestamp, price, quantity in zip(timestamps, cents, quantities)
+        ]
+
+class PriceArchive:
+    """Per-collectible archive files under one directory"""
+    
+    def __init__(self, directory: str = PRICE_ARCHIVE_DIR, block_rows: int = PRICE_ARCHIVE_BLOCK_ROWS):
+        self.directory = directory
+        self.block_rows = block_rows
+        self._files: Dict[str, ArchiveFile] = {}
+    
+    def path(self, collectible_id: str) -> str:
+        return os.path.join(self.directory, f"{collectible_id}.pxa")
+    
+    def open(self, collectible_id: str) -> Optional[ArchiveFile]:
+        """Current archive file, remapped if an export replaced it"""
+        try:
+            stat = os.stat(self.path(collectible_id))
+        except FileNotFoundError:
+            self._files.pop(collectible_id, None)
+            return None
+        archive = self._files.get(collectible_id)
+        if archive is None or archive.identity != (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            archive = self._files[collectible_id] = ArchiveFile(self.path(collectible_id))
+        return archive
+    
+    def watermark(self, collectible_id: str) -> Optional[Dict[str, Any]]:
+        """recorded_at and id of the newest archived row"""
+        archive = self.open(collectible_id)
+        return archive.watermark if archive is not None else None
+    
+    def read(self, collectible_id: str, start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+        """(timestamps in microseconds, prices in cents, quantities or -1), oldest first"""
+        archive = self.open(collectible_id)
+        return archive.read(start, end) if archive is not None else np.empty((3, 0), dtype=np.int64)
+    
+    def rows(self, collectible_id: str, start: Optional[int] = None, end: Optional[int] = None,
+             limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Archived rows shaped like price_history (without id), the newest limit of them, newest first"""
+        archive = self.open(collectible_id)
+        return archive.rows(collectible_id, start, end, limit) if archive is not None else []
+    
+    def append(self, collectible_id: str, rows: List[Dict[str, Any]]) -> int:
+        """Archive price_history rows newer than the watermark, ordered by (recorded_at, id)"""
+        if not rows:
+            return 0
+        new = np.array([
+            [to_micros(row["recorded_at"]) for row in rows],
+            [int(round(float(row["price"]) * 100)) for row in rows],
+            [row["quantity"] if row.get("quantity") is not None else -1 for row in rows]
+        ], dtype=np.int64)
+        archive = self.open(collectible_id)
+        keep = 0
+        if archive is not None:
+            keep = len(archive.index)
+            if keep and archive.index["rows"][-1] < self.block_rows:
+                # Re-encode the partial last block together with the new rows
+                keep -= 1
+                new = np.concatenate([decode_block(archive.block(keep), int(archive.index["rows"][keep])), new],
+                                     axis=1)
+        
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.path(collectible_id) + ".tmp"
+        index = []
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            for i in range(keep):
+                data = archive.block(i)
+                first, last, _, _, count = archive.index[i].tolist()
+                index.append((first, last, f.tell(), len(data), count))
+                f.write(data)
+            for start in range(0, new.shape[1], self.block_rows):
+                columns = new[:, start:start + self.block_rows]
+                data = encode_block(columns)
+                index.append((int(columns[0, 0]), int(columns[0, -1]), f.tell(), len(data), columns.shape[1]))
+                f.write(data)
+            
+            index_offset = f.tell()
+            f.write(np.array(index, dtype=_INDEX_DTYPE).tobytes())
+            meta = json.dumps({"watermark": {"recorded_at": rows[-1]["recorded_at"], "id": rows[-1]["id"]}}).encode()
+            f.write(meta)
+            f.write(_FOOTER.pack(index_offset, len(index), len(meta), MAGIC))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path(collectible_id))
+        return len(rows)
+
+# Global instance
+price_archive = PriceArchive()
@@ -0,0 +1,188 @@
+"""
+Full price series per collectible, cached as NumPy arrays
+A collectible's price_history is read once (keyset pages, oldest first) into
+sorted timestamp/price arrays, then kept current by the price feed events
+that are also written to price_history (settled trades, auction clearings
+and price updates, stamped with their recorded_at), so analytics and chart
+endpoints work on in-memory arrays instead of re-reading the table.
+Archived history is decoded from the local price archive and only newer
+rows are paged from the database. Ticks published during a load are
+buffered and added unless the load already read them.
+
+A series is reloaded once older than PRICE_SERIES_TTL_SECONDS, which picks
+up rows written outside this process. Arrays grow by doubling; the least
+recently used series are evicted once PRICE_SERIES_MAX_CACHED collectibles
+are cached. Time-range reads binary-search the sorted timestamps, so they
+cost the size of the window, not of the history.
+"""
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from app.cache import LRUCache
+from app.market_feed import HISTORY_SOURCES
+from app.price_archive import PriceArchive
+
+PRICE_SERIES_MAX_CACHED = int(os.getenv("PRICE_SERIES_MAX_CACHED", "256"))
+PRICE_SERIES_TTL_SECONDS = float(os.getenv("PRICE_SERIES_TTL_SECONDS", "300"))
+
+class PriceSeries:
+    """Sorted (timestamp, price, quantity) arrays with spare capacity for appends"""
+    __slots__ = ("_timestamps", "_prices", "_quantities", "count")
+    
+    def __init__(self, timestamps: np.ndarray, prices: np.ndarray, quantities: np.ndarray):
+        self._timestamps = timestamps
+        self._prices = prices
+        # -1 = quantity unknown (manual price updates)
+        self._quantities = quantities
+        self.count = len(timestamps)
+    
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> "PriceSeries":
+        """Build from price_history rows ordered by recorded_at"""
+        timestamps = np.fromiter((datetime.fromisoformat(row["recorded_at"]).timestamp() for row in rows),
+                                 dtype=np.float64, count=len(rows))
+        prices = np.fromiter((float(row["price"]) for row in rows), dtype=np.float64, count=len(rows))
+        quantities = np.fromiter((row["quantity"] if row.get("quantity") is not None else -1 for row in rows),
+                                 dtype=np.int64, count=len(rows))
+        return cls(timestamps, prices, quantities)
+    
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[:self.count]
+    
+    @property
+    def prices(self) -> np.ndarray:
+        return self._prices[:self.count]
+    
+    @property
+    def quantities(self) -> np.ndarray:
+        return self._quantities[:self.count]
+    
+    @property
+    def last_timestamp(self) -> float:
+        return float(self._timestamps[self.count - 1]) if self.count else float("-inf")
+    
+    def contains(self, timestamp: float, price: float, quantity: Optional[int] = None) -> bool:
+        """Whether this exact tick is already in the series"""
+        window = self.range(timestamp, timestamp)
+        return bool(np.any((self.prices[window] == price) &
+                           (self.quantities[window] == (quantity if quantity is not None else -1))))
+    
+    def append(self, timestamp: float, price: float, quantity: Optional[int] = None):
+        if self.count == len(self._timestamps):
+            capacity = max(64, 2 * self.count)
+            self._timestamps = np.resize(self._timestamps, capacity)
+            self._prices = np.resize(self._prices, capacity)
+            self._quantities = np.resize(self._quantities, capacity)
+        i = self.count
+        if timestamp < self.last_timestamp:
+            # Out-of-order tick: shift the newer ones up by one slot
+            i = int(np.searchsorted(self.timestamps, timestamp, side="right"))
+            for column in (self._timestamps, self._prices, self._quantities):
+                column[i + 1:self.count + 1] = column[i:self.count].copy()
+        self._timestamps[i] = timestamp
+        self._prices[i] = price
+        self._quantities[i] = quantity if quantity is not None else -1
+        self.count += 1
+    
+    def range(self, start: Optional[float] = None, end: Optional[float] = None) -> slice:
+        """Positions of the ticks with start <= timestamp <= end (unix seconds)"""
+        timestamps = self.timestamps
+        lo = int(np.searchsorted(timestamps, start, side="left")) if start is not None else 0
+        hi = int(np.searchsorted(timestamps, end, side="right")) if end is not None else self.count
+        return slice(lo, max(lo, hi))
+    
+    def rows(self, collectible_id: str, positions: Any) -> List[Dict[str, Any]]:
+        """Ticks at positions (a slice or index array) shaped like price_history rows without id"""
+        return [
+            {
+                "collectible_id": collectible_id,
+                "price": price,
+                "quantity": quantity if quantity >= 0 else None,
+                "recorded_at": datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+            }
+            for timestamp, price, quantity in zip(self.timestamps[positions].tolist(),
+                                                  self.prices[positions].tolist(),
+                                                  self.quantities[positions].tolist())
+        ]
+
+class PriceSeriesCache:
+    """Lazily loaded PriceSeries per collectible, updated from the price feed"""
+    
+    def __init__(self, iter_pages: Callable[..., Iterator[List[Dict[str, Any]]]],
+                 archive: Optional[PriceArchive] = None, max_series: int = PRICE_SERIES_MAX_CACHED,
+                 ttl: float = PRICE_SERIES_TTL_SECONDS):
+        """iter_pages(collectible_id, after=row) yields price_history pages past row"""
+        self.iter_pages = iter_pages
+        self.archive = archive
+        self.ttl = ttl
+        # collectible_id -> (series, monotonic load time)
+        self._series = LRUCache(maxsize=max_series)
+        self._loads: Dict[str, asyncio.Future] = {}
+        # Ticks published while a series is being read from the database
+        self._buffered: Dict[str, List[Tuple[float, float, Optional[int]]]] = {}
+    
+    def record(self, event: Dict[str, Any]):
+        """Price feed listener; only collectibles already cached (or loading) are kept"""
+        if event["source"] not in HISTORY_SOURCES:
+            return
+        tick = (event["timestamp"], event["price"], event.get("quantity"))
+        entry = self._series.get(event["collectible_id"])
+        if entry is not None:
+            entry[0].append(*tick)
+        buffered = self._buffered.get(event["collectible_id"])
+        if buffered is not None:
+            buffered.append(tick)
+    
+    def cached(self, collectible_id: str) -> Optional[PriceSeries]:
+        """The series if it is in memory and fresh (never loads)"""
+        entry = self._series.get(collectible_id)
+        if entry is None or time.monotonic() - entry[1] >= self.ttl:
+            return None
+        return entry[0]
+    
+    async def get(self, collectible_id: str) -> PriceSeries:
+        """Cached series, (re)loading it (once, however many callers wait) on a miss or once stale"""
+        series = self.cached(collectible_id)
+        if series is not None:
+            return series
+        load = self._loads.get(collectible_id)
+        if load is None:
+            self._buffered[collectible_id] = []
+            load = self._loads[collectible_id] = asyncio.ensure_future(self._load(collectible_id))
+        return await asyncio.shield(load)
+    
+    def load(self, collectible_id: str) -> PriceSeries:
+        """Read a collectible's whole history (blocking)"""
+        # Watermark and rows from the same file, even if an export replaces it meanwhile
+        archive = self.archive.open(collectible_id) if self.archive is not None else None
+        rows: List[Dict[str, Any]] = []
+        for page in self.iter_pages(collectible_id, after=archive.watermark if archive is not None else None):
+            rows.extend(page)
+        series = PriceSeries.from_rows(rows)
+        if archive is None:
+            return series
+        
+        timestamps, cents, quantities = archive.read()
+        return PriceSeries(np.concatenate([timestamps / 1e6, series.timestamps]),
+                           np.concatenate([cents / 100, series.prices]),
+                           np.concatenate([quantities, series.quantities]))
+    
+    async def _load(self, collectible_id: str) -> PriceSeries:
+        try:
+            loaded_at = time.monotonic()
+            series = await asyncio.get_running_loop().run_in_executor(None, self.load, collectible_id)
+            # A tick is committed before it is published, so the pages read may or may not have it
+            for timestamp, price, quantity in self._buffered[collectible_id]:
+                if not series.contains(timestamp, price, quantity):
+                    series.append(timestamp, price, quantity)
+            self._series.set(collectible_id, (series, loaded_at))
+            return series
+        finally:
+            del self._buffered[collectible_id]
+            del self._loads[collectible_id]
@@ -0,0 +1,458 @@
+"""
+In-memory balance reservations
+Tracks, per user, how much of the balance is spoken for so pre-trade and
+pre-redemption checks are a few integer operations instead of a database
+round trip. All amounts are integer cents (the same unit as order book ticks).
+Positions (units of a collectible a user holds) are tracked the same way in
+micro-units (UNIT_SCALE per unit, the precision of collectible_holdings), so
+sell orders and AMM sells can be checked against inventory.
+
+Three kinds of reservation:
+    holds        funds for pending redemptions. A hold moves the amount from
+                 the user's balance to the 'system:holds' ledger account; it
+                 is later released back or settled to its destination. Hold,
+                 release and settle operations are written in batches by a
+                 group-commit writer calling reservations_apply().
+    commitments  the open notional of resting buy orders and the open
+                 quantity of resting sell orders. These are not journaled:
+                 the order books are durable through the market WAL, and
+                 commitments are rebuilt from them at startup.
+    debits       amounts set aside by reserve() while a purchase, transfer,
+                 swap or balance edit is written by its own stored procedure.
+
+The cached balance mirrors token_balances (which already excludes persisted
+holds). load() reads it off the event loop on first use and again once older
+than RESERVATION_BALANCE_TTL_SECONDS; a read is dropped if any operation for
+the account started while it was in flight. A fill debits the buyer's
+balance and the seller's position at once and credits the other side only
+when the trade has settled; a fill that fails to settle is reversed.
+
+Every debit of a user's balance or units goes through one of the three, so
+none can spend what another has set aside. The database still re-checks each
+one against token_balances and collectible_holdings, so a stale cache can
+cause a late rejection but never a negative balance.
+"""
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import os
+import threading
+import time
+import uuid
+
+from app.batching import GroupCommitWriter
+
+RESERVATION_BATCH_SIZE = int(os.getenv("RESERVATION_BATCH_SIZE", "100"))
+RESERVATION_BATCH_DELAY_MS = float(os.getenv("RESERVATION_BATCH_DELAY_MS", "5"))
+RESERVATION_BALANCE_TTL_SECONDS = float(os.getenv("RESERVATION_BALANCE_TTL_SECONDS", "30"))
+
+PENDING = "pending"
+HELD = "held"
+RELEASED = "released"
+SETTLED = "settled"
+REJECTED = "rejected"
+
+def to_cents(amount: float) -> int:
+    return int(round(amount * 100))
+
+def from_cents(cents: int) -> float:
+    return cents / 100
+
+# Positions are kept in millionths of a unit
+UNIT_SCALE = 1_000_000
+
+def to_units(units: float) -> int:
+    return int(round(units * UNIT_SCALE))
+
+class InsufficientFunds(ValueError):
+    """Raised when a reservation exceeds the user's available balance (or units)"""
+
+class Reservation:
+    """A hold on part of a user's balance"""
+    __slots__ = ("reservation_id", "user_id", "amount", "purpose", "reference", "status")
+    
+    def __init__(self, reservation_id: str, user_id: str, amount: int, purpose: str,
+                 reference: Optional[str], status: str = PENDING):
+        self.reservation_id = reservation_id
+        self.user_id = user_id
+        self.amount = amount
+        self.purpose = purpose
+        self.reference = reference
+        self.status = status
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "reservation_id": self.reservation_id,
+            "user_id": self.user_id,
+            "amount": from_cents(self.amount),
+            "purpose": self.purpose,
+            "reference": self.reference,
+            "status": self.status
+        }
+
+class Account:
+    """Cached balance and reserved amounts of one user in cents (or one position in micro-units)"""
+    __slots__ = ("balance", "pending", "committed", "in_flight", "version", "loaded_at")
+    
+    def __init__(self, balance: int):
+        # token_balances as last seen (persisted holds already deducted)
+        self.balance = balance
+        # Holds and debits accepted here but not yet written
+        self.pending = 0
+        # Open notional of resting buy orders (open quantity of sell orders)
+        self.committed = 0
+        # Operations started but not finished, and how many ever started
+        self.in_flight = 0
+        self.version = 0
+        self.loaded_at = time.monotonic()
+    
+    @property
+    def available(self) -> int:
+        return self.balance - self.pending - self.committed
+
+class BalanceReservations:
+    """Available vs reserved balance per user, with batched durable holds"""
+    
+    def __init__(self, load_balance: Callable[[str], Optional[float]],
+                 apply_ops: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]],
+                 load_units: Callable[[str, str], Optional[float]],
+                 max_batch_size: int = RESERVATION_BATCH_SIZE,
+                 max_delay_ms: float = RESERVATION_BATCH_DELAY_MS,
+                 balance_ttl: float = RESERVATION_BALANCE_TTL_SECONDS):
+        self.load_balance = load_balance
+        self.load_units = load_units
+        self.balance_ttl = balance_ttl
+        self.accounts: Dict[str, Account] = {}
+        # (user_id, collectible_id) -> micro-units held
+        self.positions: Dict[Tuple[str, str], Account] = {}
+        self.reservations: Dict[str, Reservation] = {}
+        # user_id -> cents in holds not yet released or settled
+        self.held: Dict[str, int] = {}
+        self._by_reference: Dict[str, str] = {}
+        # order_id -> [account or position, cents (or micro-units) per unit, open quantity]
+        self._orders: Dict[int, List[Any]] = {}
+        # trade_id -> ([(account, amount) debited], [(account, amount) to credit]) of
+        # fills debited but not yet settled
+        self._unsettled: Dict[int, Tuple[Any, ...]] = {}
+        self._lock = threading.Lock()
+        self._writer = GroupCommitWriter(apply_ops, max_batch_size=max_batch_size,
+                                         max_delay_ms=max_delay_ms, name="reservation-writer")
+    
+    # Accounts
+    async def load(self, user_id: str, collectible_id: Optional[str] = None):
+        """Load the user's balance (and position in collectible_id) if missing or stale, off the event loop"""
+        await self._refresh(self.accounts, user_id, self.load_balance, (user_id,), to_cents,
+                            "Balance not found")
+        if collectible_id is not None:
+            await self._refresh(self.positions, (user_id, collectible_id), self.load_units,
+                                (user_id, collectible_id), to_units, "Holdings not found")
+    
+    def account(self, user_id: str) -> Account:
+        """Cached account (load() must have been awaited for the user)"""
+        return self.accounts[user_id]
+    
+    def position(self, user_id: str, collectible_id: str) -> Account:
+        """Cached micro-units of a collectible (loaded by load(user_id, collectible_id))"""
+        return self.positions[(user_id, collectible_id)]
+    
+    async def _refresh(self, accounts: Dict[Any, Account], key: Any, read: Callable[..., Optional[float]],
+                       args: Tuple[Any, ...], scale: Callable[[float], int], missing: str):
+        account = accounts.get(key)
+        if account is not None and (account.in_flight or
+                                    time.monotonic() - account.loaded_at < self.balance_ttl):
+            return
+        version = account.version if account is not None else None
+        value = await asyncio.get_running_loop().run_in_executor(None, read, *args)
+        if value is None:
+            raise InsufficientFunds(missing)
+        with self._lock:
+            account = accounts.get(key)
+            if account is None:
+                accounts[key] = Account(scale(value))
+            elif not account.in_flight and account.version == version:
+                # Otherwise an operation started meanwhile and the read may predate it
+                account.balance = scale(value)
+                account.loaded_at = time.monotonic()
+    
+    def _book(self, key: Any) -> Dict[Any, Account]:
+        return self.positions if isinstance(key, tuple) else self.accounts
+    
+    @staticmethod
+    def _start(account: Account):
+        account.in_flight += 1
+        account.version += 1
+    
+    def summary(self, user_id: str) -> Dict[str, float]:
+        account = self.account(user_id)
+        return {
+            "available": from_cents(account.available),
+            "held": from_cents(self.held.get(user_id, 0)),
+            "open_orders": from_cents(account.committed)
+        }
+    
+    def check(self, user_id: str, amount: int):
+        """Raise InsufficientFunds unless amount cents are available"""
+        if self.account(user_id).available < amount:
+            raise InsufficientFunds("Insufficient balance")
+    
+    def check_units(self, user_id: str, collectible_id: str, quantity: int):
+        """Raise InsufficientFunds unless quantity whole units are held and not already offered"""
+        if self.position(user_id, collectible_id).available < quantity * UNIT_SCALE:
+            raise InsufficientFunds("Insufficient units")
+    
+    # Holds
+    def hold(self, user_id: str, amount: int, purpose: str, reference: Optional[str] = None,
+             details: Optional[Dict[str, Any]] = None) -> Tuple[Reservation, Future]:
+        """Reserve amount cents now; the future resolves once the hold is written"""
+        if amount <= 0:
+            raise ValueError("Amount must be positive")
+        account = self.account(user_id)
+        with self._lock:
+            if account.available < amount:
+                raise InsufficientFunds("Insufficient balance")
+            account.pending += amount
+            self.held[user_id] = self.held.get(user_id, 0) + amount
+            self._start(account)
+            reservation = Reservation(str(uuid.uuid4()), user_id, amount, purpose, reference)
+            self.reservations[reservation.reservation_id] = reservation
+            if reference is not None:
+                self._by_reference[reference] = reservation.reservation_id
+        
+        future = self._writer.submit(self._op("hold", reservation, details))
+        future.add_done_callback(lambda f: self._held(reservation, f))
+        return reservation, future
+    
+    def release(self, reservation: Reservation) -> Future:
+        """Return a hold to the user's balance"""
+        return self._close(reservation, "release", None)
+    
+    def settle(self, reservation: Reservation, account_id: str) -> Future:
+        """Pay a hold out to account_id (e.g. 'system:revenue')"""
+        return self._close(reservation, "settle", account_id)
+    
+    def by_reference(self, reference: str) -> Optional[Reservation]:
+        reservation_id = self._by_reference.get(reference)
+        return self.reservations.get(reservation_id) if reservation_id else None
+    
+    def restore(self, rows: List[Dict[str, Any]]):
+        """Load active holds written by a previous process"""
+        for row in rows:
+            reservation = Reservation(row["id"], row["user_id"], to_cents(float(row["amount"])),
+                                      row["purpose"], row.get("reference"), HELD)
+            self.reservations[reservation.reservation_id] = reservation
+            if reservation.reference is not None:
+                self._by_reference[reservation.reference] = reservation.reservation_id
+            self.held[reservation.user_id] = self.held.get(reservation.user_id, 0) + reservation.amount
+    
+    def _close(self, reservation: Reservation, op: str, account_id: Optional[str]) -> Future:
+        with self._lock:
+            if reservation.status not in (PENDING, HELD):
+                raise ValueError(f"Reservation is {reservation.status}")
+            reservation.status = RELEASED if op == "release" else SETTLED
+            account = self.accounts.get(reservation.user_id)
+            if account is not None:
+                self._start(account)
+        
+        future = self._writer.submit(self._op(op, reservation, {"account_id": account_id}))
+        future.add_done_callback(lambda f: self._closed(reservation, op, account, f))
+        return future
+    
+    @staticmethod
+    def _op(op: str, reservation: Reservation, details: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        # Uniform keys so every operation can share a batch
+        return {
+            "op": op,
+            "reservation_id": reservation.reservation_id,
+            "user_id": reservation.user_id,
+            "amount": from_cents(reservation.amount),
+            "purpose": reservation.purpose,
+            "reference": reservation.reference,
+            "collectible_id": (details or {}).get("collectible_id"),
+            "account_id": (details or {}).get("account_id")
+        }
+    
+    def _held(self, reservation: Reservation, future: Future):
+        accepted = not future.exception() and future.result().get("status") == HELD
+        with self._lock:
+            account = self.accounts[reservation.user_id]
+            account.pending -= reservation.amount
+            account.in_flight -= 1
+            if accepted:
+                account.balance -= reservation.amount
+                if reservation.status == PENDING:
+                    reservation.status = HELD
+            else:
+                reservation.status = REJECTED
+                self._forget(reservation)
+    
+    def _closed(self, reservation: Reservation, op: str, account: Optional[Account], future: Future):
+        done = not future.exception() and future.result().get("status") == reservation.status
+        with self._lock:
+            if account is not None:
+                account.in_flight -= 1
+                if done and op == "release":
+                    account.balance += reservation.amount
+            if done:
+                self._forget(reservation)
+            else:
+                # The write failed or found the hold already closed; let the
+                # next balance reload resolve it
+                print(f"Error applying reservation {op} for {reservation.reservation_id}: "
+                      f"{future.exception() or future.result()}")
+    
+    def _forget(self, reservation: Reservation):
+        self.held[reservation.user_id] -= reservation.amount
+        if not self.held[reservation.user_id]:
+            del self.held[reservation.user_id]
+        self.reservations.pop(reservation.reservation_id, None)
+        if reservation.reference is not None:
+            self._by_reference.pop(reservation.reference, None)
+    
+    # Direct debits
+    def reserve(self, debits: Dict[Any, int], credits: Iterable[Any] = ()) -> List[Tuple[Any, Account, int]]:
+        """Set aside debits for a write made by another stored procedure (purchase, transfer, swap...)
+        
+        Keys are a user_id (cents) or a (user_id, collectible_id) pair (micro-units).
+        Debited accounts must be loaded; credited ones are only marked busy, if
+        cached, so no reload lands while the write is in flight. Hand the result
+        to complete() once the write has returned.
+        """
+        with self._lock:
+            for key, amount in debits.items():
+                if self._book(key)[key].available < amount:
+                    raise InsufficientFunds("Insufficient units" if isinstance(key, tuple)
+                                            else "Insufficient balance")
+            entries = [(key, self._book(key)[key], amount) for key, amount in debits.items()]
+            entries.extend((key, self._book(key)[key], 0) for key in credits if key in self._book(key))
+            for _, account, amount in entries:
+                account.pending += amount
+                self._start(account)
+        return entries
+    
+    def complete(self, entries: List[Tuple[Any, Account, int]], changes: Optional[Dict[Any, int]]):
+        """Finish a reserve(): apply the balance changes the write made, or with changes=None
+        (rejected, or outcome unknown) reload those accounts on their next use"""
+        with self._lock:
+            for key, account, amount in entries:
+                account.pending -= amount
+                account.in_flight -= 1
+                if changes is None:
+                    account.loaded_at = float("-inf")
+                else:
+                    account.balance += changes.get(key, 0)
+    
+    # Order commitments
+    def commit_order(self, order: Any, quantity: Optional[int] = None):
+        """Reserve what a resting order may still trade: notional for buys, units for sells
+        
+        quantity (default: all of order.remaining) adds to an existing commitment,
+        e.g. when an unsettled auction fill is put back on the order.
+        """
+        quantity = order.remaining if quantity is None else quantity
+        if not quantity:
+            return
+        if order.side == "buy":
+            if order.price is None:
+                return
+            account, per_unit = self.account(order.user_id), order.price
+        else:
+            account, per_unit = self.position(order.user_id, order.collectible_id), UNIT_SCALE
+        with self._lock:
+            entry = self._orders.get(order.order_id)
+            if entry is None:
+                self._orders[order.order_id] = [account, per_unit, quantity]
+            else:
+                entry[2] += quantity
+            account.committed += per_unit * quantity
+    
+    def release_order(self, order_id: int):
+        """Drop what is left of a cancelled order's commitment"""
+        self._uncommit(order_id, None)
+    
+    def on_trades(self, trades: List[Any]):
+        """Matching engine trade listener: consume commitments, debit both sides until settled"""
+        for trade in trades:
+            self._fill(trade.trade_id, trade.collectible_id, trade.buy_order_id, trade.sell_order_id,
+                       trade.buyer_id, trade.seller_id, trade.price, trade.quantity)
+    
+    def on_auctions(self, results: List[Dict[str, Any]]):
+        """Call auction result listener"""
+        for result in results:
+            price = to_cents(result["price"])
+            for fill in result["fills"]:
+                self._fill(fill["trade_id"], result["collectible_id"], fill["buy_order_id"],
+                           fill["sell_order_id"], fill["buyer_id"], fill["seller_id"], price, fill["quantity"])
+    
+    def on_recovered(self, trades: List[Any], results: List[Dict[str, Any]]):
+        """Debit fills replayed from the WAL that are settled again (their orders are already reduced)"""
+        for trade in trades:
+            self._debit(trade.trade_id, trade.collectible_id, trade.buyer_id, trade.seller_id,
+                        trade.price, trade.quantity)
+        for result in results:
+            price = to_cents(result["price"])
+            for fill in result["fills"]:
+                self._debit(fill["trade_id"], result["collectible_id"], fill["buyer_id"], fill["seller_id"],
+                            price, fill["quantity"])
+    
+    def settled(self, trade_id: int):
+        """A fill was written: credit the proceeds to the seller and the units to the buyer"""
+        with self._lock:
+            fill = self._unsettled.pop(trade_id, None)
+            if fill is None:
+                return
+            debits, credits = fill
+            for account, _ in debits:
+                account.in_flight -= 1
+            for account, amount in credits:
+                account.in_flight -= 1
+                account.balance += amount
+    
+    def failed(self, trade_id: int):
+        """A fill was not written: return what it debited"""
+        with self._lock:
+            fill = self._unsettled.pop(trade_id, None)
+            if fill is None:
+                return
+            debits, credits = fill
+            for account, amount in debits:
+                account.in_flight -= 1
+                account.balance += amount
+            for account, _ in credits:
+                account.in_flight -= 1
+    
+    def _fill(self, trade_id: int, collectible_id: str, buy_order_id: int, sell_order_id: int,
+              buyer_id: str, seller_id: str, price: int, quantity: int):
+        self._uncommit(buy_order_id, quantity)
+        self._uncommit(sell_order_id, quantity)
+        self._debit(trade_id, collectible_id, buyer_id, seller_id, price, quantity)
+    
+    def _debit(self, trade_id: int, collectible_id: str, buyer_id: str, seller_id: str,
+               price: int, quantity: int):
+        if buyer_id == seller_id:
+            return
+        units = quantity * UNIT_SCALE
+        with self._lock:
+            # Only accounts cached now are adjusted; others load the settled figures
+            debits = [(account, amount) for account, amount in
+                      ((self.accounts.get(buyer_id), price * quantity),
+                       (self.positions.get((seller_id, collectible_id)), units)) if account is not None]
+            credits = [(account, amount) for account, amount in
+                       ((self.accounts.get(seller_id), price * quantity),
+                        (self.positions.get((buyer_id, collectible_id)), units)) if account is not None]
+            for account, amount in debits:
+                account.balance -= amount
+            for account, _ in debits + credits:
+                self._start(account)
+            self._unsettled[trade_id] = (debits, credits)
+    
+    def _uncommit(self, order_id: int, quantity: Optional[int]):
+        with self._lock:
+            entry = self._orders.get(order_id)
+            if entry is None:
+                return
+            account, per_unit, remaining = entry
+            quantity = remaining if quantity is None else min(quantity, remaining)
+            account.committed -= per_unit * quantity
+            entry[2] -= quantity
+            if not entry[2]:
+                del self._orders[order_id]
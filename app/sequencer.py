@@ -0,0 +1,44 @@
+"""
+Per-user command sequencing
+Balance mutations for one user run one at a time in arrival order, while
+different users proceed concurrently. There is no global lock.
+"""
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Hashable
+import asyncio
+import functools
+
+class KeyedSequencer:
+    """FIFO async lock per key, dropped once no command for the key is pending"""
+    
+    def __init__(self):
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._pending: Dict[Hashable, int] = {}
+    
+    @asynccontextmanager
+    async def hold(self, key: Hashable):
+        """Hold the key's slot for the duration of the block"""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._pending[key] = self._pending.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._pending[key] -= 1
+            if self._pending[key] == 0:
+                del self._pending[key]
+                del self._locks[key]
+    
+    async def run(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking call in the thread pool, ordered behind earlier calls for key"""
+        async with self.hold(key):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+    
+    def __len__(self) -> int:
+        return len(self._locks)
+
+# Global instance used for balance mutations
+user_sequencer = KeyedSequencer()
@@ -0,0 +1,93 @@
+"""
+Recent trades per collectible, served from memory
+Each collectible keeps a fixed-size ring of its latest ticks (trades, auction
+clearings and manual price updates) in preallocated NumPy arrays. The ring is
+filled from the price feed on the write path and warmed from price_history at
+startup, so "recent trades" views never touch the database.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import os
+
+import numpy as np
+
+TRADE_TAPE_SIZE = int(os.getenv("TRADE_TAPE_SIZE", "200"))
+
+# Tick sources; "history" marks rows loaded from price_history at startup
+SOURCES = ("history", "price_update", "trade", "auction", "amm")
+
+class TradeRing:
+    """Fixed-capacity ring buffer of (price, quantity, timestamp, source) ticks"""
+    __slots__ = ("prices", "quantities", "timestamps", "sources", "head", "count")
+    
+    def __init__(self, size: int):
+        self.prices = np.zeros(size, dtype=np.float64)
+        # -1 = quantity unknown (manual price updates, history)
+        self.quantities = np.full(size, -1, dtype=np.int64)
+        self.timestamps = np.zeros(size, dtype=np.float64)
+        self.sources = np.zeros(size, dtype=np.int8)
+        # Next slot to write
+        self.head = 0
+        self.count = 0
+    
+    def append(self, price: float, quantity: Optional[int], timestamp: float, source: str):
+        i = self.head
+        self.prices[i] = price
+        self.quantities[i] = quantity if quantity is not None else -1
+        self.timestamps[i] = timestamp
+        self.sources[i] = SOURCES.index(source) if source in SOURCES else 0
+        self.head = (i + 1) % len(self.prices)
+        if self.count < len(self.prices):
+            self.count += 1
+    
+    def latest(self, limit: int) -> List[Dict[str, Any]]:
+        """Up to limit ticks, newest first"""
+        n = min(limit, self.count)
+        slots = (self.head - 1 - np.arange(n)) % len(self.prices)
+        return [
+            {
+                "price": price,
+                "quantity": quantity if quantity >= 0 else None,
+                "source": SOURCES[source],
+                "timestamp": timestamp
+            }
+            for price, quantity, timestamp, source in zip(
+                self.prices[slots].tolist(), self.quantities[slots].tolist(),
+                self.timestamps[slots].tolist(), self.sources[slots].tolist()
+            )
+        ]
+
+class TradeTape:
+    """One TradeRing per collectible"""
+    
+    def __init__(self, size: int = TRADE_TAPE_SIZE):
+        self.size = size
+        self.rings: Dict[str, TradeRing] = {}
+    
+    def _ring(self, collectible_id: str) -> TradeRing:
+        ring = self.rings.get(collectible_id)
+        if ring is None:
+            ring = self.rings[collectible_id] = TradeRing(self.size)
+        return ring
+    
+    def record(self, event: Dict[str, Any]):
+        """Price feed listener"""
+        self._ring(event["collectible_id"]).append(
+            event["price"], event.get("quantity"), event["timestamp"], event["source"]
+        )
+    
+    def warm(self, collectible_id: str, rows: List[Dict[str, Any]]):
+        """Seed an empty ring from price_history rows (newest first)"""
+        ring = self._ring(collectible_id)
+        if ring.count:
+            return
+        for row in reversed(rows[:self.size]):
+            recorded_at = datetime.fromisoformat(row["recorded_at"]).timestamp()
+            ring.append(float(row["price"]), None, recorded_at, "history")
+    
+    def latest(self, collectible_id: str, limit: int) -> List[Dict[str, Any]]:
+        ring = self.rings.get(collectible_id)
+        return ring.latest(limit) if ring is not None else []
+
+# Global instance
+trade_tape = TradeTape()
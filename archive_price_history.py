@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Price history archive job
+Exports price_history rows older than PRICE_ARCHIVE_AGE_DAYS into the local
+columnar archive, continuing from each collectible's watermark. Run it
+periodically (e.g. daily) on the host that serves the API.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from app.db_service import db_service
+from app.price_archive import price_archive, PRICE_ARCHIVE_AGE_DAYS
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive cold price history into columnar files")
+    parser.add_argument("--age-days", type=float, default=PRICE_ARCHIVE_AGE_DAYS,
+                        help="Archive rows older than this many days")
+    parser.add_argument("--collectible-id", action="append", help="Only these collectibles (repeatable)")
+    args = parser.parse_args()
+    
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=args.age_days)).isoformat()
+    collectible_ids = args.collectible_id or [row["id"] for row in db_service.get_all_collectibles()]
+    
+    print(f"🗄️  Archiving price history recorded before {cutoff}...")
+    start = time.perf_counter()
+    total = 0
+    for collectible_id in collectible_ids:
+        rows = []
+        for page in db_service.iter_price_pages(collectible_id, after=price_archive.watermark(collectible_id),
+                                                until=cutoff):
+            rows.extend(page)
+        archived = price_archive.append(collectible_id, rows)
+        if archived:
+            size = os.path.getsize(price_archive.path(collectible_id))
+            print(f"  {collectible_id}: +{archived} rows ({size / 1024:.1f} KiB on disk)")
+        total += archived
+    
+    print(f"✓ Archived {total} rows for {len(collectible_ids)} collectibles "
+          f"({time.perf_counter() - start:.2f}s)")
+
+if __name__ == "__main__":
+    main()
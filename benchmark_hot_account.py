@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Hot Account Contention Benchmark
+Many distinct buyers purchase concurrently; every purchase credits the
+system:revenue house account. Runs once unsharded and once sharded to show
+the throughput ceiling imposed by the single balance row.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from app.db_service import db_service
+from benchmark_purchases import API_BASE_URL, register_buyer
+
+HOT_ACCOUNT = "system:revenue"
+
+def prepare_buyers(count, funds):
+    print(f"👥 Registering {count} buyers...")
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        buyers = list(pool.map(lambda _: register_buyer(), range(count)))
+    for headers in buyers:
+        requests.put(f"{API_BASE_URL}/profile/balance/{funds}", headers=headers)
+    return buyers
+
+def run_round(slots, buyers, collectible, purchases_per_buyer):
+    db_service.configure_hot_account(HOT_ACCOUNT, slots)
+    revenue_before = db_service.get_account_balance(HOT_ACCOUNT)
+    
+    def buy(headers):
+        succeeded = 0
+        for _ in range(purchases_per_buyer):
+            response = requests.post(f"{API_BASE_URL}/purchases", headers=headers, json={
+                "collectible_id": collectible["id"]
+            })
+            succeeded += response.status_code == 200
+        return succeeded
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(buyers)) as pool:
+        succeeded = sum(pool.map(buy, buyers))
+    elapsed = time.perf_counter() - start
+    
+    revenue_after = db_service.get_account_balance(HOT_ACCOUNT)
+    expected = succeeded * float(collectible["current_price"])
+    
+    print(f"📊 slots={slots}")
+    print(f"  Purchases: {succeeded} in {elapsed:.2f}s")
+    print(f"  Throughput: {succeeded / elapsed:.1f} purchases/s")
+    print(f"  Revenue credited: {revenue_after - revenue_before:.2f} (expected {expected:.2f})")
+    return succeeded / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hot house-account contention")
+    parser.add_argument("--buyers", type=int, default=64)
+    parser.add_argument("--purchases-per-buyer", type=int, default=20)
+    parser.add_argument("--slots", type=int, default=16)
+    args = parser.parse_args()
+    
+    collectibles = requests.get(f"{API_BASE_URL}/collectibles").json()
+    collectible = next(c for c in collectibles if float(c.get("current_price") or 0) > 0)
+    funds = float(collectible["current_price"]) * args.purchases_per_buyer * 2
+    
+    buyers = prepare_buyers(args.buyers, funds)
+    
+    baseline = run_round(1, buyers, collectible, args.purchases_per_buyer)
+    sharded = run_round(args.slots, buyers, collectible, args.purchases_per_buyer)
+    
+    print("-" * 40)
+    print(f"✓ Sharded / unsharded throughput: {sharded / baseline:.2f}x")
+    
+    db_service.consolidate_hot_accounts()
+
+if __name__ == "__main__":
+    main()
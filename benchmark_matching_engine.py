@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Matching Engine Benchmark
+Drives the in-memory order books with a random mix of limit, market and
+cancel operations and reports order operations per second (single core).
+Target: at least 100k ops/s.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import random
+import time
+from app.matching_engine import MatchingEngine, BUY, SELL, LIMIT, MARKET
+
+def run(operations, collectibles, seed):
+    rng = random.Random(seed)
+    engine = MatchingEngine()
+    collectible_ids = [f"collectible-{i}" for i in range(collectibles)]
+    users = [f"user-{i}" for i in range(1000)]
+    resting = []
+    trades = 0
+    
+    # Pre-generate the workload so only engine time is measured
+    workload = []
+    for _ in range(operations):
+        roll = rng.random()
+        if roll < 0.25:
+            workload.append(("cancel", rng.random()))
+        else:
+            side = BUY if rng.random() < 0.5 else SELL
+            order_type = MARKET if roll > 0.95 else LIMIT
+            # Prices cluster around 10.00 tokens (1000 ticks)
+            price = 1000 + rng.randint(-20, 20) if order_type == LIMIT else None
+            workload.append((order_type, rng.choice(users), rng.choice(collectible_ids),
+                             side, rng.randint(1, 10), price))
+    
+    start = time.perf_counter()
+    for op in workload:
+        if op[0] == "cancel":
+            if resting:
+                index = int(op[1] * len(resting))
+                resting[index] = resting[-1]
+                engine.cancel(resting.pop())
+            continue
+        order_type, user_id, collectible_id, side, quantity, price = op
+        order, fills = engine.submit(user_id, collectible_id, side, quantity, price, order_type)
+        trades += len(fills)
+        if order.remaining and order_type == LIMIT:
+            resting.append(order.order_id)
+    elapsed = time.perf_counter() - start
+    
+    resting_orders = sum(len(book.orders) for book in engine.books.values())
+    print(f"📊 Matching engine: {operations} operations across {collectibles} books")
+    print(f"  Trades: {trades}")
+    print(f"  Resting orders: {resting_orders}")
+    print(f"  Elapsed: {elapsed:.3f}s")
+    print(f"  Throughput: {operations / elapsed:,.0f} ops/s")
+    if operations / elapsed >= 100_000:
+        print("✓ Meets 100k ops/s target")
+    else:
+        print("✗ Below 100k ops/s target")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the in-memory matching engine")
+    parser.add_argument("--operations", type=int, default=1_000_000)
+    parser.add_argument("--collectibles", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    run(args.operations, args.collectibles, args.seed)
+
+if __name__ == "__main__":
+    main()
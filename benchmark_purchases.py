@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Purchase Throughput Benchmark
+Fires many concurrent purchases at one account and checks for lost updates
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import time
+import uuid
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+API_BASE_URL = os.getenv("API_BASE_URL", "http://127.0.0.1:8000")
+
+def register_buyer():
+    """Register a throwaway user and return auth headers"""
+    suffix = uuid.uuid4().hex[:8]
+    response = requests.post(f"{API_BASE_URL}/auth/register", json={
+        "email": f"bench.{suffix}@example.com",
+        "password": "BenchPassword123!",
+        "username": f"bench_{suffix}"
+    })
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def get_balance(headers):
+    response = requests.get(f"{API_BASE_URL}/profile/balance", headers=headers)
+    response.raise_for_status()
+    return float(response.json()["balance"])
+
+def buy_atomic(headers, collectible):
+    """One round trip: POST /purchases"""
+    response = requests.post(f"{API_BASE_URL}/purchases", headers=headers, json={
+        "collectible_id": collectible["id"],
+        "description": "benchmark purchase"
+    })
+    return response.status_code == 200
+
+def buy_legacy(headers, collectible):
+    """Two round trips: read-modify-write balance, then record the transaction"""
+    price = float(collectible["current_price"])
+    balance = get_balance(headers)
+    if balance < price:
+        return False
+    requests.put(f"{API_BASE_URL}/profile/balance/{balance - price}", headers=headers)
+    response = requests.post(f"{API_BASE_URL}/transactions", headers=headers, json={
+        "collectible_id": collectible["id"],
+        "transaction_type": "purchase",
+        "amount": -price,
+        "description": "benchmark purchase"
+    })
+    return response.status_code == 200
+
+def run(mode, purchases, concurrency):
+    collectibles = requests.get(f"{API_BASE_URL}/collectibles").json()
+    collectible = next(c for c in collectibles if float(c.get("current_price") or 0) > 0)
+    price = float(collectible["current_price"])
+    
+    headers = register_buyer()
+    starting_balance = price * purchases
+    requests.put(f"{API_BASE_URL}/profile/balance/{starting_balance}", headers=headers)
+    
+    buy = buy_atomic if mode == "atomic" else buy_legacy
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: buy(headers, collectible), range(purchases)))
+    elapsed = time.perf_counter() - start
+    
+    succeeded = sum(results)
+    final_balance = get_balance(headers)
+    expected_balance = starting_balance - succeeded * price
+    
+    print(f"📊 Mode: {mode}")
+    print(f"  Purchases: {purchases} ({concurrency} concurrent buyers, one account)")
+    print(f"  Succeeded: {succeeded}")
+    print(f"  Elapsed: {elapsed:.2f}s")
+    print(f"  Throughput: {purchases / elapsed:.1f} purchases/s")
+    print(f"  Final balance: {final_balance:.2f} (expected {expected_balance:.2f})")
+    if abs(final_balance - expected_balance) < 0.005:
+        print("✓ No lost updates")
+    else:
+        print(f"✗ Lost updates: {abs(final_balance - expected_balance) / price:.0f} purchases unaccounted")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent purchases")
+    parser.add_argument("--mode", choices=["atomic", "legacy"], default="atomic")
+    parser.add_argument("--purchases", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    
+    run(args.mode, args.purchases, args.concurrency)
+
+if __name__ == "__main__":
+    main()
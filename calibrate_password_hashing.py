@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Password hashing calibration
+Benchmarks bcrypt on this host and recommends a BCRYPT_ROUNDS value
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+from app.auth import calibrate_bcrypt_rounds, BCRYPT_ROUNDS, BCRYPT_TARGET_VERIFY_MS
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate bcrypt cost for this host")
+    parser.add_argument("--target-ms", type=float, default=BCRYPT_TARGET_VERIFY_MS,
+                        help="Target time for a single password verify (milliseconds)")
+    parser.add_argument("--max-rounds", type=int, default=16,
+                        help="Highest cost factor to try")
+    args = parser.parse_args()
+    
+    print("🔐 Calibrating bcrypt cost factor...")
+    print(f"  Target verify time: {args.target_ms}ms")
+    print(f"  Current BCRYPT_ROUNDS: {BCRYPT_ROUNDS}")
+    print("-" * 40)
+    
+    result = calibrate_bcrypt_rounds(target_ms=args.target_ms, max_rounds=args.max_rounds)
+    
+    for rounds, elapsed in result["timings_ms"].items():
+        marker = "✓" if elapsed <= args.target_ms else "✗"
+        print(f"  {marker} rounds={rounds:<3} verify={elapsed}ms")
+    
+    print("-" * 40)
+    print(f"✓ Recommended setting: BCRYPT_ROUNDS={result['rounds']}")
+    if result["rounds"] != BCRYPT_ROUNDS:
+        print("  Existing hashes will be upgraded transparently on next login")
+
+if __name__ == "__main__":
+    main()
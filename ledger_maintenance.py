@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Ledger maintenance job
+Consolidates hot-account slots, takes periodic per-account snapshots and
+reconciles materialized balances. Schedule `consolidate` (e.g. every minute)
+and `snapshot` (e.g. hourly) so balance-at-time queries and reconciliation
+only replay entries since the last snapshot.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import time
+from app.db_service import db_service
+
+def consolidate():
+    print("🧮 Consolidating hot account slots...")
+    count = db_service.consolidate_hot_accounts()
+    print(f"✓ Consolidated {count} hot accounts")
+
+def snapshot():
+    print("📸 Taking ledger snapshots...")
+    count = db_service.take_ledger_snapshots()
+    print(f"✓ Snapshotted {count} accounts")
+
+def reconcile():
+    print("🔍 Reconciling ledger balances...")
+    start = time.perf_counter()
+    mismatches = db_service.reconcile_ledger()
+    elapsed = time.perf_counter() - start
+    
+    if not mismatches:
+        print(f"✓ All ledger balances consistent ({elapsed:.2f}s)")
+        return True
+    
+    print(f"✗ {len(mismatches)} accounts out of balance ({elapsed:.2f}s)")
+    for row in mismatches:
+        print(f"  {row['account_id']}: replayed={row['replayed_balance']} "
+              f"materialized={row['materialized_balance']}")
+    return False
+
+def main():
+    parser = argparse.ArgumentParser(description="Ledger snapshot and reconciliation job")
+    parser.add_argument("command", choices=["consolidate", "snapshot", "reconcile", "all"])
+    args = parser.parse_args()
+    
+    ok = True
+    if args.command in ("consolidate", "all"):
+        consolidate()
+    if args.command in ("snapshot", "all"):
+        snapshot()
+    if args.command in ("reconcile", "all"):
+        ok = reconcile()
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
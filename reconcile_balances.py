@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Balance reconciliation job
+Compares token_balances.balance with the per-user sum of ledger-posted
+transactions.amount. By default resumes from the watermark saved by the
+previous run; run once with --full after adding transactions.ledger_posted.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+from app.db_service import db_service
+from app.reconciliation import BalanceReconciler, RECONCILE_CHUNK_SIZE, RECONCILE_STATE_PATH
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile balances against transactions")
+    parser.add_argument("--full", action="store_true", help="Ignore the saved watermark and rescan everything")
+    parser.add_argument("--chunk-size", type=int, default=RECONCILE_CHUNK_SIZE)
+    parser.add_argument("--state", default=RECONCILE_STATE_PATH)
+    parser.add_argument("--limit", type=int, default=50, help="Mismatches to print")
+    args = parser.parse_args()
+    
+    print("🔍 Reconciling token balances against transactions...")
+    reconciler = BalanceReconciler(db_service, chunk_size=args.chunk_size, state_path=args.state)
+    report = reconciler.run(incremental=not args.full)
+    
+    print(f"  Accounts checked: {report['accounts_checked']}")
+    print(f"  Accounts skipped (changed after the cutoff): {report['accounts_skipped']}")
+    print(f"  Transactions read: {report['transactions_read']}")
+    print(f"  Watermark: {report['watermark']}")
+    print(f"  Elapsed: {report['elapsed_seconds']}s")
+    
+    mismatches = report["mismatches"]
+    if not mismatches:
+        print("✓ All balances match their transactions")
+        return
+    
+    print(f"✗ {len(mismatches)} mismatched accounts")
+    for row in mismatches[:args.limit]:
+        print(f"  {row['user_id']}: balance={row['balance']} "
+              f"transactions={row['transaction_sum']} diff={row['difference']}")
+    sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -95,6 +95,120 @@ def create_tables():
             status VARCHAR DEFAULT 'pending',
             created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
         );
+        """,
+        
+        # Ledger entries: append-only double-entry source of truth.
+        # account_id is a user UUID or a 'system:<name>' house account.
+        """
+        CREATE TABLE IF NOT EXISTS ledger_entries (
+            id BIGSERIAL PRIMARY KEY,
+            journal_id UUID NOT NULL,
+            account_id VARCHAR NOT NULL,
+            amount DECIMAL(12,2) NOT NULL,
+            transaction_id UUID REFERENCES transactions(id) ON DELETE RESTRICT,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+        """,
+        
+        # Ledger balances: materialized incrementally by ledger_post()
+        """
+        CREATE TABLE IF NOT EXISTS ledger_balances (
+            account_id VARCHAR PRIMARY KEY,
+            balance DECIMAL(12,2) NOT NULL DEFAULT 0.00,
+            last_entry_id BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+        """,
+        
+        # Ledger snapshots: balance of an account as of a given entry
+        """
+        CREATE TABLE IF NOT EXISTS ledger_snapshots (
+            account_id VARCHAR NOT NULL,
+            entry_id BIGINT NOT NULL,
+            balance DECIMAL(12,2) NOT NULL,
+            as_of TIMESTAMP WITH TIME ZONE NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            PRIMARY KEY (account_id, entry_id)
+        );
+        """,
+        
+        # Hot accounts: house accounts whose credits are spread across slots
+        """
+        CREATE TABLE IF NOT EXISTS ledger_hot_accounts (
+            account_id VARCHAR PRIMARY KEY,
+            slots INTEGER NOT NULL CHECK (slots > 1)
+        );
+        """,
+        
+        # Per-slot sub-balances, folded into ledger_balances by consolidation
+        """
+        CREATE TABLE IF NOT EXISTS ledger_balance_slots (
+            account_id VARCHAR NOT NULL,
+            slot INTEGER NOT NULL,
+            balance DECIMAL(12,2) NOT NULL DEFAULT 0.00,
+            PRIMARY KEY (account_id, slot)
+        );
+        """,
+        
+        # Per-user transaction aggregates, maintained by trigger on insert
+        """
+        CREATE TABLE IF NOT EXISTS transaction_summaries (
+            user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+            transaction_type VARCHAR NOT NULL,
+            month DATE NOT NULL,
+            total_amount DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, transaction_type, month)
+        );
+        """,
+        
+        # Constant-product AMM pools; the token reserve is also held by the
+        # ledger account 'system:amm:<collectible_id>'
+        """
+        CREATE TABLE IF NOT EXISTS amm_pools (
+            collectible_id UUID PRIMARY KEY REFERENCES collectibles(id) ON DELETE CASCADE,
+            token_reserve DECIMAL(14,2) NOT NULL CHECK (token_reserve > 0),
+            unit_reserve DECIMAL(18,6) NOT NULL CHECK (unit_reserve > 0),
+            fee_bps INTEGER NOT NULL DEFAULT 30 CHECK (fee_bps >= 0 AND fee_bps < 10000),
+            created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+        """,
+        
+        # Balance holds (e.g. pending redemptions); held funds sit in the
+        # 'system:holds' ledger account until released or settled
+        """
+        CREATE TABLE IF NOT EXISTS balance_reservations (
+            id UUID PRIMARY KEY,
+            user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+            purpose VARCHAR NOT NULL,
+            reference VARCHAR,
+            amount DECIMAL(10,2) NOT NULL CHECK (amount > 0),
+            status VARCHAR NOT NULL DEFAULT 'held',
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+        """,
+        
+        # Units of each collectible a user owns; sellers must hold what they sell
+        """
+        CREATE TABLE IF NOT EXISTS collectible_holdings (
+            user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+            collectible_id UUID REFERENCES collectibles(id) ON DELETE CASCADE,
+            units DECIMAL(18,6) NOT NULL DEFAULT 0 CHECK (units >= 0),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            PRIMARY KEY (user_id, collectible_id)
+        );
+        """,
+        
+        # Matching engine trade ids already settled, so a trade replayed
+        # from the market WAL after a crash is never settled twice
+        """
+        CREATE TABLE IF NOT EXISTS market_trades (
+            trade_id BIGINT PRIMARY KEY,
+            collectible_id UUID REFERENCES collectibles(id) ON DELETE CASCADE,
+            recorded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
         """
     ]
     
@@ -114,10 +228,1107 @@ def create_tables():
             except Exception as e2:
                 print(f"  Alternative method also failed: {e2}")
 
+def migrate_tables():
+    """Alter tables created by earlier versions of this script"""
+    
+    migration_commands = [
+        # Traded quantity behind a price (NULL for manual price updates)
+        """
+        ALTER TABLE price_history ADD COLUMN IF NOT EXISTS quantity INTEGER;
+        """,
+        
+        # Entries are append-only, so a referenced transaction may not be
+        # deleted (SET NULL would try to rewrite the entry)
+        """
+        ALTER TABLE ledger_entries DROP CONSTRAINT IF EXISTS ledger_entries_transaction_id_fkey;
+        ALTER TABLE ledger_entries ADD CONSTRAINT ledger_entries_transaction_id_fkey
+            FOREIGN KEY (transaction_id) REFERENCES transactions(id) ON DELETE RESTRICT;
+        """,
+        
+        # Rows created through POST /transactions are records only: no ledger
+        # journal moved a balance for them, so reconciliation leaves them out
+        """
+        ALTER TABLE transactions ADD COLUMN IF NOT EXISTS ledger_posted BOOLEAN NOT NULL DEFAULT TRUE;
+        """
+    ]
+    
+    for i, sql in enumerate(migration_commands, 1):
+        try:
+            supabase.rpc('exec_sql', {'sql': sql}).execute()
+            print(f"✓ Applied migration {i}")
+        except Exception as e:
+            print(f"✗ Error applying migration {i}: {e}")
+
+def create_indexes():
+    """Create secondary indexes used by hot query paths"""
+    
+    index_commands = [
+        # Login lookups use lowercase emails; normalize legacy rows whose
+        # lowercase form is not taken by another account
+        """
+        UPDATE users u SET email = lower(u.email)
+         WHERE u.email <> lower(u.email)
+           AND NOT EXISTS (
+               SELECT 1 FROM users other
+                WHERE other.id <> u.id AND lower(other.email) = lower(u.email)
+           );
+        """,
+        
+        # Accounts differing only in email case need a manual merge; report them
+        """
+        DO $$
+        DECLARE
+            v_collisions TEXT;
+        BEGIN
+            SELECT string_agg(emails, '; ') INTO v_collisions
+              FROM (
+                  SELECT string_agg(email || ' (' || id || ')', ', ' ORDER BY created_at) AS emails
+                    FROM users
+                   GROUP BY lower(email)
+                  HAVING count(*) > 1
+              ) duplicates;
+            IF v_collisions IS NOT NULL THEN
+                RAISE EXCEPTION 'Emails differing only in case were left unnormalized: %', v_collisions;
+            END IF;
+        END $$;
+        """,
+        
+        # Covering index so login is a single index-only read
+        """
+        CREATE INDEX IF NOT EXISTS idx_users_login
+            ON users (email) INCLUDE (id, username, password_hash);
+        """,
+        
+        # Keyset-paginated transaction history and exports
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_created
+            ON transactions (user_id, created_at, id);
+        """,
+        
+        # Full-table keyset scans (reconciliation)
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_created
+            ON transactions (created_at, id);
+        """,
+        
+        # Ledger replay reads one account's entries after a snapshot
+        """
+        CREATE INDEX IF NOT EXISTS idx_ledger_entries_account
+            ON ledger_entries (account_id, id);
+        """,
+        
+        """
+        CREATE INDEX IF NOT EXISTS idx_ledger_snapshots_as_of
+            ON ledger_snapshots (account_id, as_of);
+        """,
+        
+        # Latest ticks per collectible (trade tape warm-up, price history)
+        """
+        CREATE INDEX IF NOT EXISTS idx_price_history_collectible_recorded
+            ON price_history (collectible_id, recorded_at);
+        """
+    ]
+    
+    for i, sql in enumerate(index_commands, 1):
+        try:
+            supabase.rpc('exec_sql', {'sql': sql}).execute()
+            print(f"✓ Applied index statement {i}")
+        except Exception as e:
+            print(f"✗ Error applying index statement {i}: {e}")
+
+def create_functions():
+    """Create stored procedures for multi-statement atomic operations"""
+    
+    function_commands = [
+        # Ledger entries may never be rewritten
+        """
+        CREATE OR REPLACE FUNCTION ledger_entries_append_only() RETURNS TRIGGER AS $$
+        BEGIN
+            RAISE EXCEPTION 'ledger_entries is append-only';
+        END;
+        $$ LANGUAGE plpgsql;
+        
+        DROP TRIGGER IF EXISTS ledger_entries_no_rewrite ON ledger_entries;
+        CREATE TRIGGER ledger_entries_no_rewrite
+            BEFORE UPDATE OR DELETE ON ledger_entries
+            FOR EACH ROW EXECUTE FUNCTION ledger_entries_append_only();
+        """,
+        
+        # Post a balanced journal and materialize balances incrementally.
+        # Callers must already hold the token_balances row locks of any
+        # user accounts involved, which keeps lock order consistent.
+        """
+        CREATE OR REPLACE FUNCTION ledger_post(
+            p_entries JSONB,
+            p_transaction_id UUID DEFAULT NULL
+        ) RETURNS UUID AS $$
+        DECLARE
+            v_journal_id UUID := gen_random_uuid();
+            v_entry JSONB;
+            v_account VARCHAR;
+            v_amount DECIMAL(12,2);
+            v_entry_id BIGINT;
+            v_slots INTEGER;
+            v_slot INTEGER;
+        BEGIN
+            IF (SELECT COALESCE(SUM((e->>'amount')::DECIMAL(12,2)), 0)
+                  FROM jsonb_array_elements(p_entries) e) <> 0 THEN
+                RAISE EXCEPTION 'unbalanced_journal';
+            END IF;
+            
+            -- Lock (creating if needed) every non-hot balance row in account
+            -- order before any entry id is allocated: per account, ids are
+            -- then assigned in commit order, and concurrent journals touching
+            -- the same accounts cannot deadlock
+            INSERT INTO ledger_balances (account_id)
+            SELECT DISTINCT e->>'account_id'
+              FROM jsonb_array_elements(p_entries) e
+             WHERE e->>'account_id' NOT IN (SELECT account_id FROM ledger_hot_accounts)
+             ORDER BY 1
+            ON CONFLICT (account_id) DO NOTHING;
+            
+            PERFORM 1 FROM ledger_balances
+             WHERE account_id IN (SELECT e->>'account_id' FROM jsonb_array_elements(p_entries) e)
+               AND account_id NOT IN (SELECT account_id FROM ledger_hot_accounts)
+             ORDER BY account_id
+               FOR UPDATE;
+            
+            FOR v_entry IN SELECT * FROM jsonb_array_elements(p_entries) LOOP
+                v_account := v_entry->>'account_id';
+                v_amount := (v_entry->>'amount')::DECIMAL(12,2);
+                
+                SELECT slots INTO v_slots FROM ledger_hot_accounts WHERE account_id = v_account;
+                
+                IF v_slots IS NOT NULL THEN
+                    -- Hot account: hit one random slot so concurrent posters
+                    -- rarely wait on the same row lock. The slot is drawn once;
+                    -- random() in the WHERE clause would be re-evaluated per row.
+                    v_slot := floor(random() * v_slots)::INTEGER;
+                    UPDATE ledger_balance_slots
+                       SET balance = balance + v_amount
+                     WHERE account_id = v_account
+                       AND slot = v_slot;
+                    IF NOT FOUND THEN
+                        RAISE EXCEPTION 'ledger slot %/% missing', v_account, v_slot;
+                    END IF;
+                    
+                    INSERT INTO ledger_entries (journal_id, account_id, amount, transaction_id)
+                    VALUES (v_journal_id, v_account, v_amount, p_transaction_id);
+                ELSE
+                    INSERT INTO ledger_entries (journal_id, account_id, amount, transaction_id)
+                    VALUES (v_journal_id, v_account, v_amount, p_transaction_id)
+                    RETURNING id INTO v_entry_id;
+                    
+                    -- The row is locked above; GREATEST keeps last_entry_id
+                    -- monotonic even for rows written by older versions
+                    UPDATE ledger_balances
+                       SET balance = balance + v_amount,
+                           last_entry_id = GREATEST(last_entry_id, v_entry_id),
+                           updated_at = NOW()
+                     WHERE account_id = v_account;
+                    
+                    -- token_balances stays as the read-optimized copy for user accounts
+                    IF v_account NOT LIKE 'system:%' THEN
+                        UPDATE token_balances
+                           SET balance = balance + v_amount, last_updated = NOW()
+                         WHERE user_id = v_account::UUID;
+                    END IF;
+                END IF;
+            END LOOP;
+            
+            RETURN v_journal_id;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # Add (or with a negative amount, remove) units of a collectible;
+        # removing more than the user holds raises insufficient_units
+        """
+        CREATE OR REPLACE FUNCTION adjust_holding(
+            p_user_id UUID,
+            p_collectible_id UUID,
+            p_units DECIMAL(18,6)
+        ) RETURNS DECIMAL(18,6) AS $$
+        DECLARE
+            v_units DECIMAL(18,6);
+        BEGIN
+            IF p_units < 0 THEN
+                UPDATE collectible_holdings
+                   SET units = units + p_units, updated_at = NOW()
+                 WHERE user_id = p_user_id AND collectible_id = p_collectible_id
+                   AND units >= -p_units
+                RETURNING units INTO v_units;
+                IF NOT FOUND THEN
+                    RAISE EXCEPTION 'insufficient_units';
+                END IF;
+            ELSE
+                INSERT INTO collectible_holdings (user_id, collectible_id, units)
+                VALUES (p_user_id, p_collectible_id, p_units)
+                ON CONFLICT (user_id, collectible_id) DO UPDATE
+                   SET units = collectible_holdings.units + EXCLUDED.units, updated_at = NOW()
+                RETURNING units INTO v_units;
+            END IF;
+            RETURN v_units;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # Purchase: debit buyer, credit house revenue, record the transaction.
+        # p_max_price is the price the caller reserved; a higher current price
+        # is refused rather than charged.
+        """
+        DROP FUNCTION IF EXISTS purchase_collectible(UUID, UUID, TEXT);
+        CREATE OR REPLACE FUNCTION purchase_collectible(
+            p_user_id UUID,
+            p_collectible_id UUID,
+            p_description TEXT DEFAULT NULL,
+            p_max_price DECIMAL(10,2) DEFAULT NULL
+        ) RETURNS JSONB AS $$
+        DECLARE
+            v_price DECIMAL(10,2);
+            v_balance DECIMAL(10,2);
+            v_transaction transactions;
+        BEGIN
+            SELECT current_price INTO v_price FROM collectibles WHERE id = p_collectible_id;
+            IF v_price IS NULL THEN
+                RAISE EXCEPTION 'collectible_not_found';
+            END IF;
+            IF v_price > p_max_price THEN
+                RAISE EXCEPTION 'price_changed';
+            END IF;
+            
+            SELECT balance INTO v_balance FROM token_balances
+             WHERE user_id = p_user_id FOR UPDATE;
+            IF v_balance IS NULL OR v_balance < v_price THEN
+                RAISE EXCEPTION 'insufficient_balance';
+            END IF;
+            
+            INSERT INTO transactions (user_id, collectible_id, transaction_type, amount, description)
+            VALUES (p_user_id, p_collectible_id, 'purchase', -v_price, p_description)
+            RETURNING * INTO v_transaction;
+            
+            PERFORM ledger_post(jsonb_build_array(
+                jsonb_build_object('account_id', p_user_id::TEXT, 'amount', -v_price),
+                jsonb_build_object('account_id', 'system:revenue', 'amount', v_price)
+            ), v_transaction.id);
+            PERFORM adjust_holding(p_user_id, p_collectible_id, 1);
+            
+            RETURN jsonb_build_object('transaction', to_jsonb(v_transaction), 'balance', v_balance - v_price);
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # Transfer: lock both balances in id order to avoid deadlocks
+        """
+        CREATE OR REPLACE FUNCTION transfer_tokens(
+            p_from_user_id UUID,
+            p_to_user_id UUID,
+            p_amount DECIMAL(10,2),
+            p_description TEXT DEFAULT NULL
+        ) RETURNS JSONB AS $$
+        DECLARE
+            v_balance DECIMAL(10,2);
+            v_transaction transactions;
+        BEGIN
+            IF p_amount <= 0 THEN
+                RAISE EXCEPTION 'invalid_amount';
+            END IF;
+            IF p_from_user_id = p_to_user_id THEN
+                RAISE EXCEPTION 'invalid_recipient';
+            END IF;
+            
+            PERFORM 1 FROM token_balances
+             WHERE user_id IN (p_from_user_id, p_to_user_id)
+             ORDER BY user_id FOR UPDATE;
+            
+            IF NOT EXISTS (SELECT 1 FROM token_balances WHERE user_id = p_to_user_id) THEN
+                RAISE EXCEPTION 'recipient_not_found';
+            END IF;
+            
+            SELECT balance INTO v_balance FROM token_balances WHERE user_id = p_from_user_id;
+            IF v_balance IS NULL OR v_balance < p_amount THEN
+                RAISE EXCEPTION 'insufficient_balance';
+            END IF;
+            
+            INSERT INTO transactions (user_id, transaction_type, amount, description)
+            VALUES (p_from_user_id, 'transfer_out', -p_amount, p_description)
+            RETURNING * INTO v_transaction;
+            
+            INSERT INTO transactions (user_id, transaction_type, amount, description)
+            VALUES (p_to_user_id, 'transfer_in', p_amount, p_description);
+            
+            PERFORM ledger_post(jsonb_build_array(
+                jsonb_build_object('account_id', p_from_user_id::TEXT, 'amount', -p_amount),
+                jsonb_build_object('account_id', p_to_user_id::TEXT, 'amount', p_amount)
+            ), v_transaction.id);
+            
+            RETURN jsonb_build_object('transaction', to_jsonb(v_transaction), 'balance', v_balance - p_amount);
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # Settle a matched trade: move tokens buyer -> seller and units
+        # seller -> buyer, record both sides and publish the trade price
+        """
+        DROP FUNCTION IF EXISTS record_trade(UUID, UUID, UUID, DECIMAL, INTEGER);
+        CREATE OR REPLACE FUNCTION record_trade(
+            p_collectible_id UUID,
+            p_buyer_id UUID,
+            p_seller_id UUID,
+            p_price DECIMAL(10,2),
+            p_quantity INTEGER,
+            p_trade_id BIGINT DEFAULT NULL
+        ) RETURNS JSONB AS $$
+        DECLARE
+            v_total DECIMAL(12,2) := p_price * p_quantity;
+            v_balance DECIMAL(10,2);
+            v_description TEXT := p_quantity || ' @ ' || p_price;
+            v_transaction_id UUID;
+            v_recorded_at TIMESTAMP WITH TIME ZONE;
+        BEGIN
+            -- Claimed first: a second call for the same trade waits here and
+            -- then finds it settled (an exception below releases the claim)
+            IF p_trade_id IS NOT NULL THEN
+                INSERT INTO market_trades (trade_id, collectible_id)
+                VALUES (p_trade_id, p_collectible_id)
+                ON CONFLICT (trade_id) DO NOTHING;
+                IF NOT FOUND THEN
+                    RETURN jsonb_build_object('duplicate', TRUE, 'recorded_at',
+                        (SELECT recorded_at FROM market_trades WHERE trade_id = p_trade_id));
+                END IF;
+            END IF;
+            
+            IF p_buyer_id <> p_seller_id THEN
+                PERFORM 1 FROM token_balances
+                 WHERE user_id IN (p_buyer_id, p_seller_id)
+                 ORDER BY user_id FOR UPDATE;
+                
+                SELECT balance INTO v_balance FROM token_balances WHERE user_id = p_buyer_id;
+                IF v_balance IS NULL OR v_balance < v_total THEN
+                    RAISE EXCEPTION 'insufficient_balance';
+                END IF;
+                PERFORM adjust_holding(p_seller_id, p_collectible_id, -p_quantity);
+                PERFORM adjust_holding(p_buyer_id, p_collectible_id, p_quantity);
+                
+                INSERT INTO transactions (user_id, collectible_id, transaction_type, amount, description)
+                VALUES (p_buyer_id, p_collectible_id, 'trade_buy', -v_total, v_description)
+                RETURNING id INTO v_transaction_id;
+                
+                INSERT INTO transactions (user_id, collectible_id, transaction_type, amount, description)
+                VALUES (p_seller_id, p_collectible_id, 'trade_sell', v_total, v_description);
+                
+                PERFORM ledger_post(jsonb_build_array(
+                    jsonb_build_object('account_id', p_buyer_id::TEXT, 'amount', -v_total),
+                    jsonb_build_object('account_id', p_seller_id::TEXT, 'amount', v_total)
+                ), v_transaction_id);
+            END IF;
+            
+            INSERT INTO price_history (collectible_id, price, quantity)
+            VALUES (p_collectible_id, p_price, p_quantity)
+            RETURNING recorded_at INTO v_recorded_at;
+            UPDATE collectibles SET current_price = p_price WHERE id = p_collectible_id;
+            
+            RETURN jsonb_build_object('transaction_id', v_transaction_id, 'total', v_total,
+                                      'recorded_at', v_recorded_at);
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # Settle a whole call auction: every fill at the uniform price, then
+        # a single price_history write of the settled volume. Fills the buyer
+        # cannot cover, or whose seller lacks the units, are skipped and
+        # returned with the reason so the engine can put them back. Fills
+        # settled by an earlier call (a replay after a crash) are returned
+        # as duplicates and not counted again.
+        """
+        CREATE OR REPLACE FUNCTION settle_auction(
+            p_collectible_id UUID,
+            p_price DECIMAL(10,2),
+            p_fills JSONB
+        ) RETURNS JSONB AS $$
+        DECLARE
+            v_fill JSONB;
+            v_buyer UUID;
+            v_seller UUID;
+            v_quantity INTEGER;
+            v_total DECIMAL(12,2);
+            v_description TEXT;
+            v_transaction_id UUID;
+            v_settled INTEGER := 0;
+            v_volume INTEGER := 0;
+            v_skipped JSONB := '[]'::JSONB;
+            v_duplicates JSONB := '[]'::JSONB;
+            v_recorded_at TIMESTAMP WITH TIME ZONE;
+        BEGIN
+            PERFORM 1 FROM token_balances
+             WHERE user_id IN (
+                   SELECT (f->>'buyer_id')::UUID FROM jsonb_array_elements(p_fills) f
+                   UNION
+                   SELECT (f->>'seller_id')::UUID FROM jsonb_array_elements(p_fills) f)
+             ORDER BY user_id FOR UPDATE;
+            
+            FOR v_fill IN SELECT * FROM jsonb_array_elements(p_fills) LOOP
+                v_buyer := (v_fill->>'buyer_id')::UUID;
+                v_seller := (v_fill->>'seller_id')::UUID;
+                v_quantity := (v_fill->>'quantity')::INTEGER;
+                v_total := p_price * v_quantity;
+                v_description := 'auction ' || v_quantity || ' @ ' || p_price;
+                
+                IF EXISTS (SELECT 1 FROM market_trades WHERE trade_id = (v_fill->>'trade_id')::BIGINT) THEN
+                    v_duplicates := v_duplicates || (v_fill->'trade_id');
+                    CONTINUE;
+                END IF;
+                IF v_buyer = v_seller THEN
+                    INSERT INTO market_trades (trade_id, collectible_id)
+                    VALUES ((v_fill->>'trade_id')::BIGINT, p_collectible_id);
+                    v_settled := v_settled + 1;
+                    v_volume := v_volume + v_quantity;
+                    CONTINUE;
+                END IF;
+                IF COALESCE((SELECT balance FROM token_balances WHERE user_id = v_buyer), 0) < v_total THEN
+                    v_skipped := v_skipped || jsonb_build_object('trade_id', v_fill->'trade_id',
+                                                                 'reason', 'insufficient_balance');
+                    CONTINUE;
+                END IF;
+                IF COALESCE((SELECT units FROM collectible_holdings
+                              WHERE user_id = v_seller AND collectible_id = p_collectible_id), 0) < v_quantity THEN
+                    v_skipped := v_skipped || jsonb_build_object('trade_id', v_fill->'trade_id',
+                                                                 'reason', 'insufficient_units');
+                    CONTINUE;
+                END IF;
+                PERFORM adjust_holding(v_seller, p_collectible_id, -v_quantity);
+                PERFORM adjust_holding(v_buyer, p_collectible_id, v_quantity);
+                
+                INSERT INTO transactions (user_id, collectible_id, transaction_type, amount, description)
+                VALUES (v_buyer, p_collectible_id, 'trade_buy', -v_total, v_description)
+                RETURNING id INTO v_transaction_id;
+                
+                INSERT INTO transactions (user_id, collectible_id, transaction_type, amount, description)
+                VALUES (v_seller, p_collectible_id, 'trade_sell', v_total, v_description);
+                
+                PERFORM ledger_post(jsonb_build_array(
+                    jsonb_build_object('account_id', v_buyer::TEXT, 'amount', -v_total),
+                    jsonb_build_object('account_id', v_seller::TEXT, 'amount', v_total)
+                ), v_transaction_id);
+                INSERT INTO market_trades (trade_id, collectible_id)
+                VALUES ((v_fill->>'trade_id')::BIGINT, p_collectible_id);
+                v_settled := v_settled + 1;
+                v_volume := v_volume + v_quantity;
+            END LOOP;
+            
+            IF v_volume > 0 THEN
+                INSERT INTO price_history (collectible_id, price, quantity)
+                VALUES (p_collectible_id, p_price, v_volume)
+                RETURNING recorded_at INTO v_recorded_at;
+                UPDATE collectibles SET current_price = p_price WHERE id = p_collectible_id;
+            END IF;
+            
+            RETURN jsonb_build_object('settled', v_settled, 'volume', v_volume, 'skipped', v_skipped,
+                                      'duplicates', v_duplicates, 'recorded_at', v_recorded_at);
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # Open an AMM pool funded from the creator's token balance
+        """
+        CREATE OR REPLACE FUNCTION amm_create_pool(
+            p_user_id UUID,
+            p_collectible_id UUID,
+            p_token_reserve DECIMAL(14,2),
+            p_unit_reserve DECIMAL(18,6),
+            p_fee_bps INTEGER DEFAULT 30
+        ) RETURNS JSONB AS $$
+        DECLARE
+            v_balance DECIMAL(10,2);
+            v_pool amm_pools;
+            v_transaction_id UUID;
+        BEGIN
+            IF p_token_reserve <= 0 OR p_unit_reserve <= 0 THEN
+                RAISE EXCEPTION 'invalid_amount';
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM collectibles WHERE id = p_collectible_id) THEN
+                RAISE EXCEPTION 'collectible_not_found';
+            END IF;
+            
+            SELECT balance INTO v_balance FROM token_balances
+             WHERE user_id = p_user_id FOR UPDATE;
+            IF v_balance IS NULL OR v_balance < p_token_reserve THEN
+                RAISE EXCEPTION 'insufficient_balance';
+            END IF;
+            
+            -- A concurrent create for the same collectible waits on the key and then finds it taken
+            INSERT INTO amm_pools (collectible_id, token_reserve, unit_reserve, fee_bps, created_by)
+            VALUES (p_collectible_id, p_token_reserve, p_unit_reserve, p_fee_bps, p_user_id)
+            ON CONFLICT (collectible_id) DO NOTHING
+            RETURNING * INTO v_pool;
+            IF NOT FOUND THEN
+                RAISE EXCEPTION 'pool_exists';
+            END IF;
+            
+            INSERT INTO transactions (user_id, collectible_id, transaction_type, amount, description)
+            VALUES (p_user_id, p_collectible_id, 'amm_deposit', -p_token_reserve,
+                    'pool ' || p_token_reserve || ' / ' || p_unit_reserve)
+            RETURNING id INTO v_transaction_id;
+            
+            PERFORM ledger_post(jsonb_build_array(
+                jsonb_build_object('account_id', p_user_id::TEXT, 'amount', -p_token_reserve),
+                jsonb_build_object('account_id', 'system:amm:' || p_collectible_id, 'amount', p_token_reserve)
+            ), v_transaction_id);
+            
+            RETURN to_jsonb(v_pool);
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # Constant-product swap against a pool. Buy: tokens in, units out;
+        # sell: units in (from the seller's holdings), tokens out. Same
+        # arithmetic and rounding as app.amm.
+        """
+        CREATE OR REPLACE FUNCTION amm_swap(
+            p_user_id UUID,
+            p_collectible_id UUID,
+            p_side VARCHAR,
+            p_amount_in DECIMAL(18,6),
+            p_min_amount_out DECIMAL(18,6) DEFAULT 0
+        ) RETURNS JSONB AS $$
+        DECLARE
+            v_pool amm_pools;
+            v_balance DECIMAL(10,2);
+            v_in_after_fee NUMERIC;
+            v_tokens DECIMAL(14,2);
+            v_units DECIMAL(18,6);
+            v_amount_out DECIMAL(18,6);
+            v_transaction transactions;
+        BEGIN
+            IF p_side NOT IN ('buy', 'sell') THEN
+                RAISE EXCEPTION 'invalid_side';
+            END IF;
+            
+            SELECT * INTO v_pool FROM amm_pools
+             WHERE collectible_id = p_collectible_id FOR UPDATE;
+            IF NOT FOUND THEN
+                RAISE EXCEPTION 'pool_not_found';
+            END IF;
+            
+            SELECT balance INTO v_balance FROM token_balances
+             WHERE user_id = p_user_id FOR UPDATE;
+            IF v_balance IS NULL THEN
+                RAISE EXCEPTION 'balance_not_found';
+            END IF;
+            
+            IF p_side = 'buy' THEN
+                v_tokens := trunc(p_amount_in, 2);
+                v_in_after_fee := v_tokens * (10000 - v_pool.fee_bps) / 10000;
+                v_units := trunc(v_pool.unit_reserve * v_in_after_fee / (v_pool.token_reserve + v_in_after_fee), 6);
+                v_amount_out := v_units;
+                IF v_balance < v_tokens THEN
+                    RAISE EXCEPTION 'insufficient_balance';
+                END IF;
+            ELSE
+                v_units := trunc(p_amount_in, 6);
+                v_in_after_fee := v_units * (10000 - v_pool.fee_bps) / 10000;
+                v_tokens := trunc(v_pool.token_reserve * v_in_after_fee / (v_pool.unit_reserve + v_in_after_fee), 2);
+                v_amount_out := v_tokens;
+            END IF;
+            
+            IF v_tokens <= 0 OR v_units <= 0 THEN
+                RAISE EXCEPTION 'invalid_amount';
+            END IF;
+            IF v_amount_out < p_min_amount_out THEN
+                RAISE EXCEPTION 'slippage_exceeded';
+            END IF;
+            
+            IF p_side = 'buy' THEN
+                UPDATE amm_pools
+                   SET token_reserve = token_reserve + v_tokens,
+                       unit_reserve = unit_reserve - v_units,
+                       updated_at = NOW()
+                 WHERE collectible_id = p_collectible_id
+                RETURNING * INTO v_pool;
+                
+                INSERT INTO transactions (user_id, collectible_id, transaction_type, amount, description)
+                VALUES (p_user_id, p_collectible_id, 'amm_buy', -v_tokens, 'swap for ' || v_units || ' units')
+                RETURNING * INTO v_transaction;
+                
+                PERFORM ledger_post(jsonb_build_array(
+                    jsonb_build_object('account_id', p_user_id::TEXT, 'amount', -v_tokens),
+                    jsonb_build_object('account_id', 'system:amm:' || p_collectible_id, 'amount', v_tokens)
+                ), v_transaction.id);
+                PERFORM adjust_holding(p_user_id, p_collectible_id, v_units);
+                v_balance := v_balance - v_tokens;
+            ELSE
+                PERFORM adjust_holding(p_user_id, p_collectible_id, -v_units);
+                UPDATE amm_pools
+                   SET token_reserve = token_reserve - v_tokens,
+                       unit_reserve = unit_reserve + v_units,
+                       updated_at = NOW()
+                 WHERE collectible_id = p_collectible_id
+                RETURNING * INTO v_pool;
+                
+                INSERT INTO transactions (user_id, collectible_id, transaction_type, amount, description)
+                VALUES (p_user_id, p_collectible_id, 'amm_sell', v_tokens, 'swap of ' || v_units || ' units')
+                RETURNING * INTO v_transaction;
+                
+                PERFORM ledger_post(jsonb_build_array(
+                    jsonb_build_object('account_id', 'system:amm:' || p_collectible_id, 'amount', -v_tokens),
+                    jsonb_build_object('account_id', p_user_id::TEXT, 'amount', v_tokens)
+                ), v_transaction.id);
+                v_balance := v_balance + v_tokens;
+            END IF;
+            
+            RETURN jsonb_build_object(
+                'transaction', to_jsonb(v_transaction),
+                'amount_out', v_amount_out,
+                'balance', v_balance,
+                'pool', to_jsonb(v_pool)
+            );
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # Apply a batch of reservation operations from app.reservations in
+        # order. Holds the balance cannot cover are rejected, not raised, so
+        # one user's shortfall does not fail the whole batch.
+        """
+        CREATE OR REPLACE FUNCTION reservations_apply(p_ops JSONB) RETURNS JSONB AS $$
+        DECLARE
+            v_op JSONB;
+            v_user_id UUID;
+            v_amount DECIMAL(10,2);
+            v_balance DECIMAL(10,2);
+            v_reservation balance_reservations;
+            v_transaction_id UUID;
+            v_results JSONB := '[]'::JSONB;
+        BEGIN
+            PERFORM 1 FROM token_balances
+             WHERE user_id IN (SELECT (o->>'user_id')::UUID FROM jsonb_array_elements(p_ops) o)
+             ORDER BY user_id FOR UPDATE;
+            
+            FOR v_op IN SELECT * FROM jsonb_array_elements(p_ops) LOOP
+                v_user_id := (v_op->>'user_id')::UUID;
+                v_amount := (v_op->>'amount')::DECIMAL(10,2);
+                
+                IF v_op->>'op' = 'hold' THEN
+                    SELECT balance INTO v_balance FROM token_balances WHERE user_id = v_user_id;
+                    IF v_balance IS NULL OR v_balance < v_amount THEN
+                        v_results := v_results || jsonb_build_object(
+                            'reservation_id', v_op->>'reservation_id', 'status', 'rejected');
+                        CONTINUE;
+                    END IF;
+                    
+                    INSERT INTO balance_reservations (id, user_id, purpose, reference, amount)
+                    VALUES ((v_op->>'reservation_id')::UUID, v_user_id, v_op->>'purpose',
+                            v_op->>'reference', v_amount);
+                    IF v_op->>'purpose' = 'redemption' THEN
+                        INSERT INTO redemptions (id, user_id, collectible_id, cost, status)
+                        VALUES ((v_op->>'reference')::UUID, v_user_id,
+                                (v_op->>'collectible_id')::UUID, v_amount, 'pending');
+                    END IF;
+                    
+                    INSERT INTO transactions (user_id, collectible_id, transaction_type, amount, description)
+                    VALUES (v_user_id, (v_op->>'collectible_id')::UUID, v_op->>'purpose' || '_hold',
+                            -v_amount, v_op->>'reference')
+                    RETURNING id INTO v_transaction_id;
+                    
+                    PERFORM ledger_post(jsonb_build_array(
+                        jsonb_build_object('account_id', v_user_id::TEXT, 'amount', -v_amount),
+                        jsonb_build_object('account_id', 'system:holds', 'amount', v_amount)
+                    ), v_transaction_id);
+                    
+                    v_results := v_results || jsonb_build_object(
+                        'reservation_id', v_op->>'reservation_id', 'status', 'held',
+                        'balance', v_balance - v_amount);
+                ELSE
+                    UPDATE balance_reservations
+                       SET status = CASE WHEN v_op->>'op' = 'release' THEN 'released' ELSE 'settled' END,
+                           updated_at = NOW()
+                     WHERE id = (v_op->>'reservation_id')::UUID AND status = 'held'
+                    RETURNING * INTO v_reservation;
+                    IF NOT FOUND THEN
+                        v_results := v_results || jsonb_build_object(
+                            'reservation_id', v_op->>'reservation_id', 'status', 'not_held');
+                        CONTINUE;
+                    END IF;
+                    
+                    IF v_op->>'op' = 'release' THEN
+                        INSERT INTO transactions (user_id, transaction_type, amount, description)
+                        VALUES (v_user_id, v_reservation.purpose || '_release',
+                                v_reservation.amount, v_reservation.reference)
+                        RETURNING id INTO v_transaction_id;
+                        
+                        PERFORM ledger_post(jsonb_build_array(
+                            jsonb_build_object('account_id', 'system:holds', 'amount', -v_reservation.amount),
+                            jsonb_build_object('account_id', v_user_id::TEXT, 'amount', v_reservation.amount)
+                        ), v_transaction_id);
+                    ELSE
+                        PERFORM ledger_post(jsonb_build_array(
+                            jsonb_build_object('account_id', 'system:holds', 'amount', -v_reservation.amount),
+                            jsonb_build_object('account_id', v_op->>'account_id', 'amount', v_reservation.amount)
+                        ));
+                    END IF;
+                    
+                    IF v_reservation.purpose = 'redemption' THEN
+                        UPDATE redemptions
+                           SET status = CASE WHEN v_op->>'op' = 'release' THEN 'cancelled' ELSE 'completed' END
+                         WHERE id = v_reservation.reference::UUID;
+                    END IF;
+                    
+                    v_results := v_results || jsonb_build_object(
+                        'reservation_id', v_reservation.id, 'status', v_reservation.status);
+                END IF;
+            END LOOP;
+            
+            RETURN v_results;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # OHLCV aggregation of price_history into fixed-width buckets
+        """
+        DROP FUNCTION IF EXISTS price_candles(UUID, INTEGER, TIMESTAMP WITH TIME ZONE);
+        CREATE OR REPLACE FUNCTION price_candles(
+            p_collectible_id UUID,
+            p_interval_seconds INTEGER,
+            p_since TIMESTAMP WITH TIME ZONE,
+            p_until TIMESTAMP WITH TIME ZONE DEFAULT NULL
+        ) RETURNS TABLE (
+            bucket TIMESTAMP WITH TIME ZONE,
+            open DECIMAL(10,2),
+            high DECIMAL(10,2),
+            low DECIMAL(10,2),
+            close DECIMAL(10,2),
+            volume BIGINT
+        ) AS $$
+            SELECT to_timestamp(floor(extract(epoch FROM recorded_at) / p_interval_seconds) * p_interval_seconds),
+                   (array_agg(price ORDER BY recorded_at, id))[1],
+                   max(price),
+                   min(price),
+                   (array_agg(price ORDER BY recorded_at DESC, id DESC))[1],
+                   COALESCE(sum(quantity), 0)
+              FROM price_history
+             WHERE collectible_id = p_collectible_id
+               AND recorded_at >= p_since
+               AND (p_until IS NULL OR recorded_at <= p_until)
+             GROUP BY 1
+             ORDER BY 1;
+        $$ LANGUAGE sql STABLE;
+        """,
+        
+        # Direct balance edits become adjustment journals against the house;
+        # returns the adjustment posted
+        """
+        CREATE OR REPLACE FUNCTION ledger_set_balance(
+            p_user_id UUID,
+            p_new_balance DECIMAL(10,2)
+        ) RETURNS DECIMAL AS $$
+        DECLARE
+            v_balance DECIMAL(10,2);
+            v_delta DECIMAL(12,2);
+            v_transaction_id UUID;
+        BEGIN
+            SELECT balance INTO v_balance FROM token_balances
+             WHERE user_id = p_user_id FOR UPDATE;
+            IF NOT FOUND THEN
+                RAISE EXCEPTION 'balance_not_found';
+            END IF;
+            
+            v_delta := p_new_balance - v_balance;
+            IF v_delta <> 0 THEN
+                INSERT INTO transactions (user_id, transaction_type, amount, description)
+                VALUES (p_user_id, 'adjustment', v_delta, 'Balance adjustment')
+                RETURNING id INTO v_transaction_id;
+                
+                PERFORM ledger_post(jsonb_build_array(
+                    jsonb_build_object('account_id', p_user_id::TEXT, 'amount', v_delta),
+                    jsonb_build_object('account_id', 'system:adjustments', 'amount', -v_delta)
+                ), v_transaction_id);
+            END IF;
+            
+            RETURN v_delta;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # One-time migration: open ledger accounts for pre-ledger balances
+        """
+        CREATE OR REPLACE FUNCTION ledger_open_existing_balances() RETURNS INTEGER AS $$
+        DECLARE
+            v_row RECORD;
+            v_count INTEGER := 0;
+        BEGIN
+            FOR v_row IN
+                SELECT tb.user_id, tb.balance FROM token_balances tb
+                 WHERE tb.balance <> 0
+                   AND NOT EXISTS (SELECT 1 FROM ledger_balances lb
+                                    WHERE lb.account_id = tb.user_id::TEXT)
+                   FOR UPDATE
+            LOOP
+                -- ledger_post re-applies the amount to token_balances
+                UPDATE token_balances SET balance = 0 WHERE user_id = v_row.user_id;
+                PERFORM ledger_post(jsonb_build_array(
+                    jsonb_build_object('account_id', v_row.user_id::TEXT, 'amount', v_row.balance),
+                    jsonb_build_object('account_id', 'system:opening', 'amount', -v_row.balance)
+                ));
+                v_count := v_count + 1;
+            END LOOP;
+            RETURN v_count;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # Fold hot-account slots into ledger_balances. Holding every slot
+        # lock means all committed entries are in the slots and any later
+        # entry gets a higher id, so last_entry_id stays exact.
+        """
+        CREATE OR REPLACE FUNCTION ledger_consolidate_hot_accounts() RETURNS INTEGER AS $$
+        DECLARE
+            v_account VARCHAR;
+            v_total DECIMAL(12,2);
+            v_count INTEGER := 0;
+        BEGIN
+            FOR v_account IN SELECT account_id FROM ledger_hot_accounts ORDER BY account_id LOOP
+                PERFORM 1 FROM ledger_balance_slots
+                 WHERE account_id = v_account ORDER BY slot FOR UPDATE;
+                
+                SELECT COALESCE(SUM(balance), 0) INTO v_total
+                  FROM ledger_balance_slots WHERE account_id = v_account;
+                
+                INSERT INTO ledger_balances (account_id, balance, last_entry_id, updated_at)
+                VALUES (v_account, v_total,
+                        COALESCE((SELECT MAX(id) FROM ledger_entries WHERE account_id = v_account), 0),
+                        NOW())
+                ON CONFLICT (account_id) DO UPDATE
+                   SET balance = ledger_balances.balance + EXCLUDED.balance,
+                       last_entry_id = EXCLUDED.last_entry_id,
+                       updated_at = NOW();
+                
+                UPDATE ledger_balance_slots SET balance = 0
+                 WHERE account_id = v_account AND balance <> 0;
+                v_count := v_count + 1;
+            END LOOP;
+            RETURN v_count;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # Designate (slots > 1) or un-designate (slots <= 1) a hot house account
+        """
+        CREATE OR REPLACE FUNCTION ledger_configure_hot_account(
+            p_account_id VARCHAR,
+            p_slots INTEGER
+        ) RETURNS INTEGER AS $$
+        BEGIN
+            IF p_account_id NOT LIKE 'system:%' THEN
+                RAISE EXCEPTION 'only system accounts can be sharded';
+            END IF;
+            
+            PERFORM ledger_consolidate_hot_accounts();
+            DELETE FROM ledger_balance_slots WHERE account_id = p_account_id;
+            DELETE FROM ledger_hot_accounts WHERE account_id = p_account_id;
+            
+            IF p_slots > 1 THEN
+                INSERT INTO ledger_hot_accounts (account_id, slots) VALUES (p_account_id, p_slots);
+                INSERT INTO ledger_balance_slots (account_id, slot)
+                SELECT p_account_id, generate_series(0, p_slots - 1);
+                INSERT INTO ledger_balances (account_id) VALUES (p_account_id)
+                ON CONFLICT (account_id) DO NOTHING;
+            END IF;
+            RETURN GREATEST(p_slots, 1);
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # Current balance of any account: consolidated balance + unfolded slots
+        """
+        CREATE OR REPLACE FUNCTION ledger_account_balance(p_account_id VARCHAR) RETURNS DECIMAL AS $$
+            SELECT COALESCE((SELECT balance FROM ledger_balances WHERE account_id = p_account_id), 0)
+                 + COALESCE((SELECT SUM(balance) FROM ledger_balance_slots WHERE account_id = p_account_id), 0);
+        $$ LANGUAGE sql STABLE;
+        """,
+        
+        # Keep transaction_summaries current on every insert (single row
+        # inserts, group-commit batches and stored procedures alike)
+        """
+        CREATE OR REPLACE FUNCTION transaction_summaries_apply() RETURNS TRIGGER AS $$
+        BEGIN
+            INSERT INTO transaction_summaries (user_id, transaction_type, month, total_amount, transaction_count)
+            VALUES (NEW.user_id, NEW.transaction_type,
+                    date_trunc('month', COALESCE(NEW.created_at, NOW()))::DATE, NEW.amount, 1)
+            ON CONFLICT (user_id, transaction_type, month) DO UPDATE
+               SET total_amount = transaction_summaries.total_amount + EXCLUDED.total_amount,
+                   transaction_count = transaction_summaries.transaction_count + 1;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        
+        DROP TRIGGER IF EXISTS transactions_summarize ON transactions;
+        CREATE TRIGGER transactions_summarize
+            AFTER INSERT ON transactions
+            FOR EACH ROW EXECUTE FUNCTION transaction_summaries_apply();
+        """,
+        
+        # One-time backfill of summaries from existing transactions
+        """
+        CREATE OR REPLACE FUNCTION transaction_summaries_backfill() RETURNS INTEGER AS $$
+        DECLARE
+            v_count INTEGER;
+        BEGIN
+            LOCK TABLE transactions IN SHARE MODE;
+            DELETE FROM transaction_summaries;
+            INSERT INTO transaction_summaries (user_id, transaction_type, month, total_amount, transaction_count)
+            SELECT user_id, transaction_type, date_trunc('month', created_at)::DATE, SUM(amount), COUNT(*)
+              FROM transactions
+             GROUP BY 1, 2, 3;
+            GET DIAGNOSTICS v_count = ROW_COUNT;
+            RETURN v_count;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # Snapshot every account that has moved since its last snapshot
+        """
+        CREATE OR REPLACE FUNCTION ledger_take_snapshots() RETURNS INTEGER AS $$
+        DECLARE
+            v_count INTEGER;
+        BEGIN
+            INSERT INTO ledger_snapshots (account_id, entry_id, balance, as_of)
+            SELECT b.account_id, b.last_entry_id, b.balance, e.created_at
+              FROM ledger_balances b
+              JOIN ledger_entries e ON e.id = b.last_entry_id
+             WHERE b.last_entry_id > COALESCE(
+                   (SELECT MAX(s.entry_id) FROM ledger_snapshots s
+                     WHERE s.account_id = b.account_id), 0);
+            GET DIAGNOSTICS v_count = ROW_COUNT;
+            RETURN v_count;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        
+        # Balance at a point in time: nearest earlier snapshot + entry tail
+        """
+        CREATE OR REPLACE FUNCTION ledger_balance_at(
+            p_account_id VARCHAR,
+            p_at TIMESTAMP WITH TIME ZONE
+        ) RETURNS DECIMAL AS $$
+        DECLARE
+            v_entry_id BIGINT := 0;
+            v_balance DECIMAL(12,2) := 0;
+        BEGIN
+            SELECT entry_id, balance INTO v_entry_id, v_balance
+              FROM ledger_snapshots
+             WHERE account_id = p_account_id AND as_of <= p_at
+             ORDER BY entry_id DESC LIMIT 1;
+            
+            RETURN COALESCE(v_balance, 0) + COALESCE((
+                SELECT SUM(amount) FROM ledger_entries
+                 WHERE account_id = p_account_id
+                   AND id > COALESCE(v_entry_id, 0)
+                   AND created_at <= p_at), 0);
+        END;
+        $$ LANGUAGE plpgsql STABLE;
+        """,
+        
+        # Opening balances posted by ledger_open_existing_balances(), which
+        # have no transactions row; keyset-paged on the account id
+        """
+        CREATE OR REPLACE FUNCTION ledger_opening_balances(
+            p_after TEXT DEFAULT NULL,
+            p_limit INTEGER DEFAULT 1000
+        ) RETURNS TABLE (user_id TEXT, amount DECIMAL(12,2)) AS $$
+            SELECT e.account_id, SUM(e.amount)
+              FROM ledger_entries e
+             WHERE e.account_id <> 'system:opening'
+               AND e.account_id > COALESCE(p_after, '')
+               AND e.journal_id IN (SELECT journal_id FROM ledger_entries
+                                     WHERE account_id = 'system:opening')
+             GROUP BY e.account_id
+             ORDER BY e.account_id
+             LIMIT p_limit;
+        $$ LANGUAGE sql STABLE;
+        """,
+        
+        # Reconciliation: replay entries since each account's last snapshot
+        # and report accounts whose materialized balance disagrees
+        """
+        CREATE OR REPLACE FUNCTION ledger_reconcile()
+        RETURNS TABLE (
+            account_id VARCHAR,
+            replayed_balance DECIMAL,
+            materialized_balance DECIMAL
+        ) AS $$
+            WITH latest AS (
+                SELECT DISTINCT ON (s.account_id) s.account_id, s.entry_id, s.balance
+                  FROM ledger_snapshots s
+                 ORDER BY s.account_id, s.entry_id DESC
+            ),
+            replayed AS (
+                SELECT b.account_id,
+                       COALESCE(l.balance, 0) + COALESCE((
+                           SELECT SUM(e.amount) FROM ledger_entries e
+                            WHERE e.account_id = b.account_id
+                              AND e.id > COALESCE(l.entry_id, 0)), 0) AS balance,
+                       b.balance + COALESCE((
+                           SELECT SUM(bs.balance) FROM ledger_balance_slots bs
+                            WHERE bs.account_id = b.account_id), 0) AS materialized
+                  FROM ledger_balances b
+                  LEFT JOIN latest l ON l.account_id = b.account_id
+            )
+            SELECT r.account_id, r.balance, r.materialized
+              FROM replayed r
+             WHERE r.balance <> r.materialized;
+        $$ LANGUAGE sql STABLE;
+        """
+    ]
+    
+    for i, sql in enumerate(function_commands, 1):
+        try:
+            supabase.rpc('exec_sql', {'sql': sql}).execute()
+            function_name = sql.split('CREATE OR REPLACE FUNCTION')[1].split('(')[0].strip()
+            print(f"✓ Created function: {function_name}")
+        except Exception as e:
+            print(f"✗ Error creating function {i}: {e}")
+
+# House accounts credited by most operations, with their slot counts
+HOT_ACCOUNTS = {
+    "system:revenue": 16,
+}
+
+def configure_hot_accounts():
+    """Shard the designated house accounts across balance slots"""
+    for account_id, slots in HOT_ACCOUNTS.items():
+        try:
+            supabase.rpc('ledger_configure_hot_account', {
+                'p_account_id': account_id,
+                'p_slots': slots
+            }).execute()
+            print(f"✓ Sharded {account_id} across {slots} slots")
+        except Exception as e:
+            print(f"✗ Error sharding {account_id}: {e}")
+
+def backfill_transaction_summaries():
+    """Rebuild per-user transaction aggregates from existing history"""
+    try:
+        response = supabase.rpc('transaction_summaries_backfill', {}).execute()
+        print(f"✓ Backfilled {response.data} transaction summary rows")
+    except Exception as e:
+        print(f"✗ Error backfilling transaction summaries: {e}")
+
+def open_ledger_accounts():
+    """Post opening ledger entries for balances that predate the ledger"""
+    try:
+        response = supabase.rpc('ledger_open_existing_balances', {}).execute()
+        print(f"✓ Opened {response.data} ledger accounts")
+    except Exception as e:
+        print(f"✗ Error opening ledger accounts: {e}")
+
 def test_tables():
     """Test that all tables were created successfully"""
     tables = ['users', 'collectibles', 'token_balances', 'price_history', 
-              'transactions', 'referrals', 'redemptions']
+              'transactions', 'referrals', 'redemptions',
+              'ledger_entries', 'ledger_balances', 'ledger_snapshots',
+              'ledger_hot_accounts', 'ledger_balance_slots',
+              'transaction_summaries', 'amm_pools', 'balance_reservations',
+              'collectible_holdings', 'market_trades']
     
     for table in tables:
         try:
@@ -161,6 +1372,18 @@ if __name__ == "__main__":
     
     create_tables()
     print()
+    migrate_tables()
+    print()
+    create_indexes()
+    print()
+    create_functions()
+    print()
+    open_ledger_accounts()
+    print()
+    configure_hot_accounts()
+    print()
+    backfill_transaction_summaries()
+    print()
     test_tables()
     print()
     insert_sample_data()
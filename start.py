@@ -58,6 +58,23 @@ def run_jwt_tests():
         print(f"Error running tests: {e}")
         return False
 
+def run_unit_tests():
+    """Run the unit tests (no database needed)"""
+    print("🧪 Running Unit Tests...")
+    try:
+        result = subprocess.run([
+            sys.executable, "-m", "pytest", "-q", "tests"
+        ], capture_output=True, text=True)
+        
+        print(result.stdout)
+        if result.stderr:
+            print("Errors:", result.stderr)
+            
+        return result.returncode == 0
+    except Exception as e:
+        print(f"Error running tests: {e}")
+        return False
+
 def start_api():
     """Start the FastAPI server"""
     print("🚀 Starting FastAPI Server...")
@@ -81,6 +98,7 @@ def print_help():
     print("  test        - Run production database tests (with RLS)")
     print("  test-simple - Run basic database functionality tests")
     print("  test-jwt    - Run JWT authentication tests (requires running server)")
+    print("  test-unit   - Run unit tests of the in-memory market modules (no database)")
     print("  serve       - Start the FastAPI server")
     print("  dev         - Run simple tests then start server")
     print("\nExamples:")
@@ -107,6 +125,9 @@ def main():
         elif command == "test-jwt":
             success = run_jwt_tests()
             sys.exit(0 if success else 1)
+        elif command == "test-unit":
+            success = run_unit_tests()
+            sys.exit(0 if success else 1)
         elif command == "serve":
             start_api()
         elif command == "dev":
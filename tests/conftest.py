@@ -0,0 +1,6 @@
+"""
+Unit tests for the pure in-memory modules; none of them touch the database
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+"""Constant-product pool quotes: invariant, fees and slippage"""
+from decimal import Decimal
+
+import pytest
+
+from app.amm import Pool, swap_output, BUY, SELL
+
+def _pool(fee_bps=30):
+    return Pool("c", Decimal("1000.00"), Decimal("100.000000"), fee_bps=fee_bps)
+
+@pytest.mark.parametrize("side, amount", [(BUY, "50"), (SELL, "5")])
+def test_swap_never_lowers_the_invariant(side, amount):
+    pool = _pool()
+    quote = pool.quote(side, Decimal(amount))
+    tokens, units = (quote["amount_in"], -quote["amount_out"]) if side == BUY else \
+        (-quote["amount_out"], quote["amount_in"])
+    before = pool.token_reserve * pool.unit_reserve
+    after = (pool.token_reserve + Decimal(str(tokens))) * (pool.unit_reserve + Decimal(str(units)))
+    assert after >= before
+
+def test_without_fee_the_invariant_holds_up_to_rounding():
+    amount_out = swap_output(Decimal("100"), Decimal("1000"), Decimal("100"), 0, Decimal("0.000001"))
+    # 100 * 100 / 1100, rounded down
+    assert amount_out == Decimal("9.090909")
+
+def test_larger_trades_pay_more_slippage():
+    pool = _pool()
+    small = pool.quote(BUY, Decimal("10"))
+    large = pool.quote(BUY, Decimal("500"))
+    
+    assert small["spot_price"] == 10.0
+    assert small["average_price"] < large["average_price"]
+    assert small["price_impact"] < large["price_impact"]
+    assert large["spot_price_after"] > large["average_price"] > large["spot_price"]
+
+def test_fee_is_charged_on_the_way_in():
+    free = _pool(fee_bps=0).quote(SELL, Decimal("5"))
+    charged = _pool(fee_bps=30).quote(SELL, Decimal("5"))
+    assert charged["amount_out"] < free["amount_out"]
+
+def test_dust_and_bad_sides_are_rejected():
+    pool = _pool()
+    with pytest.raises(ValueError):
+        pool.quote(BUY, Decimal("0.001"))
+    with pytest.raises(ValueError):
+        pool.quote("hold", Decimal("1"))
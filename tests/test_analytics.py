@@ -0,0 +1,27 @@
+"""LTTB downsampling and drawdown"""
+import numpy as np
+
+from app.analytics import drawdown, lttb
+
+def test_lttb_keeps_the_ends_and_the_spike():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.zeros(1000)
+    y[500] = 100.0
+    
+    selected = lttb(x, y, 20)
+    
+    assert len(selected) == 20
+    assert selected[0] == 0 and selected[-1] == 999
+    assert 500 in selected
+    assert np.all(np.diff(selected) > 0)
+
+def test_lttb_returns_everything_below_the_threshold():
+    x = np.arange(5, dtype=np.float64)
+    assert lttb(x, x, 10).tolist() == [0, 1, 2, 3, 4]
+
+def test_drawdown_from_the_running_peak():
+    assert drawdown(np.array([10.0, 12.0, 9.0, 12.0, 6.0])).tolist() == [0.0, 0.0, -0.25, 0.0, -0.5]
+
+def test_drawdown_is_finite_while_the_peak_is_zero():
+    assert drawdown(np.array([0.0, 0.0, 2.0, 1.0])).tolist() == [0.0, 0.0, 0.0, -0.5]
+    assert len(drawdown(np.array([]))) == 0
@@ -0,0 +1,70 @@
+"""LRU/TTL cache and the price series cache"""
+import asyncio
+from datetime import datetime, timezone
+
+from app import cache, price_series
+from app.cache import LRUCache
+from app.price_series import PriceSeriesCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+def test_lru_evicts_the_least_recently_used():
+    lru = LRUCache(maxsize=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+    
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (1, 3)
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    lru = LRUCache(maxsize=10, ttl=5)
+    lru.set("a", 1)
+    lru.set("b", 2, ttl=60)
+    
+    clock.now += 10
+    assert lru.get("a", "gone") == "gone"
+    assert lru.get("b") == 2
+    assert len(lru) == 1
+
+def _row(second, price):
+    return {"recorded_at": datetime(2024, 1, 1, 0, 0, second, tzinfo=timezone.utc).isoformat(),
+            "price": price, "quantity": 1}
+
+def test_series_is_loaded_once_and_reloaded_when_stale(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(price_series.time, "monotonic", clock)
+    history = [_row(0, 10.0), _row(1, 11.0)]
+    loads = []
+    
+    def iter_pages(collectible_id, after=None):
+        loads.append(collectible_id)
+        yield list(history)
+    
+    series_cache = PriceSeriesCache(iter_pages, ttl=60)
+    
+    async def scenario():
+        first, second = await asyncio.gather(series_cache.get("c"), series_cache.get("c"))
+        assert first is second and len(loads) == 1
+        
+        # A published trade is appended to the cached series
+        series_cache.record({"collectible_id": "c", "source": "trade", "price": 12.0, "quantity": 1,
+                             "timestamp": datetime(2024, 1, 1, 0, 0, 2, tzinfo=timezone.utc).timestamp()})
+        assert (await series_cache.get("c")).prices.tolist() == [10.0, 11.0, 12.0]
+        assert len(loads) == 1
+        
+        history.append(_row(3, 13.0))
+        clock.now += 61
+        assert series_cache.cached("c") is None
+        assert (await series_cache.get("c")).prices.tolist() == [10.0, 11.0, 13.0]
+        assert len(loads) == 2
+    
+    asyncio.run(scenario())
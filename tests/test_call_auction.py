@@ -0,0 +1,57 @@
+"""Call auction clearing price and fills"""
+import numpy as np
+
+from app.call_auction import CallAuction, clearing_price
+from app.matching_engine import BUY, SELL, MARKET
+
+def _prices(*values):
+    return np.array(values, dtype=np.int64)
+
+def test_clearing_price_maximizes_volume():
+    # 10 units clear at 100 and at 102; at 102 demand and supply are balanced
+    price, volume = clearing_price(_prices(102, 100), _prices(10, 5), _prices(98, 100), _prices(4, 6))
+    assert (price, volume) == (102, 10)
+
+def test_clearing_price_ties_go_to_the_reference():
+    # 5 units clear, balanced, at either order's price
+    bids, asks = (_prices(104), _prices(5)), (_prices(100), _prices(5))
+    assert clearing_price(*bids, *asks, reference=103) == (104, 5)
+    assert clearing_price(*bids, *asks, reference=90) == (100, 5)
+
+def test_no_cross_no_price():
+    assert clearing_price(_prices(99), _prices(5), _prices(100), _prices(5)) == (None, 0)
+
+def test_market_orders_only_clear_at_the_reference():
+    empty = _prices()
+    assert clearing_price(empty, empty, empty, empty, market_bid=3, market_ask=2, reference=150) == (150, 2)
+    assert clearing_price(empty, empty, empty, empty, market_bid=3, market_ask=2) == (None, 0)
+
+def _auction():
+    ids = {"order": 0, "trade": 0}
+    
+    def next_id(kind):
+        ids[kind] += 1
+        return ids[kind]
+    return CallAuction(lambda: next_id("order"), lambda: next_id("trade"), collectible_ids=["c"])
+
+def test_clear_fills_at_one_price_and_carries_limit_remainders():
+    auction = _auction()
+    auction.submit("s1", "c", SELL, 4, 98)
+    auction.submit("s2", "c", SELL, 6, 100)
+    auction.submit("b1", "c", BUY, 10, 102)
+    rest = auction.submit("b2", "c", BUY, 5, 100)
+    
+    result = auction.clear("c")
+    
+    assert result["price"] == 1.02 and result["volume"] == 10
+    assert sum(fill["quantity"] for fill in result["fills"]) == 10
+    # Only b1 bids at the clearing price; b2 waits for the next auction
+    assert {fill["buyer_id"] for fill in result["fills"]} == {"b1"}
+    assert auction.pending_orders() == [rest]
+
+def test_unmatched_market_orders_leave_the_book():
+    auction = _auction()
+    auction.submit("b1", "c", BUY, 3, order_type=MARKET)
+    
+    assert auction.clear("c") is None
+    assert auction.pending_orders() == []
@@ -0,0 +1,67 @@
+"""Order book matching: price-time priority and partial fills"""
+from app.matching_engine import MatchingEngine, BUY, SELL, MARKET, FILLED, PARTIALLY_FILLED, CANCELLED
+
+def test_best_price_fills_first():
+    engine = MatchingEngine()
+    engine.submit("s1", "c", SELL, 5, 105)
+    cheap, _ = engine.submit("s2", "c", SELL, 5, 100)
+    
+    _, trades = engine.submit("b1", "c", BUY, 5, 110)
+    
+    assert [(t.sell_order_id, t.price, t.quantity) for t in trades] == [(cheap.order_id, 100, 5)]
+
+def test_equal_prices_fill_in_time_order():
+    engine = MatchingEngine()
+    first, _ = engine.submit("s1", "c", SELL, 3, 100)
+    second, _ = engine.submit("s2", "c", SELL, 3, 100)
+    
+    _, trades = engine.submit("b1", "c", BUY, 4, 100)
+    
+    assert [(t.seller_id, t.quantity) for t in trades] == [("s1", 3), ("s2", 1)]
+    assert first.status == FILLED
+    assert second.status == PARTIALLY_FILLED and second.remaining == 2
+
+def test_partial_fill_rests_the_limit_remainder():
+    engine = MatchingEngine()
+    engine.submit("s1", "c", SELL, 2, 100)
+    
+    order, trades = engine.submit("b1", "c", BUY, 5, 101)
+    
+    assert sum(t.quantity for t in trades) == 2
+    assert trades[0].price == 100  # maker's price
+    assert order.status == PARTIALLY_FILLED and order.remaining == 3
+    assert engine.get_order(order.order_id) is order
+    assert engine.depth("c", 5)["bids"] == [[1.01, 3]]
+
+def test_market_remainder_is_cancelled():
+    engine = MatchingEngine()
+    engine.submit("s1", "c", SELL, 2, 100)
+    
+    order, trades = engine.submit("b1", "c", BUY, 5, order_type=MARKET)
+    
+    assert sum(t.quantity for t in trades) == 2
+    assert order.remaining == 3 and order.status == PARTIALLY_FILLED
+    assert engine.get_order(order.order_id) is None
+    
+    unfilled, trades = engine.submit("b2", "c", BUY, 1, order_type=MARKET)
+    assert trades == [] and unfilled.status == CANCELLED
+
+def test_cancel_only_by_owner():
+    engine = MatchingEngine()
+    order, _ = engine.submit("s1", "c", SELL, 2, 100)
+    
+    assert engine.cancel(order.order_id, user_id="someone-else") is None
+    assert engine.cancel(order.order_id, user_id="s1") is order
+    _, trades = engine.submit("b1", "c", BUY, 2, 100)
+    assert trades == []
+
+def test_trade_listeners_get_each_batch():
+    engine = MatchingEngine()
+    batches = []
+    engine.add_trade_listener(batches.append)
+    engine.submit("s1", "c", SELL, 1, 100)
+    engine.submit("s2", "c", SELL, 1, 100)
+    engine.submit("b1", "c", BUY, 2, 100)
+    
+    assert [len(batch) for batch in batches] == [2]
+    assert [t.trade_id for t in batches[0]] == [1, 2]
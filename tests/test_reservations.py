@@ -0,0 +1,74 @@
+"""Balance reservations: commitments, reserved debits and unsettled fills"""
+import asyncio
+
+import pytest
+
+from app.matching_engine import MatchingEngine, BUY, SELL
+from app.reservations import BalanceReservations, InsufficientFunds, UNIT_SCALE
+
+def _reservations(balances, units=None):
+    """Reservations with every given balance and position loaded"""
+    units = units or {}
+    reservations = BalanceReservations(balances.get, lambda ops: [],
+                                       lambda user_id, collectible_id: units.get((user_id, collectible_id)))
+    
+    async def load():
+        for user_id in balances:
+            await reservations.load(user_id)
+        for user_id, collectible_id in units:
+            await reservations.load(user_id, collectible_id)
+    asyncio.run(load())
+    return reservations
+
+def test_cancel_releases_the_commitment():
+    reservations = _reservations({"b1": 100.0})
+    engine = MatchingEngine()
+    order, _ = engine.submit("b1", "c", BUY, 4, 2000)
+    
+    reservations.commit_order(order)
+    assert reservations.account("b1").available == 10000 - 8000
+    with pytest.raises(InsufficientFunds):
+        reservations.check("b1", 2001)
+    
+    reservations.release_order(order.order_id)
+    assert reservations.account("b1").available == 10000
+
+def test_failed_reserve_reloads_and_releases():
+    reservations = _reservations({"b1": 10.0})
+    entries = reservations.reserve({"b1": 600})
+    assert reservations.account("b1").available == 400
+    with pytest.raises(InsufficientFunds):
+        reservations.reserve({"b1": 500})
+    
+    reservations.complete(entries, None)
+    account = reservations.account("b1")
+    assert account.available == 1000 and account.in_flight == 0
+    assert account.loaded_at == float("-inf")
+
+def test_unsettled_fill_is_returned_when_it_fails():
+    reservations = _reservations({"b1": 100.0, "s1": 0.0}, units={("s1", "c"): 3.0})
+    engine = MatchingEngine()
+    engine.add_trade_listener(reservations.on_trades)
+    sell, _ = engine.submit("s1", "c", SELL, 3, 1000)
+    reservations.commit_order(sell)
+    
+    _, trades = engine.submit("b1", "c", BUY, 2, 1000)
+    buyer, position = reservations.account("b1"), reservations.position("s1", "c")
+    assert buyer.balance == 10000 - 2000
+    assert position.balance == 1 * UNIT_SCALE and position.committed == 1 * UNIT_SCALE
+    
+    reservations.failed(trades[0].trade_id)
+    assert buyer.balance == 10000 and buyer.in_flight == 0
+    assert position.balance == 3 * UNIT_SCALE
+
+def test_settled_fill_credits_the_seller():
+    reservations = _reservations({"b1": 100.0, "s1": 0.0}, units={("s1", "c"): 3.0})
+    engine = MatchingEngine()
+    engine.add_trade_listener(reservations.on_trades)
+    engine.submit("s1", "c", SELL, 3, 1000)
+    
+    _, trades = engine.submit("b1", "c", BUY, 2, 1000)
+    reservations.settled(trades[0].trade_id)
+    
+    assert reservations.account("s1").balance == 2000
+    assert reservations.account("b1").balance == 8000